@@ -0,0 +1,73 @@
+"""Compare the shared CF axis detection with calling cf_xarray for every variable
+
+Usage:
+
+    python benchmarks/cf_axes.py --variables 10 100 1000
+
+Synthetic datasets are built in memory, with every variable over the same time, level,
+latitude and longitude coordinates. Only the metadata matters, so the variables are
+backed by lazily broadcast zeros.
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+import xarray as xr
+
+from ncviewjs_backend.cf_axes import dataset_cf_axes
+
+
+def create_dataset(*, variables: int) -> xr.Dataset:
+    coords = {
+        'time': ('time', np.arange(12), {'standard_name': 'time', 'axis': 'T'}),
+        'lev': ('lev', np.arange(10), {'axis': 'Z', 'positive': 'down'}),
+        'lat': ('lat', np.arange(180), {'axis': 'Y', 'units': 'degrees_north'}),
+        'lon': ('lon', np.arange(360), {'axis': 'X', 'units': 'degrees_east'}),
+    }
+    zeros = np.broadcast_to(np.float32(0), (12, 10, 180, 360))
+    data_vars = {
+        f'var_{index}': (('time', 'lev', 'lat', 'lon'), zeros, {'units': 'K'})
+        for index in range(variables)
+    }
+    return xr.Dataset(data_vars, coords=coords)
+
+
+def with_cf_xarray(ds: xr.Dataset) -> dict:
+    import cf_xarray  # noqa
+
+    return {
+        name: {axis: names[0] for axis, names in ds[name].cf.axes.items()} for name in ds.variables
+    }
+
+
+def measure(func, ds: xr.Dataset, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(ds)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--variables', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'variables':>10} {'cf_xarray (s)':>14} {'shared (s)':>11} {'speedup':>8}")
+    for variables in args.variables:
+        ds = create_dataset(variables=variables)
+        assert with_cf_xarray(ds) == dataset_cf_axes(ds)
+        cf_xarray_time = measure(with_cf_xarray, ds, args.repeat)
+        shared_time = measure(dataset_cf_axes, ds, args.repeat)
+        print(
+            f'{variables:>10} {cf_xarray_time:>14.4f} {shared_time:>11.4f} '
+            f'{cf_xarray_time / shared_time:>7.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Compare the chunk reads predicted for viewer sessions with the reads measured on stores
+
+Usage:
+
+    python benchmarks/chunk_planning.py --sessions 50
+
+Synthetic stores hold a single variable over time, latitude and longitude, with the
+chunks of the previous fixed planner (256x256 tiles, time chunk sized for 4 byte values)
+and of the ``map`` and ``timeseries`` profiles. Only the metadata is written: reading a
+missing chunk still requests its key from the store, which is all that is counted. Each
+session reads the distinct chunks of random viewports or points (see
+``chunk_planning.Session``), the measured count is the mean over the sessions.
+
+With the default sessions, a 512x1024 viewport over 12 time steps or 10 points:
+
+           shape dtype        planner       chunks    MB    session predicted  measured
+    120x720x1440    f4      fixed+map    2x256x256  0.52        map      97.2      97.7
+    120x720x1440    f4      fixed+map    2x256x256  0.52 timeseries     470.2     468.0
+    120x720x1440    f4     timeseries    120x32x32  0.49        map     559.3     560.0
+    120x720x1440    f4     timeseries    120x32x32  0.49 timeseries      10.0      10.0
+    120x720x1440    f8          fixed    2x256x256  1.05        map      97.2      97.7
+    120x720x1440    f8          fixed    2x256x256  1.05 timeseries     470.2     468.0
+    120x720x1440    f8            map    1x256x256  0.52        map     179.5     179.3
+    120x720x1440    f8            map    1x256x256  0.52 timeseries     940.4     936.0
+    120x720x1440    f8     timeseries    120x16x16  0.25        map    2138.5    2137.8
+    120x720x1440    f8     timeseries    120x16x16  0.25 timeseries      10.0      10.0
+    1000x180x360    f4          fixed    2x180x256  0.37        map      13.0      13.0
+    1000x180x360    f4          fixed    2x180x256  0.37 timeseries     999.0     990.0
+    1000x180x360    f4            map    3x180x256  0.55        map       9.3       9.5
+    1000x180x360    f4            map    3x180x256  0.55 timeseries     667.3     661.3
+    1000x180x360    f4     timeseries     1000x8x8  0.26        map    1035.0    1035.0
+    1000x180x360    f4     timeseries     1000x8x8  0.26 timeseries      10.0      10.0
+    12x2160x4320    i2          fixed    2x256x256  0.26        map      89.8      89.6
+    12x2160x4320    i2          fixed    2x256x256  0.26 timeseries      58.3      58.7
+    12x2160x4320    i2            map    4x256x256  0.52        map      44.9      44.8
+    12x2160x4320    i2            map    4x256x256  0.52 timeseries      29.1      29.3
+    12x2160x4320    i2     timeseries   12x128x128  0.39        map      44.9      44.9
+    12x2160x4320    i2     timeseries   12x128x128  0.39 timeseries       9.9      10.0
+"""
+
+import argparse
+import math
+import statistics
+
+import numpy as np
+import zarr
+
+from ncviewjs_backend.chunk_planning import Session, plan_chunks, predict_requests
+
+AXES = {'T': 'time', 'Y': 'lat', 'X': 'lon'}
+DIMS = ('time', 'lat', 'lon')
+STORES = [
+    ((120, 720, 1440), 'f4'),
+    ((120, 720, 1440), 'f8'),
+    ((1000, 180, 360), 'f4'),
+    ((12, 2160, 4320), 'i2'),
+]
+
+
+class CountingStore(dict):
+    """In-memory store recording the chunk keys read"""
+
+    def __init__(self):
+        super().__init__()
+        self.read = set()
+
+    def __contains__(self, key):
+        # zarr looks the chunks up before reading them, missing chunks are never read
+        if not key.rsplit('/', 1)[-1].startswith('.'):
+            self.read.add(key)
+        return super().__contains__(key)
+
+
+def fixed_chunks(shape: tuple) -> tuple:
+    time_chunk = round(5e5 / 4 / 256**2)
+    return (min(time_chunk, shape[0]), min(256, shape[1]), min(256, shape[2]))
+
+
+def run_session(array: zarr.Array, session: Session, rng: np.random.Generator) -> None:
+    steps, height, width = array.shape
+    if session.profile == 'map':
+        window = [min(size, view) for size, view in zip((height, width), session.viewport)]
+        y, x = (rng.integers(0, size - view + 1) for size, view in zip((height, width), window))
+        time_steps = min(session.time_steps, steps)
+        start = rng.integers(0, steps - time_steps + 1)
+        for step in range(start, start + time_steps):
+            array[step, y : y + window[0], x : x + window[1]]
+    else:
+        for _ in range(session.points):
+            array[:, rng.integers(0, height), rng.integers(0, width)]
+
+
+def measure(shape: tuple, dtype: str, chunks: tuple, session: Session, sessions: int) -> float:
+    store = CountingStore()
+    array = zarr.create(shape=shape, chunks=chunks, dtype=dtype, store=store, fill_value=0)
+    rng = np.random.default_rng(0)
+    counts = []
+    for _ in range(sessions):
+        store.read.clear()
+        run_session(array, session, rng)
+        counts.append(len(store.read))
+    return statistics.mean(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=50)
+    args = parser.parse_args()
+
+    print(
+        f"{'shape':>14} {'dtype':>5} {'planner':>14} {'chunks':>12} {'MB':>5} {'session':>10} "
+        f"{'predicted':>9} {'measured':>9}"
+    )
+    for shape, dtype in STORES:
+        itemsize = np.dtype(dtype).itemsize
+        chunkings = {
+            'fixed': fixed_chunks(shape),
+            **{
+                profile: plan_chunks(
+                    shape=shape, dims=DIMS, itemsize=itemsize, axes=AXES, profile=profile
+                )
+                for profile in ('map', 'timeseries')
+            },
+        }
+        planners = {}
+        for name, chunks in chunkings.items():
+            planners[chunks] = '+'.join(filter(None, [planners.get(chunks), name]))
+        for chunks, planner in planners.items():
+            for profile in ('map', 'timeseries'):
+                session = Session(profile=profile)
+                predicted = predict_requests(
+                    shape=shape, dims=DIMS, chunks=chunks, axes=AXES, session=session
+                )
+                measured = measure(shape, dtype, chunks, session, args.sessions)
+                print(
+                    f"{'x'.join(map(str, shape)):>14} {dtype:>5} {planner:>14} "
+                    f"{'x'.join(map(str, chunks)):>12} {math.prod(chunks) * itemsize / 1e6:>5.2f} "
+                    f'{profile:>10} {predicted:>9.1f} {measured:>9.1f}'
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Measure the latency of viewer tiles served by the chunk proxy
+
+Usage:
+
+    python benchmarks/chunk_proxy.py --source-chunks 1,50,50 1,100,100 10,720,1440
+
+For each source chunking a synthetic store is written to a temporary directory and the
+same viewer tiles are requested through a cold cache (source chunks fetched, decoded and
+assembled) and a warm cache.
+"""
+
+import argparse
+import json
+import pathlib
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import zarr
+
+from ncviewjs_backend.chunk_proxy import ChunkCache, ChunkProxy, plan_array
+
+AXES = {'T': 'time', 'Y': 'lat', 'X': 'lon'}
+
+
+def create_store(path: pathlib.Path, *, shape: tuple, chunks: tuple) -> str:
+    group = zarr.open_group(str(path), mode='w')
+    dims = ('time', 'lat', 'lon')
+    for dim, size, axis in zip(dims, shape, 'TYX'):
+        array = group.create_dataset(dim, data=np.arange(size, dtype='f8'), chunks=(size,))
+        array.attrs.update({'_ARRAY_DIMENSIONS': [dim], 'axis': axis})
+    data = np.random.default_rng(0).random(shape, dtype='f4')
+    array = group.create_dataset('tas', data=data, chunks=chunks)
+    array.attrs['_ARRAY_DIMENSIONS'] = list(dims)
+    zarr.consolidate_metadata(str(path))
+    return str(path)
+
+
+def measure(proxy: ChunkProxy, url: str, array, chunk_keys: list[str]) -> float:
+    timings = []
+    for chunk_key in chunk_keys:
+        start = time.perf_counter()
+        proxy.get_chunk(key=chunk_key, url=url, array=array, chunk_key=chunk_key)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--source-chunks', nargs='+', default=['1,50,50', '1,100,100', '1,360,720', '10,720,1440']
+    )
+    parser.add_argument('--shape', type=int, nargs=3, default=[20, 720, 1440])
+    parser.add_argument('--tiles', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f'shape={tuple(args.shape)} tiles={args.tiles} concurrency={args.concurrency}')
+    print(f"{'source chunks':>14} {'fetched':>8} {'cold (ms)':>10} {'warm (ms)':>10}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for source_chunks in args.source_chunks:
+            chunks = tuple(int(size) for size in source_chunks.split(','))
+            url = create_store(
+                pathlib.Path(tmpdir) / f'{source_chunks}.zarr',
+                shape=tuple(args.shape),
+                chunks=chunks,
+            )
+            with open(f'{url}/.zmetadata') as f:
+                array = plan_array(json.load(f), 'tas', axes=AXES)
+            grid = [int(np.ceil(s / c)) for s, c in zip(array.zarray['shape'], array.chunks)]
+            chunk_keys = [
+                '.'.join(str(index) for index in np.unravel_index(flat, grid))
+                for flat in range(min(args.tiles, int(np.prod(grid))))
+            ]
+
+            proxy = ChunkProxy(concurrency=args.concurrency, cache=ChunkCache())
+            cold = measure(proxy, url, array, chunk_keys)
+            fetched = proxy.source_chunks_fetched / len(chunk_keys)
+            warm = measure(proxy, url, array, chunk_keys)
+            proxy.close()
+            print(f'{source_chunks:>14} {fetched:>8.1f} {cold * 1e3:>10.2f} {warm * 1e3:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
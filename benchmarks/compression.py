@@ -0,0 +1,65 @@
+"""Compare the codecs rechunked stores can be re-encoded with, on synthetic variables
+
+Usage:
+
+    python benchmarks/compression.py --bandwidth 10e6 50e6
+
+Each variable is benchmarked on sample chunks of the shape planned for map browsing, as in
+the rechunk flow, and the codec the flow would pick with ``auto`` is starred. The time per
+chunk adds the download at the given bandwidth to the decoding: the faster decoding of lz4
+only pays off once downloads take less time than decoding, on fast connections.
+"""
+
+import argparse
+
+import numpy as np
+import zarr
+
+from ncviewjs_backend.chunk_planning import plan_chunks
+from ncviewjs_backend.compression import benchmark_codecs, select_codec
+
+AXES = {'T': 'time', 'Y': 'lat', 'X': 'lon'}
+DIMS = ('time', 'lat', 'lon')
+
+
+def create_variables() -> dict[str, zarr.Array]:
+    rng = np.random.default_rng(0)
+    shape = (8, 720, 1440)
+    lat = np.linspace(-90, 90, shape[1])[None, :, None]
+    smooth = 280 + 30 * np.cos(np.deg2rad(lat)) + rng.normal(0, 0.5, shape)
+    return {
+        'smooth f4': zarr.array(smooth.astype('f4').round(2)),
+        'noisy f4': zarr.array(rng.normal(0, 1, shape).astype('f4')),
+        'categorical i2': zarr.array(rng.integers(0, 12, shape, dtype='i2')),
+        'sparse f8': zarr.array(np.where(rng.random(shape) < 0.9, np.nan, smooth)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bandwidth', type=float, nargs='+', default=[10e6, 50e6])
+    parser.add_argument('--samples', type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'variable':>15} {'bandwidth':>10} {'codec':>11} {'ratio':>6} "
+        f"{'encode MB/s':>11} {'decode MB/s':>11} {'ms/chunk':>9}"
+    )
+    for name, array in create_variables().items():
+        chunks = plan_chunks(shape=array.shape, dims=DIMS, itemsize=array.dtype.itemsize, axes=AXES)
+        for bandwidth in args.bandwidth:
+            results = benchmark_codecs(
+                array, chunks=chunks, samples=args.samples, bandwidth=bandwidth
+            )
+            best = select_codec(results)
+            for result in results:
+                marker = '*' if result is best else ' '
+                print(
+                    f'{name:>15} {bandwidth / 1e6:>7.0f}MB/s {result.codec:>11}{marker}'
+                    f'{result.ratio:>6.2f} {result.encode_mb_per_s:>11.1f} '
+                    f'{result.decode_mb_per_s:>11.1f} {result.chunk_seconds * 1e3:>9.2f}'
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Compare the metadata-only Zarr inspector with opening the store with xarray
+
+Usage:
+
+    python benchmarks/inspect_metadata.py --variables 10 100 1000
+
+Synthetic stores are written to a temporary directory. Only metadata is written, so
+the stores can describe millions of chunks without taking any disk space.
+"""
+
+import argparse
+import pathlib
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import zarr
+
+from ncviewjs_backend.dataset_processing import (
+    ZarrStoreInfo,
+    inspect_zarr_store,
+    open_zarr_store,
+)
+
+
+def create_store(path: pathlib.Path, *, variables: int, shape: tuple, chunks: tuple) -> str:
+    group = zarr.open_group(str(path), mode='w')
+    dims = ('time', 'lat', 'lon')
+    attrs = {'time': {'axis': 'T'}, 'lat': {'axis': 'Y'}, 'lon': {'axis': 'X'}}
+    for dim, size in zip(dims, shape):
+        array = group.create_dataset(dim, shape=(size,), chunks=(size,), dtype='f8')
+        array.attrs.update({'_ARRAY_DIMENSIONS': [dim], **attrs[dim]})
+    for index in range(variables):
+        array = group.create_dataset(f'var_{index}', shape=shape, chunks=chunks, dtype='f4')
+        array.attrs['_ARRAY_DIMENSIONS'] = list(dims)
+    zarr.consolidate_metadata(str(path))
+    return str(path)
+
+
+def with_xarray(url: str) -> dict:
+    with open_zarr_store(url) as ds:
+        info = ZarrStoreInfo.from_xarray(ds)
+    return {'size': info.size, 'cf_axes': info.cf_axes}
+
+
+def with_inspector(url: str) -> dict:
+    info = inspect_zarr_store(url)
+    return {'size': info.size, 'cf_axes': info.cf_axes}
+
+
+def measure(func, url: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(url)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--variables', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--shape', type=int, nargs=3, default=[3650, 720, 1440])
+    parser.add_argument('--chunks', type=int, nargs=3, default=[1, 90, 90])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    nchunks = int(np.prod(np.ceil(np.array(args.shape) / np.array(args.chunks))))
+    print(f'shape={tuple(args.shape)} chunks={tuple(args.chunks)} ({nchunks} chunks per variable)')
+    print(f"{'variables':>10} {'xarray (s)':>12} {'inspector (s)':>14} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for variables in args.variables:
+            url = create_store(
+                pathlib.Path(tmpdir) / f'{variables}.zarr',
+                variables=variables,
+                shape=tuple(args.shape),
+                chunks=tuple(args.chunks),
+            )
+            assert with_xarray(url) == with_inspector(url)
+            xarray_time = measure(with_xarray, url, args.repeat)
+            inspector_time = measure(with_inspector, url, args.repeat)
+            print(
+                f'{variables:>10} {xarray_time:>12.4f} {inspector_time:>14.4f} '
+                f'{xarray_time / inspector_time:>7.1f}x'
+            )
+
+
+if __name__ == '__main__':
+    main()
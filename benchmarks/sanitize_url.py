@@ -0,0 +1,51 @@
+"""Measure how many URLs per second sanitize_url handles for each supported URL form
+
+Usage:
+
+    python benchmarks/sanitize_url.py --number 20000
+
+Constructing a UPath, which sanitize_url used to do for every URL, is timed alongside
+as a baseline.
+"""
+
+import argparse
+import time
+
+import upath
+
+from ncviewjs_backend.helpers import sanitize_url
+
+URLS = {
+    's3': 's3://carbonplan-data-viewer/demo/gpcp_100MB.zarr',
+    'gs': 'gs://carbonplan-maps/ncview/demo/single_timestep/air_temperature.zarr',
+    'abfs': 'abfs://container@account.dfs.core.windows.net/demo/store.zarr',
+    's3 virtual-hosted': 'https://carbonplan-data-viewer.s3.us-west-2.amazonaws.com/demo/a.zarr',
+    's3 path-style': 'https://s3.us-west-2.amazonaws.com/carbonplan-data-viewer/demo/a.zarr',
+    's3 access point': 'https://ap-123456789012.s3-accesspoint.us-west-2.amazonaws.com/a.zarr',
+    'gs https': 'https://storage.googleapis.com/carbonplan-share/maps-demo/2d/prec-regrid',
+    'az https': 'https://carbonplan.blob.core.windows.net/demo/store.zarr',
+    'https': 'https://data.example.org/stores/store.zarr/',
+}
+
+
+def urls_per_second(func, url: str, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        func(url)
+    return number / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=20_000)
+    args = parser.parse_args()
+
+    print(f"{'form':>18} {'sanitize_url (URL/s)':>21} {'UPath only (URL/s)':>19}")
+    for form, url in URLS.items():
+        sanitized = urls_per_second(sanitize_url, url, args.number)
+        baseline = urls_per_second(lambda url: upath.UPath(url)._url, url, args.number)
+        print(f'{form:>18} {sanitized:>21,.0f} {baseline:>19,.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import datetime
 import subprocess
+import typing
 from platform import node, platform, python_version
 
 import prefect
@@ -8,22 +9,13 @@ import requests
 import xarray as xr
 from prefect.orion.api.server import ORION_API_VERSION as API
 
+from ncviewjs_backend.cf_axes import dataset_cf_axes
+from ncviewjs_backend.chunk_planning import TARGET_CHUNK_BYTES, AccessProfile, plan_chunks
+from ncviewjs_backend.compression import choose_codec
+from ncviewjs_backend.pyramids import PYRAMID_GROUP, PYRAMID_USE_CASE, build_pyramid
+from ncviewjs_backend.rechunking import StreamingRechunker, time_range
 
-def determine_chunk_size(spatial_chunk_square_size: int = 256, target_size_bytes: int = 5e5) -> int:
-    return round(target_size_bytes / 4 / spatial_chunk_square_size**2)
-
-
-def retrieve_CF_axes(ds: xr.Dataset) -> dict[str, dict[str, str]]:
-    """Retrieve the CF dimensions from the dataset"""
-    import cf_xarray  # noqa
-
-    results = {}
-    for variable in ds.variables:
-        axes = ds[variable].cf.axes
-        for key, value in axes.items():
-            axes[key] = value[0]
-        results[variable] = axes
-    return results
+USE_CASE = 'ncview'
 
 
 @prefect.task
@@ -64,73 +56,306 @@ def agent_info():
     logger.info('Python = %s. API: %s. Prefect = %s 🚀', python_version(), API, version)
 
 
+class ProgressReporter:
+    """PATCH the percentage of the rechunking done to the rechunk run, every ``step`` percent"""
+
+    def __init__(self, url: str, *, step: float = 5):
+        self.url = url
+        self.step = step
+        self.reported = 0.0
+
+    def __call__(self, fraction: float) -> None:
+        progress = round(fraction * 100, 1)
+        if progress - self.reported < self.step and progress < 100:
+            return
+        self.reported = progress
+        try:
+            requests.patch(self.url, json={'progress': progress}, timeout=10)
+        except Exception as exc:
+            prefect.get_run_logger().info(f'Failed to report progress to {self.url}: {exc}')
+
+
 @prefect.task
 def process_dataset(
     *,
     store_url: pydantic.AnyUrl,
     store_paths: dict,
-    spatial_chunk_square_size: int = 256,
-    target_size_bytes: int = 5e5,
-    max_mem: str = "1000MB",
+    access: AccessProfile = 'map',
+    target_size_bytes: float = TARGET_CHUNK_BYTES,
+    max_mem: str | None = None,
+    mode: typing.Literal['streaming', 'rechunker'] = 'streaming',
+    executor: typing.Literal['threads', 'processes'] = 'threads',
+    workers: int | None = None,
+    progress_url: str | None = None,
+    pyramid_levels: int = 0,
+    pyramid_method: typing.Literal['mean', 'nearest'] = 'mean',
+    codec: typing.Literal['source', 'auto', 'blosc-zstd', 'blosc-lz4', 'zlib'] = 'source',
 ):
-    """Rechunks zarr dataset to match chunk schema required by carbonplan web-viewer."""
+    """Rechunks zarr dataset to match chunk schema required by carbonplan web-viewer.
+
+    Chunks of ``target_size_bytes`` are planned for the ``access`` profile of the viewer,
+    see ncviewjs_backend.chunk_planning.
+
+    The ``streaming`` mode copies the variables one after the other with a pool of
+    ``workers`` and only goes through the temp store for the variables that need it, see
+    ncviewjs_backend.rechunking. ``max_mem`` is then the memory of a single block and is
+    sized from the available memory by default. Its progress is reported to
+    ``progress_url``.
+
+    With ``pyramid_levels``, coarsened levels of the rechunked store are written to its
+    ``pyramid`` group, see ncviewjs_backend.pyramids.
+
+    Unless ``codec`` is ``source``, the data variables are re-encoded with that codec, or
+    with the fastest one for the viewer with ``auto``, after benchmarking the codecs on a
+    few of their chunks (see ncviewjs_backend.compression). The benchmark is returned.
+    """
     import fsspec
-    import rechunker
     import zarr
-    from prefect_aws.credentials import AwsCredentials
 
     logger = prefect.get_run_logger()
     logger.info('ncview rechunking is running 🚀')
     logger.info('store_url = %s', store_url)
 
-    time_chunk = determine_chunk_size(
-        spatial_chunk_square_size=spatial_chunk_square_size, target_size_bytes=target_size_bytes
-    )
-
     start_time = datetime.datetime.now(datetime.timezone.utc)
 
     ds = xr.open_dataset(store_url, engine='zarr', chunks={}, decode_cf=False)
     group = zarr.open_consolidated(store_url)
-    cf_axes_dict = retrieve_CF_axes(ds)
+    cf_axes_dict = dataset_cf_axes(ds)
     logger.info(f'Opened dataset: {ds}')
 
     chunks_dict = {}
     for variable, axes in cf_axes_dict.items():
-        variable_dims = ds[variable].dims
-        sizes = ds[variable].sizes
+        dims = ds[variable].dims
+        chunks = plan_chunks(
+            shape=ds[variable].shape,
+            dims=dims,
+            itemsize=ds[variable].dtype.itemsize,
+            axes=axes,
+            profile=access,
+            target_bytes=target_size_bytes,
+        )
+        chunks_dict[variable] = dict(zip(dims, chunks))
 
-        result = {}
-        for key, value in axes.items():
-            if key == 'T':
-                result[value] = min(time_chunk, sizes[value])
-            elif key in ['X', 'Y']:
-                result[value] = min(spatial_chunk_square_size, sizes[value])
-        for dim in variable_dims:
-            if dim not in result.keys():
-                result[dim] = sizes[dim]
+    logger.info(f'Chunks: {chunks_dict}')
 
-        chunks_dict[variable] = result
+    compressors, codec_benchmark = {}, {}
+    if codec != 'source':
+        for variable in ds.data_vars:
+            if variable not in chunks_dict:
+                continue
+            chunks = tuple(chunks_dict[variable][dim] for dim in ds[variable].dims)
+            compressors[variable], codec_benchmark[variable] = choose_codec(
+                group[variable], chunks=chunks, codec=codec
+            )
+        logger.info(f'Codecs: {compressors}')
+
+    tmp_mapper = fsspec.get_mapper(store_paths['temp_store'], **storage_options())
+    tgt_mapper = fsspec.get_mapper(store_paths['staging_store'], **storage_options())
+
+    streaming = StreamingRechunker(
+        executor=executor,
+        workers=workers,
+        max_mem=max_mem,
+        progress=ProgressReporter(progress_url) if progress_url else None,
+    )
+    if mode == 'streaming':
+        plans = streaming.rechunk(
+            group, chunks_dict, tgt_mapper, temp_store=tmp_mapper, compressors=compressors
+        )
+        logger.info(
+            'Copied %d variable(s), %d through the temp store',
+            len(plans),
+            sum(not plan.direct for plan in plans),
+        )
+    else:
+        import rechunker
+
+        array_plan = rechunker.rechunk(
+            group,
+            chunks_dict,
+            max_mem or "1000MB",
+            tgt_mapper,
+            temp_store=tmp_mapper,
+            target_options={name: {'compressor': value} for name, value in compressors.items()},
+        )
+        array_plan.execute()
+
+    levels = []
+    if pyramid_levels:
+        levels = build_pyramid(
+            zarr.open_group(tgt_mapper, mode='r+'),
+            cf_axes=cf_axes_dict,
+            levels=pyramid_levels,
+            method=pyramid_method,
+            rechunker=streaming,
+        )
+        logger.info(f'Wrote {len(levels)} pyramid level(s)')
 
-    logger.info(f'Chunks: {chunks_dict}')
+    # Consolidate metadata, of every level too so that they can be opened on their own
+    zarr.consolidate_metadata(tgt_mapper)
+    for level in levels:
+        zarr.consolidate_metadata(tgt_mapper, path=level.path)
+    end_time = datetime.datetime.now(datetime.timezone.utc)
+    return (
+        start_time,
+        end_time,
+        time_record(group, cf_axes_dict),
+        [lvl.level for lvl in levels],
+        codec_benchmark,
+    )
 
-    creds = AwsCredentials.load('prod')
 
-    storage_options = {
+def storage_options() -> dict:
+    from prefect_aws.credentials import AwsCredentials
+
+    creds = AwsCredentials.load('prod')
+    return {
         'anon': False,
         'key': creds.aws_access_key_id,
         'secret': creds.aws_secret_access_key.get_secret_value(),
     }
 
-    tmp_mapper = fsspec.get_mapper(store_paths['temp_store'], **storage_options)
-    tgt_mapper = fsspec.get_mapper(store_paths['staging_store'], **storage_options)
 
-    array_plan = rechunker.rechunk(group, chunks_dict, max_mem, tgt_mapper, temp_store=tmp_mapper)
-    array_plan.execute()
+def time_dimension(cf_axes_dict: dict[str, dict[str, str]]) -> str | None:
+    return next((axes['T'] for axes in cf_axes_dict.values() if 'T' in axes), None)
+
+
+def time_record(group, cf_axes_dict: dict[str, dict[str, str]]) -> dict:
+    """Time range of the source rechunked, recorded to append the next time steps later on"""
+    time_dim = time_dimension(cf_axes_dict)
+    if time_dim is None or time_dim not in group:
+        return {}
+    time_steps, last_time = time_range(group, time_dim)
+    return {'time_dim': time_dim, 'time_steps': time_steps, 'last_time': last_time}
+
+
+def rechunking_records(path: str, recorded: dict, levels: list[int]) -> list[dict]:
+    """Records of the rechunked store and of its pyramid levels"""
+    record = {'path': path, 'use_case': USE_CASE, **recorded}
+    if not levels:
+        return [record]
+    return [
+        {**record, 'level': 0},
+        *(
+            {
+                'path': f'{path}/{PYRAMID_GROUP}/{level}',
+                'use_case': PYRAMID_USE_CASE,
+                'level': level,
+            }
+            for level in levels
+        ),
+    ]
+
+
+def recorded_levels(dataset: dict, path: str) -> int:
+    """Number of pyramid levels recorded for the rechunked store at ``path``"""
+    return sum(
+        record.get('use_case') == PYRAMID_USE_CASE and record['path'].startswith(f'{path}/')
+        for record in dataset.get('rechunking') or []
+    )
+
+
+def incremental_record(dataset: dict) -> dict | None:
+    """The latest rechunking of the dataset whose time range is known"""
+    records = [
+        record
+        for record in dataset.get('rechunking') or []
+        if record.get('use_case') == USE_CASE and record.get('time_steps') is not None
+    ]
+    return records[-1] if records else None
+
+
+@prefect.task
+def fetch_dataset(*, url: pydantic.AnyHttpUrl) -> dict:
+    """The dataset of the rechunk run, along with its rechunking records"""
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    return response.json()['dataset']
+
+
+@prefect.task
+def append_dataset(
+    *,
+    store_url: pydantic.AnyUrl,
+    record: dict,
+    cf_axes: dict | None = None,
+    levels: int = 0,
+    max_mem: str | None = None,
+    executor: typing.Literal['threads', 'processes'] = 'threads',
+    workers: int | None = None,
+    progress_url: str | None = None,
+):
+    """Append the new time steps of the source to the store it was last rechunked to.
+
+    Only the chunks holding new time steps are written, straight to the production store:
+    viewers keep reading the previous shape from the consolidated metadata until it is
+    consolidated again at the end. Returns None when the source changed in other ways
+    than new time steps and has to be rechunked in full. The ``levels`` pyramid levels of
+    the store get the new time steps too.
+    """
+    import fsspec
+    import zarr
+
+    logger = prefect.get_run_logger()
+    start_time = datetime.datetime.now(datetime.timezone.utc)
+    group = zarr.open_consolidated(store_url)
+    time_dim, time_steps = record['time_dim'], record['time_steps']
+    if time_dim not in group:
+        logger.info(f'{store_url} has no {time_dim} coordinate anymore')
+        return None
+    steps, _ = time_range(group, time_dim)
+    if steps < time_steps or group[time_dim][time_steps - 1].item() != record['last_time']:
+        logger.info(f'The time steps of {store_url} already rechunked changed')
+        return None
+
+    target = fsspec.get_mapper(record['path'], **storage_options())
+    if steps > time_steps:
+        streaming = StreamingRechunker(
+            executor=executor,
+            workers=workers,
+            max_mem=max_mem,
+            progress=ProgressReporter(progress_url) if progress_url else None,
+        )
+        try:
+            plans = streaming.append(group, target, time_dim=time_dim, start=time_steps)
+            if levels:
+                rechunked = zarr.open_group(target, mode='r+')
+                multiscales = rechunked[PYRAMID_GROUP].attrs['multiscales'][0]
+                build_pyramid(
+                    rechunked,
+                    cf_axes=cf_axes or {},
+                    levels=levels,
+                    method=multiscales['metadata']['method'],
+                    rechunker=streaming,
+                    time_dim=time_dim,
+                    start=time_steps,
+                )
+        except (KeyError, ValueError) as exc:
+            logger.info(f'Unable to append to {record["path"]}: {exc}')
+            return None
+        zarr.consolidate_metadata(target)
+        for level in range(1, levels + 1):
+            zarr.consolidate_metadata(target, path=f'{PYRAMID_GROUP}/{level}')
+        logger.info(f'Appended {steps - time_steps} time step(s) of {len(plans)} variable(s)')
+    else:
+        logger.info(f'No new time steps in {store_url}')
 
-    # Consolidate metadata
-    zarr.consolidate_metadata(store_paths['staging_store'])
     end_time = datetime.datetime.now(datetime.timezone.utc)
-    return start_time, end_time
+    steps, last_time = time_range(group, time_dim)
+    return start_time, end_time, {**record, 'time_steps': steps, 'last_time': last_time}
+
+
+@prefect.task(retries=3, retry_delay_seconds=3)
+def record_rechunking(*, url: pydantic.AnyHttpUrl, dataset: dict, records: list[dict]):
+    """Replace the rechunking records of the dataset with the latest ones of their use cases"""
+    use_cases = {record['use_case'] for record in records}
+    kept = [
+        existing
+        for existing in dataset.get('rechunking') or []
+        if existing.get('use_case') not in use_cases
+    ]
+    response = requests.patch(url, json={'rechunking': [*kept, *records]}, timeout=30)
+    response.raise_for_status()
 
 
 @prefect.task
@@ -158,6 +383,7 @@ def finalize(
     end_time: datetime.datetime,
     rechunked_dataset: pydantic.AnyUrl,
     url: pydantic.AnyHttpUrl,
+    codec_benchmark: dict | None = None,
 ):
     logger = prefect.get_run_logger()
 
@@ -171,6 +397,8 @@ def finalize(
         'status': "completed",
         'outcome': "success",
     }
+    if codec_benchmark:
+        data['codec_benchmark'] = codec_benchmark
 
     try:
         requests.patch(
@@ -196,8 +424,55 @@ def rechunk(
     staging_bucket: pydantic.AnyUrl = 's3://carbonplan-data-viewer-staging',
     production_bucket: pydantic.AnyUrl = 's3://carbonplan-data-viewer-production',
     endpoint: pydantic.AnyHttpUrl = 'https://ncview-backend.fly.dev/runs',
+    mode: str = 'streaming',
+    incremental: bool = False,
+    pyramid_levels: int = 0,
+    pyramid_method: str = 'mean',
+    access: str = 'map',
+    codec: str = 'source',
 ):
+    """Rechunk the store for the viewer.
+
+    With ``incremental``, a store already rechunked with a known time range only gets its
+    new time steps appended to the previous output, instead of being rewritten in full to
+    a new prefix.
+
+    ``access`` is the access profile the chunks are planned for, ``map`` for browsing maps
+    or ``timeseries`` for extracting the time series of points.
+
+    With ``pyramid_levels``, the store is also coarsened ``pyramid_levels`` times along its
+    X and Y axes, halving the resolution at every level with ``pyramid_method``. Every level
+    gets its own rechunking record so that clients can pick the one matching the screen.
+
+    ``codec`` re-encodes the rechunked variables, ``auto`` picking the codec fetched and
+    decoded the fastest by the viewer. The codec benchmark is stored on the rechunk run.
+    """
     _ = agent_info()
+    url = f"{endpoint}/{rechunk_run_id}/"
+    dataset = fetch_dataset(url=url)
+    dataset_url = f"{endpoint.rsplit('/runs', 1)[0]}/datasets/{dataset['id']}"
+
+    record = incremental_record(dataset) if incremental else None
+    if record is not None:
+        appended = append_dataset(
+            store_url=store_url,
+            record=record,
+            cf_axes=dataset.get('cf_axes'),
+            levels=recorded_levels(dataset, record['path']),
+            progress_url=url,
+        )
+        if appended is not None:
+            start_time, end_time, record = appended
+            dataset_is_valid(zarr_store_url=record['path'])
+            record_rechunking(url=dataset_url, dataset=dataset, records=[record])
+            finalize(
+                start_time=start_time,
+                end_time=end_time,
+                rechunked_dataset=record['path'],
+                url=url,
+            )
+            return
+
     initialize_skyplane.submit(wait_for=[_])
     store_paths = generate_stores(
         key=key,
@@ -207,7 +482,16 @@ def rechunk(
         production_bucket=production_bucket,
     )
 
-    start_time, end_time = process_dataset(store_url=store_url, store_paths=store_paths)
+    start_time, end_time, recorded, levels, codec_benchmark = process_dataset(
+        store_url=store_url,
+        store_paths=store_paths,
+        mode=mode,
+        access=access,
+        progress_url=url,
+        pyramid_levels=pyramid_levels,
+        pyramid_method=pyramid_method,
+        codec=codec,
+    )
 
     # Check that rechunked dataset is valid
     dataset_is_valid(zarr_store_url=store_paths['staging_store'])
@@ -218,14 +502,20 @@ def rechunk(
 
     # Check that production dataset is valid
     _ = dataset_is_valid.submit(zarr_store_url=store_paths['prod_store'], wait_for=[_])
+    _ = record_rechunking.submit(
+        url=dataset_url,
+        dataset=dataset,
+        records=rechunking_records(store_paths['prod_store'], recorded, levels),
+        wait_for=[_],
+    )
 
     # finalize
-    url = f"{endpoint}/{rechunk_run_id}/"
     _ = finalize.submit(
         start_time=start_time,
         end_time=end_time,
         rechunked_dataset=store_paths['prod_store'],
         url=url,
+        codec_benchmark=codec_benchmark,
         wait_for=[_],
     )
 
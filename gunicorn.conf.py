@@ -0,0 +1,25 @@
+"""Gunicorn settings of the API, see the Procfile and fly.toml"""
+
+import os
+import shutil
+
+# the worker processes write their metrics to this directory, where /metrics sums them, see
+# ncviewjs_backend.metrics. It has to be set before prometheus_client is imported
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/ncviewjs-prometheus')
+
+from prometheus_client import multiprocess  # noqa: E402
+
+workers = 2
+timeout = 300
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+
+def on_starting(server):
+    # the files left by the processes of a previous run would be summed with the new ones
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
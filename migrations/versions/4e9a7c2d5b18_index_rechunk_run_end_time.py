@@ -0,0 +1,25 @@
+"""index rechunk run end_time
+
+Revision ID: 4e9a7c2d5b18
+Revises: 8b2e6d4f1c70
+Create Date: 2026-10-18 19:41:27.508116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '4e9a7c2d5b18'
+down_revision = '8b2e6d4f1c70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_rechunkrun_end_time'), 'rechunkrun', ['end_time'])
+
+
+def downgrade():
+    op.drop_index(op.f('ix_rechunkrun_end_time'), table_name='rechunkrun')
@@ -0,0 +1,40 @@
+"""add list endpoint indexes
+
+Revision ID: 5c1d9a7e3b42
+Revises: b84e0d2c6f31
+Create Date: 2026-10-18 14:05:41.502817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1d9a7e3b42'
+down_revision = 'b84e0d2c6f31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # rows registered before the created column existed would be skipped by the
+    # (created, id) keyset pagination, give them their last access time instead
+    op.execute("UPDATE dataset SET created = COALESCE(last_accessed, now()) WHERE created IS NULL")
+    op.create_index('ix_dataset_created_id', 'dataset', ['created', 'id'])
+    op.create_index(op.f('ix_dataset_md5_id'), 'dataset', ['md5_id'])
+    op.create_index(op.f('ix_dataset_protocol'), 'dataset', ['protocol'])
+    op.create_index(op.f('ix_dataset_bucket'), 'dataset', ['bucket'])
+    op.create_index(op.f('ix_dataset_last_accessed'), 'dataset', ['last_accessed'])
+    op.create_index(op.f('ix_rechunkrun_dataset_id'), 'rechunkrun', ['dataset_id'])
+    op.create_index(op.f('ix_rechunkrun_outcome'), 'rechunkrun', ['outcome'])
+
+
+def downgrade():
+    op.drop_index(op.f('ix_rechunkrun_outcome'), table_name='rechunkrun')
+    op.drop_index(op.f('ix_rechunkrun_dataset_id'), table_name='rechunkrun')
+    op.drop_index(op.f('ix_dataset_last_accessed'), table_name='dataset')
+    op.drop_index(op.f('ix_dataset_bucket'), table_name='dataset')
+    op.drop_index(op.f('ix_dataset_protocol'), table_name='dataset')
+    op.drop_index(op.f('ix_dataset_md5_id'), table_name='dataset')
+    op.drop_index('ix_dataset_created_id', table_name='dataset')
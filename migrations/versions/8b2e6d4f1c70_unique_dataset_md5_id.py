@@ -0,0 +1,48 @@
+"""unique dataset md5_id
+
+Revision ID: 8b2e6d4f1c70
+Revises: f31c7d5e9a24
+Create Date: 2026-10-18 19:02:41.318305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e6d4f1c70'
+down_revision = 'f31c7d5e9a24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # concurrent registrations may have stored the same store several times: keep the
+    # oldest dataset and move the rechunk runs of the duplicates to it
+    op.execute(
+        """
+        WITH keep AS (
+            SELECT md5_id, min(id) AS id FROM dataset GROUP BY md5_id HAVING count(*) > 1
+        )
+        UPDATE rechunkrun SET dataset_id = keep.id
+        FROM dataset, keep
+        WHERE rechunkrun.dataset_id = dataset.id
+          AND dataset.md5_id = keep.md5_id
+          AND dataset.id <> keep.id
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM dataset
+        USING dataset AS kept
+        WHERE dataset.md5_id = kept.md5_id AND dataset.id > kept.id
+        """
+    )
+    op.drop_index(op.f('ix_dataset_md5_id'), table_name='dataset')
+    op.create_index(op.f('ix_dataset_md5_id'), 'dataset', ['md5_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_dataset_md5_id'), table_name='dataset')
+    op.create_index(op.f('ix_dataset_md5_id'), 'dataset', ['md5_id'])
@@ -0,0 +1,39 @@
+"""make dataset created not null
+
+Revision ID: 8e4c2a6f1b95
+Revises: 1d7e5b3a9c62
+Create Date: 2026-10-19 09:12:37.640215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4c2a6f1b95'
+down_revision = '1d7e5b3a9c62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a NULL created never compares greater than a cursor, the (created, id) keyset
+    # pagination would skip such rows on every page after the first
+    op.execute(
+        "UPDATE dataset SET created = COALESCE(last_accessed, timezone('utc', now())) "
+        "WHERE created IS NULL"
+    )
+    op.alter_column(
+        'dataset',
+        'created',
+        existing_type=sa.DateTime(),
+        nullable=False,
+        server_default=sa.text("timezone('utc', now())"),
+    )
+
+
+def downgrade():
+    op.alter_column(
+        'dataset', 'created', existing_type=sa.DateTime(), nullable=True, server_default=None
+    )
@@ -0,0 +1,33 @@
+"""add job queue columns
+
+Revision ID: 9d1c4b7e2a10
+Revises: 0ae062f9a511
+Create Date: 2026-10-18 10:30:12.118350
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '9d1c4b7e2a10'
+down_revision = '0ae062f9a511'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('rechunkrun', sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('rechunkrun', sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+    op.add_column('rechunkrun', sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+    op.add_column('rechunkrun', sa.Column('worker_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+    op.create_index('ix_rechunkrun_status_next_attempt_at', 'rechunkrun', ['status', 'next_attempt_at'])
+
+
+def downgrade():
+    op.drop_index('ix_rechunkrun_status_next_attempt_at', table_name='rechunkrun')
+    op.drop_column('rechunkrun', 'worker_id')
+    op.drop_column('rechunkrun', 'lease_expires_at')
+    op.drop_column('rechunkrun', 'next_attempt_at')
+    op.drop_column('rechunkrun', 'attempts')
@@ -0,0 +1,33 @@
+"""add updated_at columns
+
+Revision ID: a7b3e5d91f08
+Revises: e6a4f0c8d913
+Create Date: 2026-10-18 16:02:55.318471
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7b3e5d91f08'
+down_revision = 'e6a4f0c8d913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('dataset', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('rechunkrun', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute(
+        "UPDATE dataset SET updated_at = COALESCE(last_accessed, created, timezone('utc', now()))"
+    )
+    op.execute(
+        "UPDATE rechunkrun SET updated_at = COALESCE(end_time, start_time, timezone('utc', now()))"
+    )
+
+
+def downgrade():
+    op.drop_column('rechunkrun', 'updated_at')
+    op.drop_column('dataset', 'updated_at')
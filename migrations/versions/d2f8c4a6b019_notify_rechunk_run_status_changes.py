@@ -0,0 +1,59 @@
+"""notify rechunk run status changes
+
+Revision ID: d2f8c4a6b019
+Revises: a7b3e5d91f08
+Create Date: 2026-10-18 17:21:37.902544
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f8c4a6b019'
+down_revision = 'a7b3e5d91f08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the payload is delivered to the listeners of ncviewjs_backend.run_events on commit
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_rechunk_run_status() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify(
+                'rechunk_run_status',
+                json_build_object(
+                    'id', NEW.id,
+                    'dataset_id', NEW.dataset_id,
+                    'status', NEW.status,
+                    'outcome', NEW.outcome
+                )::text
+            );
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER rechunkrun_status_inserted AFTER INSERT ON rechunkrun
+        FOR EACH ROW EXECUTE FUNCTION notify_rechunk_run_status()
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER rechunkrun_status_updated AFTER UPDATE OF status, outcome ON rechunkrun
+        FOR EACH ROW
+        WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.outcome IS DISTINCT FROM NEW.outcome)
+        EXECUTE FUNCTION notify_rechunk_run_status()
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS rechunkrun_status_updated ON rechunkrun")
+    op.execute("DROP TRIGGER IF EXISTS rechunkrun_status_inserted ON rechunkrun")
+    op.execute("DROP FUNCTION IF EXISTS notify_rechunk_run_status()")
@@ -0,0 +1,28 @@
+"""index rechunk runs by dataset and id
+
+Revision ID: e6a4f0c8d913
+Revises: 5c1d9a7e3b42
+Create Date: 2026-10-18 15:12:09.734120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a4f0c8d913'
+down_revision = '5c1d9a7e3b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (dataset_id, id) also serves the lookups by dataset_id alone
+    op.create_index('ix_rechunkrun_dataset_id_id', 'rechunkrun', ['dataset_id', 'id'])
+    op.drop_index('ix_rechunkrun_dataset_id', table_name='rechunkrun')
+
+
+def downgrade():
+    op.create_index('ix_rechunkrun_dataset_id', 'rechunkrun', ['dataset_id'])
+    op.drop_index('ix_rechunkrun_dataset_id_id', table_name='rechunkrun')
@@ -0,0 +1,25 @@
+"""add store metadata digest
+
+Revision ID: f31c7d5e9a24
+Revises: d2f8c4a6b019
+Create Date: 2026-10-18 18:10:04.662193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'f31c7d5e9a24'
+down_revision = 'd2f8c4a6b019'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('storemetadata', sa.Column('digest', sqlmodel.sql.sqltypes.AutoString(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('storemetadata', 'digest')
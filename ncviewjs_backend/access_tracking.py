@@ -0,0 +1,166 @@
+"""Buffered tracking of dataset accesses.
+
+Reading a dataset records the access in memory instead of updating its row, repeated
+accesses to the same dataset are coalesced, and the buffer is written with a single
+``UPDATE ... FROM (VALUES ...)`` every ``access_flush_interval`` seconds. Accesses still
+buffered when the process dies are lost, which is acceptable for ``last_accessed``.
+"""
+
+import datetime
+import threading
+import typing
+
+import sqlalchemy
+from sqlalchemy import update
+
+from .config import Settings, get_settings
+from .database import get_engine
+from .logging import get_logger
+from .models.dataset import Dataset
+
+logger = get_logger()
+
+_tracker: typing.Optional['AccessTracker'] = None
+_tracker_lock = threading.Lock()
+
+
+class AccessTracker:
+    """Buffer dataset accesses and flush them periodically from a background thread"""
+
+    def __init__(self, *, flush_interval: float = 30, max_pending: int = 10_000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: dict[int, datetime.datetime] = {}
+        self._lock = threading.Lock()
+        # serializes flushes, the background thread and a forced flush may race
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.recorded = 0
+        self.flushes = 0
+        self.rows_updated = 0
+
+    def record(self, dataset_id: int, accessed: datetime.datetime | None = None) -> None:
+        """Record an access
+
+        A full buffer wakes the background thread up, or is flushed by the caller when the
+        thread is not running. With a flush interval of 0 every access is written through.
+        """
+        # the timestamp columns store naive UTC values
+        accessed = accessed or datetime.datetime.utcnow()
+        with self._lock:
+            previous = self._pending.get(dataset_id)
+            self._pending[dataset_id] = accessed if previous is None else max(previous, accessed)
+            self.recorded += 1
+            full = len(self._pending) >= self.max_pending
+        if self.flush_interval <= 0 or (full and self._thread is None):
+            self.flush()
+        elif full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write the buffered accesses with one UPDATE and return the number of rows updated"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            accessed = (
+                sqlalchemy.values(
+                    sqlalchemy.column('id', sqlalchemy.Integer),
+                    sqlalchemy.column('last_accessed', sqlalchemy.DateTime),
+                    name='accessed',
+                )
+                .data(list(pending.items()))
+                .alias('accessed')
+            )
+            statement = (
+                update(Dataset)
+                .where(Dataset.id == accessed.c.id)
+                # never move the timestamp back, e.g. when another process flushed later
+                .where(
+                    sqlalchemy.or_(
+                        Dataset.last_accessed.is_(None),
+                        Dataset.last_accessed < accessed.c.last_accessed,
+                    )
+                )
+                .values(last_accessed=accessed.c.last_accessed)
+                .execution_options(synchronize_session=False)
+            )
+            try:
+                with get_engine().begin() as connection:
+                    rowcount = connection.execute(statement).rowcount
+            except Exception as exc:
+                # put the accesses back so that they are retried with the next flush
+                with self._lock:
+                    for dataset_id, timestamp in pending.items():
+                        current = self._pending.get(dataset_id)
+                        self._pending[dataset_id] = (
+                            timestamp if current is None else max(current, timestamp)
+                        )
+                logger.error(f'Unable to flush {len(pending)} dataset access(es): {exc}')
+                return 0
+
+            self.flushes += 1
+            self.rows_updated += rowcount
+            logger.debug(f'Flushed {len(pending)} dataset access(es)')
+            return rowcount
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self) -> None:
+        if self._thread is None and self.flush_interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='access-tracker', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread and flush what is left in the buffer"""
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            'pending': len(self._pending),
+            'recorded': self.recorded,
+            'flushes': self.flushes,
+            'rows_updated': self.rows_updated,
+            'flush_interval': self.flush_interval,
+        }
+
+
+def get_access_tracker(settings: Settings | None = None) -> AccessTracker:
+    """Return the process-wide access tracker, creating it from the settings if needed"""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            settings = settings or get_settings()
+            _tracker = AccessTracker(
+                flush_interval=settings.access_flush_interval,
+                max_pending=settings.access_max_pending,
+            )
+        return _tracker
+
+
+def stop_access_tracker() -> None:
+    """Flush the pending accesses and drop the process-wide tracker"""
+    global _tracker
+    with _tracker_lock:
+        tracker, _tracker = _tracker, None
+    if tracker is not None:
+        tracker.stop()
+
+
+def get_access_tracker_stats() -> dict[str, typing.Any] | None:
+    """Return the tracker counters or None if no tracker has been created"""
+    return None if _tracker is None else _tracker.stats()
@@ -0,0 +1,170 @@
+"""Validators and Cache-Control policies of the read endpoints.
+
+ETags are derived from the ``updated_at`` columns, which are bumped by every update of a
+row (ORM flushes and bulk ``UPDATE`` statements alike), so a conditional request can be
+answered with a 304 before the response is serialized.
+"""
+
+import collections
+import datetime
+import email.utils
+import gzip
+import hashlib
+import threading
+import typing
+
+import brotli
+from fastapi import Request, Response
+
+from ..config import Settings, get_settings
+from ..metadata_cache import serialize_metadata
+from ..models.dataset import Status
+
+# preferred first
+ENCODINGS = ('br', 'gzip', 'identity')
+
+_document_cache: typing.Optional['EncodedDocumentCache'] = None
+_document_cache_lock = threading.Lock()
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag of a representation built from the values it depends on"""
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def format_http_date(value: datetime.datetime) -> str:
+    # the timestamp columns store naive UTC values
+    return email.utils.format_datetime(value.replace(tzinfo=datetime.timezone.utc), usegmt=True)
+
+
+def public_cache_control(settings: Settings) -> str:
+    return (
+        f'public, max-age={settings.http_cache_max_age}, '
+        f's-maxage={settings.http_cache_shared_max_age}'
+    )
+
+
+def cache_control(settings: Settings, *, status: Status | None) -> str:
+    """Completed resources may be cached by shared caches, the others are revalidated"""
+    if status == Status.completed:
+        return public_cache_control(settings)
+    return 'no-cache'
+
+
+def is_not_modified(request: Request, *, etag: str, last_modified: datetime.datetime) -> bool:
+    """Evaluate the If-None-Match, or else the If-Modified-Since, request header"""
+    if (if_none_match := request.headers.get('if-none-match')) is not None:
+        if if_none_match.strip() == '*':
+            return True
+        # If-None-Match uses the weak comparison
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return etag in tags
+    if (if_modified_since := request.headers.get('if-modified-since')) is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            return False
+        since = since.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def conditional_response(
+    request: Request,
+    response: Response,
+    *,
+    etag: str,
+    last_modified: datetime.datetime,
+    cache_control: str,
+) -> Response | None:
+    """Add the validators to the response, and return a 304 response when they match"""
+    headers = {
+        'ETag': etag,
+        'Last-Modified': format_http_date(last_modified),
+        'Cache-Control': cache_control,
+    }
+    if is_not_modified(request, etag=etag, last_modified=last_modified):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str:
+    """Pick the preferred content coding accepted by the client"""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    wildcard = accepted.get('*', 0.0)
+    for coding in ENCODINGS[:-1]:
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return 'identity'
+
+
+class EncodedDocument:
+    """A JSON document serialized once and compressed with every supported coding"""
+
+    def __init__(self, document: dict, *, digest: str):
+        body = serialize_metadata(document)
+        self.digest = digest
+        self.bodies = {
+            'identity': body,
+            'gzip': gzip.compress(body, compresslevel=6),
+            'br': brotli.compress(body, mode=brotli.MODE_TEXT),
+        }
+
+
+def etag_for_digest(digest: str, encoding: str) -> str:
+    # each content coding is a different representation and needs its own strong ETag
+    return f'"{digest}"' if encoding == 'identity' else f'"{digest}-{encoding}"'
+
+
+class EncodedDocumentCache:
+    """Bounded LRU of encoded documents keyed by their digest"""
+
+    def __init__(self, *, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: collections.OrderedDict[str, EncodedDocument] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: str, load: typing.Callable[[], dict]) -> EncodedDocument:
+        """Return the document with the digest, loading and encoding it on a miss"""
+        with self._lock:
+            if (entry := self._entries.get(digest)) is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry
+        entry = EncodedDocument(load(), digest=digest)
+        with self._lock:
+            self.misses += 1
+            self._entries[digest] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> dict[str, int]:
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def get_encoded_document_cache(settings: Settings | None = None) -> EncodedDocumentCache:
+    """Return the process-wide cache of encoded metadata documents"""
+    global _document_cache
+    with _document_cache_lock:
+        if _document_cache is None:
+            settings = settings or get_settings()
+            _document_cache = EncodedDocumentCache(max_entries=settings.metadata_cache_size)
+        return _document_cache
@@ -1,85 +1,330 @@
-import contextlib
 import datetime
 import typing
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
-from sqlalchemy.orm.exc import NoResultFound
+import sqlalchemy
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from ..database import get_session
-from ..dataset_processing import process_dataset
+from ..access_tracking import get_access_tracker
+from ..chunk_proxy import get_chunk_proxy
+from ..database import get_async_session, get_session
 from ..helpers import sanitize_url
 from ..logging import get_logger
-from ..models.dataset import Dataset, DatasetRead, RechunkRun
-from ..schemas.dataset import StorePayload
+from ..metadata_cache import get_metadata_cache
+from ..models.dataset import (
+    Dataset,
+    DatasetRead,
+    DatasetRegistration,
+    DatasetWithRechunkRuns,
+    RechunkRun,
+    Status,
+    StoreMetadata,
+    as_naive_utc,
+)
+from ..schemas.dataset import SanitizedURL, StorePayload
+from .caching import (
+    cache_control,
+    conditional_response,
+    etag_for_digest,
+    get_encoded_document_cache,
+    make_etag,
+    negotiate_encoding,
+    public_cache_control,
+)
+from .pagination import KeysetPage, PageParams, parse_fields
 
 router = APIRouter()
+async_router = APIRouter()
 logger = get_logger()
 
 
+def insert_datasets(sanitized_urls: typing.Iterable[SanitizedURL]):
+    """INSERT the datasets of the stores, returning the inserted rows
+
+    A store registered concurrently by another request hits the unique ``md5_id`` index
+    and is skipped instead of failing the transaction, so it is missing from the result.
+    """
+    rows = [
+        Dataset(
+            md5_id=sanitized_url.md5_id,
+            url=sanitized_url.url,
+            bucket=sanitized_url.bucket,
+            key=sanitized_url.key,
+            protocol=sanitized_url.protocol,
+        ).model_dump(exclude={'id'})
+        for sanitized_url in sanitized_urls
+    ]
+    return (
+        pg_insert(Dataset)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=['md5_id'])
+        .returning(Dataset)
+    )
+
+
+def sanitize_payload_url(payload: StorePayload) -> SanitizedURL:
+    """Sanitize the URL of the store, 422 when its scheme is not supported"""
+    try:
+        return sanitize_url(url=payload.url)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
+def queued_runs(dataset_ids: typing.Iterable[int]):
+    """Datasets with a queued rechunk run, which a new registration joins instead of
+    queuing another"""
+    return select(RechunkRun.dataset_id).where(
+        RechunkRun.dataset_id.in_(list(dataset_ids)), RechunkRun.status == Status.queued
+    )
+
+
+def profile_queued_runs(dataset_ids: typing.Iterable[int]):
+    """Profile the queued rechunk runs joined by a registration with ``profile``"""
+    return (
+        sqlalchemy.update(RechunkRun)
+        .where(RechunkRun.dataset_id.in_(list(dataset_ids)), RechunkRun.status == Status.queued)
+        .values(profiling=True)
+    )
+
+
+def check_profiling(request: Request, payloads: typing.Iterable[StorePayload]) -> None:
+    if not request.app.state.settings.profiling_enabled and any(
+        payload.profile for payload in payloads
+    ):
+        raise HTTPException(status_code=403, detail="Profiling is disabled")
+
+
 @router.post("/", response_model=DatasetRead, status_code=201, summary="Register a dataset")
 def register_dataset(
+    request: Request,
     payload: StorePayload,
-    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session),
 ) -> Dataset:
-    """Store a dataset in the database."""
-    logger.info(f"Storing dataset: {payload.url}")
-    sanitized_url = sanitize_url(url=payload.url)
+    """Store a dataset in the database.
 
-    # Check if dataset already exists
-    dataset_exists = False
+    Concurrent registrations of the same store share a single dataset and a single queued
+    rechunk run.
+    """
+    logger.info(f"Storing dataset: {payload.url}")
+    check_profiling(request, [payload])
+    sanitized_url = sanitize_payload_url(payload)
+    statement = select(Dataset).where(Dataset.md5_id == sanitized_url.md5_id)
 
-    with contextlib.suppress(NoResultFound):
-        dataset = session.exec(select(Dataset).where(Dataset.md5_id == sanitized_url.md5_id)).one()
+    dataset = session.exec(statement).first()
+    if dataset is None:
+        dataset = session.scalars(insert_datasets([sanitized_url])).first()
+        if dataset is not None:
+            rechunk_run = RechunkRun(
+                dataset_id=dataset.id, status="queued", profiling=payload.profile
+            )
+            session.add(rechunk_run)
+            session.commit()
+            logger.debug(f"Create Dataset: {dataset}")
+            logger.debug(f"Created Rechunk run: {rechunk_run}")
+            # The queued rechunk run is picked up by the validation worker (ncviewjs_backend.worker)
+            return dataset
+        # registered by a concurrent request since the lookup
+        dataset = session.exec(statement).one()
 
-        logger.info(f"Dataset already stored: {dataset.url}")
-        dataset_exists = True
-    if dataset_exists and not payload.force:
+    if not payload.force:
         logger.info(f"Dataset already stored: {dataset.url} and force Flag is {payload.force}")
         return dataset
 
-    # else, update the existing dataset
-    if dataset_exists:
-        # Rechunk run
-        rechunk_run = RechunkRun(dataset_id=dataset.id, status="queued")
+    # the row lock serializes the forced registrations of the dataset
+    session.exec(select(Dataset.id).where(Dataset.id == dataset.id).with_for_update()).one()
+    if session.exec(queued_runs([dataset.id])).first() is None:
+        rechunk_run = RechunkRun(dataset_id=dataset.id, status="queued", profiling=payload.profile)
         session.add(rechunk_run)
-        session.commit()
-        session.refresh(dataset)
-        session.refresh(rechunk_run)
         logger.debug(f"Revalidating dataset: {dataset}")
     else:
-        # else, register the dataset
-        dataset = Dataset(
-            md5_id=sanitized_url.md5_id,
-            url=sanitized_url.url,
-            bucket=sanitized_url.bucket,
-            key=sanitized_url.key,
-            protocol=sanitized_url.protocol,
-        )
+        logger.info(f"Dataset {dataset.id} already has a queued rechunk run")
+        if payload.profile:
+            session.exec(profile_queued_runs([dataset.id]))
+    session.commit()
+    return dataset
 
-        session.add(dataset)
-        session.commit()
 
-        # Rechunk run
-        rechunk_run = RechunkRun(dataset_id=dataset.id, status="queued")
+MAX_BATCH_SIZE = 1000
 
-        session.add(rechunk_run)
-        session.commit()
-        session.refresh(dataset)
-        session.refresh(rechunk_run)
 
-        logger.debug(f"Created Rechunk run: {rechunk_run}")
-        logger.debug(f"Create Dataset: {dataset}")
+class BatchRegistration:
+    """Plan the registration of a batch of stores
+
+    URLs are sanitized and deduplicated up front, so that the existing datasets can be
+    resolved with a single ``md5_id IN (...)`` query and all new rows inserted at once.
+    """
+
+    def __init__(self, payloads: list[StorePayload]):
+        self.payloads = payloads
+        self.sanitized: dict[str, SanitizedURL] = {}
+        self.md5_ids: list[str | Exception] = []
+        self.forced: set[str] = set()
+        self.profiled: set[str] = set()
+        for payload in payloads:
+            try:
+                sanitized_url = sanitize_url(url=payload.url)
+            except Exception as exc:
+                self.md5_ids.append(exc)
+                continue
+            self.sanitized.setdefault(sanitized_url.md5_id, sanitized_url)
+            self.md5_ids.append(sanitized_url.md5_id)
+            if payload.force:
+                self.forced.add(sanitized_url.md5_id)
+            if payload.profile:
+                self.profiled.add(sanitized_url.md5_id)
 
-    background_tasks.add_task(
-        process_dataset, dataset=dataset, rechunk_run=rechunk_run, session=session
+    def lookup(self, md5_ids: typing.Iterable[str] | None = None):
+        statement = select(Dataset).where(Dataset.md5_id.in_(list(md5_ids or self.sanitized)))
+        if self.forced:
+            # the row locks serialize the forced registrations of the datasets
+            statement = statement.with_for_update()
+        return statement
+
+    def missing(self, datasets: dict[str, Dataset]) -> list[SanitizedURL]:
+        return [
+            sanitized_url
+            for md5_id, sanitized_url in self.sanitized.items()
+            if md5_id not in datasets
+        ]
+
+    def requeued(self, existing: dict[str, Dataset]) -> list[int]:
+        return [existing[md5_id].id for md5_id in self.forced if md5_id in existing]
+
+    def new_runs(
+        self, datasets: dict[str, Dataset], existing: dict[str, Dataset], queued: set[int]
+    ) -> list[RechunkRun]:
+        # one run per new dataset and per existing dataset registered with force, unless
+        # the dataset already has a queued run
+        return [
+            RechunkRun(dataset_id=dataset.id, status="queued", profiling=md5_id in self.profiled)
+            for md5_id, dataset in datasets.items()
+            if (md5_id not in existing or md5_id in self.forced) and dataset.id not in queued
+        ]
+
+    def profiled_queued(self, existing: dict[str, Dataset], queued: set[int]) -> list[int]:
+        return [
+            existing[md5_id].id
+            for md5_id in self.profiled & self.forced
+            if md5_id in existing and existing[md5_id].id in queued
+        ]
+
+    def results(
+        self, datasets: dict[str, Dataset], existing: dict[str, Dataset]
+    ) -> list[DatasetRegistration]:
+        results = []
+        for payload, md5_id in zip(self.payloads, self.md5_ids):
+            if isinstance(md5_id, Exception):
+                results.append(
+                    DatasetRegistration(url=payload.url, status='invalid', detail=str(md5_id))
+                )
+                continue
+            if md5_id not in existing:
+                status = 'created'
+            elif md5_id in self.forced:
+                status = 'requeued'
+            else:
+                status = 'exists'
+            results.append(
+                DatasetRegistration(
+                    url=payload.url,
+                    status=status,
+                    dataset=DatasetRead.model_validate(datasets[md5_id]),
+                )
+            )
+        return results
+
+
+@router.post(
+    "/batch", response_model=list[DatasetRegistration], summary="Register a batch of datasets"
+)
+def register_datasets(
+    request: Request,
+    payloads: typing.Annotated[list[StorePayload], Body(max_length=MAX_BATCH_SIZE)],
+    session: Session = Depends(get_session),
+) -> list[DatasetRegistration]:
+    """Store a batch of datasets in the database, in a single transaction.
+
+    The status of each item is one of ``created``, ``exists``, ``requeued`` (an existing
+    dataset registered with ``force``) or ``invalid``.
+    """
+    logger.info(f"Storing a batch of {len(payloads)} datasets")
+    check_profiling(request, payloads)
+    batch = BatchRegistration(payloads)
+    existing = {dataset.md5_id: dataset for dataset in session.exec(batch.lookup()).all()}
+    datasets = dict(existing)
+    if missing := batch.missing(existing):
+        # the new datasets are inserted with a single INSERT ... ON CONFLICT ... RETURNING
+        for dataset in session.scalars(insert_datasets(missing)).all():
+            datasets[dataset.md5_id] = dataset
+        if raced := batch.missing(datasets):
+            # registered by a concurrent request since the lookup
+            statement = batch.lookup(sanitized_url.md5_id for sanitized_url in raced)
+            for dataset in session.exec(statement).all():
+                existing[dataset.md5_id] = datasets[dataset.md5_id] = dataset
+    requeued = batch.requeued(existing)
+    queued = set(session.exec(queued_runs(requeued)).all()) if requeued else set()
+    session.add_all(batch.new_runs(datasets, existing, queued))
+    if profiled := batch.profiled_queued(existing, queued):
+        session.exec(profile_queued_runs(profiled))
+    session.commit()
+
+    # The queued rechunk runs are picked up by the validation worker (ncviewjs_backend.worker)
+    return batch.results(datasets, existing)
+
+
+def latest_rechunk_runs(dataset_ids: list[int]):
+    """Select the most recent rechunk run of each dataset"""
+    return (
+        select(RechunkRun)
+        .where(RechunkRun.dataset_id.in_(dataset_ids))
+        .distinct(RechunkRun.dataset_id)
+        .order_by(RechunkRun.dataset_id, RechunkRun.id.desc())
     )
-    return dataset
 
 
-@router.get("/{id}", response_model=DatasetRead, summary="Get a dataset by ID")
+def _select_dataset(id: int):
+    # the dataset along with a summary of its runs, from which its ETag is derived
+    return (
+        select(
+            Dataset,
+            sqlalchemy.func.count(RechunkRun.id),
+            sqlalchemy.func.max(RechunkRun.id),
+            sqlalchemy.func.max(RechunkRun.updated_at),
+        )
+        .outerjoin(RechunkRun, RechunkRun.dataset_id == Dataset.id)
+        .where(Dataset.id == id)
+        .group_by(Dataset.id)
+    )
+
+
+def _not_modified(request: Request, response: Response, row, *, latest: bool) -> Response | None:
+    dataset, runs_count, latest_run_id, runs_updated_at = row
+    return conditional_response(
+        request,
+        response,
+        etag=make_etag(
+            dataset.id, dataset.updated_at, runs_count, latest_run_id, runs_updated_at, latest
+        ),
+        last_modified=max(filter(None, [dataset.updated_at, runs_updated_at])),
+        cache_control=cache_control(request.app.state.settings, status=None),
+    )
+
+
+def _rechunk_runs(id: int, *, latest: bool):
+    if latest:
+        return latest_rechunk_runs([id])
+    return select(RechunkRun).where(RechunkRun.dataset_id == id).order_by(RechunkRun.id)
+
+
+@router.get("/{id}", response_model=DatasetWithRechunkRuns, summary="Get a dataset by ID")
 def get_dataset_by_id(
+    request: Request,
+    response: Response,
     id: int,
     latest: bool = Query(
         default=True,
@@ -89,25 +334,331 @@ def get_dataset_by_id(
 ) -> Dataset:
     """Get a dataset from the database."""
     logger.info(f"Getting dataset: {id}")
-    dataset = session.get(Dataset, id)
-    if dataset is None:
+    row = session.exec(_select_dataset(id)).first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Dataset not found")
 
-    dataset.last_accessed = datetime.datetime.now(datetime.timezone.utc)
-    session.add(dataset)
-    session.commit()
-    session.refresh(dataset)
+    # the row is updated later by the access tracker, which also bumps updated_at
+    get_access_tracker().record(row[0].id)
+    if (not_modified := _not_modified(request, response, row, latest=latest)) is not None:
+        return not_modified
+    dataset = row[0]
+    # set the loaded value directly so that the other runs are not orphaned on flush
+    set_committed_value(
+        dataset, 'rechunk_runs', session.exec(_rechunk_runs(id, latest=latest)).all()
+    )
+    return dataset
+
 
-    if latest and len(dataset.rechunk_runs) > 1:
-        logger.info("Filtering out rechunk runs and returning the latest run only")
-        dataset.rechunk_runs = [max(dataset.rechunk_runs, key=lambda x: x.id)]
+@router.get("/{id}/zmetadata", summary="Get the consolidated Zarr metadata of a dataset")
+def get_dataset_zmetadata(request: Request, id: int, session: Session = Depends(get_session)):
+    """Serve the consolidated metadata of the store recorded by its last validation.
 
+    The response is compressed with brotli or gzip when the client accepts it, so viewers
+    can open the store without fetching ``.zmetadata`` from the origin bucket.
+    """
+    row = session.exec(
+        select(Dataset.md5_id, StoreMetadata.digest, StoreMetadata.fetched_at)
+        .outerjoin(StoreMetadata, StoreMetadata.md5_id == Dataset.md5_id)
+        .where(Dataset.id == id)
+    ).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    md5_id, digest, fetched_at = row
+    if digest is None:
+        raise HTTPException(
+            status_code=404, detail="No validated consolidated metadata for this dataset"
+        )
+
+    encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+    response = Response(media_type='application/json', headers={'Vary': 'Accept-Encoding'})
+    if (
+        not_modified := conditional_response(
+            request,
+            response,
+            etag=etag_for_digest(digest, encoding),
+            last_modified=fetched_at,
+            cache_control=public_cache_control(request.app.state.settings),
+        )
+    ) is not None:
+        not_modified.headers['Vary'] = 'Accept-Encoding'
+        return not_modified
+
+    document = get_encoded_document_cache(request.app.state.settings).get(
+        digest, lambda: session.get(StoreMetadata, md5_id).consolidated_metadata
+    )
+    response.body = document.bodies[encoding]
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(len(response.body))
+    return response
+
+
+@router.get(
+    "/{id}/{variable}/{chunk_key}",
+    summary="Get a chunk of a variable, rechunked for the viewer",
+    responses={200: {"content": {"application/octet-stream": {}}}},
+)
+def get_dataset_chunk(
+    request: Request,
+    id: int,
+    variable: str,
+    chunk_key: str,
+    session: Session = Depends(get_session),
+):
+    """Serve ``{variable}/.zarray``, ``{variable}/.zattrs`` or an output chunk of the
+    variable, with 256x256 spatial tiles and a few time steps per chunk.
+
+    Output chunks are assembled from the source store of the validated dataset on demand.
+    """
+    row = session.exec(
+        select(
+            Dataset.url,
+            Dataset.md5_id,
+            Dataset.cf_axes,
+            StoreMetadata.digest,
+            StoreMetadata.fetched_at,
+        )
+        .outerjoin(StoreMetadata, StoreMetadata.md5_id == Dataset.md5_id)
+        .where(Dataset.id == id)
+    ).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    url, md5_id, cf_axes, digest, fetched_at = row
+    if digest is None:
+        raise HTTPException(
+            status_code=404, detail="No validated consolidated metadata for this dataset"
+        )
+
+    settings = request.app.state.settings
+    proxy = get_chunk_proxy(settings)
+    try:
+        array = proxy.plan(
+            digest=digest,
+            name=variable,
+            load=lambda: session.get(StoreMetadata, md5_id).consolidated_metadata,
+            axes=(cf_axes or {}).get(variable),
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Variable {variable} not found")
+
+    # documents and chunks of different chunk grids never share cache keys or ETags
+    chunks = 'x'.join(map(str, array.chunks))
+    if chunk_key in {'.zarray', '.zattrs'}:
+        response = JSONResponse(array.metadata() if chunk_key == '.zarray' else array.attrs)
+    else:
+        try:
+            array.output_selection(chunk_key)
+        except ValueError:
+            raise HTTPException(status_code=404, detail=f"Chunk {chunk_key} not found")
+        response = Response(media_type='application/octet-stream')
+
+    if (
+        not_modified := conditional_response(
+            request,
+            response,
+            etag=make_etag(digest, variable, chunks, chunk_key),
+            last_modified=fetched_at,
+            cache_control=public_cache_control(settings),
+        )
+    ) is not None:
+        return not_modified
+
+    if isinstance(response, JSONResponse):
+        return response
+    response.body = proxy.get_chunk(
+        key=f'{digest}/{variable}/{chunks}/{chunk_key}', url=url, array=array, chunk_key=chunk_key
+    )
+    response.headers['Content-Length'] = str(len(response.body))
+    return response
+
+
+class DatasetListQuery:
+    """Filtered, keyset paginated and optionally projected select of datasets"""
+
+    def __init__(
+        self,
+        page: PageParams = Depends(),
+        order_by: typing.Literal['id', 'created'] = Query(default='id'),
+        protocol: str | None = None,
+        bucket: str | None = None,
+        created_after: datetime.datetime | None = None,
+        created_before: datetime.datetime | None = None,
+        last_accessed_after: datetime.datetime | None = None,
+        last_accessed_before: datetime.datetime | None = None,
+    ):
+        keys = [Dataset.id] if order_by == 'id' else [Dataset.created, Dataset.id]
+        self.page = KeysetPage(params=page, keys=keys)
+        self.fields = parse_fields(
+            page.fields, allowed=DatasetRead.model_fields, required=[key.key for key in keys]
+        )
+        if self.fields is None:
+            statement = select(Dataset)
+        else:
+            # a plain select returns rows, even when a single column is requested
+            statement = sqlalchemy.select(*[getattr(Dataset, field) for field in self.fields])
+
+        if protocol is not None:
+            statement = statement.where(Dataset.protocol == protocol)
+        if bucket is not None:
+            statement = statement.where(Dataset.bucket == bucket)
+        if created_after is not None:
+            statement = statement.where(Dataset.created >= as_naive_utc(created_after))
+        if created_before is not None:
+            statement = statement.where(Dataset.created < as_naive_utc(created_before))
+        if last_accessed_after is not None:
+            statement = statement.where(Dataset.last_accessed >= as_naive_utc(last_accessed_after))
+        if last_accessed_before is not None:
+            statement = statement.where(Dataset.last_accessed < as_naive_utc(last_accessed_before))
+        self.statement = self.page.apply(statement)
+
+    def render(self, rows, *, request: Request, response: Response):
+        return self.page.render(
+            rows, request=request, response=response, projected=self.fields is not None
+        )
+
+
+@router.get("/", response_model=list[DatasetRead], summary="List datasets")
+def list_datasets(
+    request: Request,
+    response: Response,
+    query: DatasetListQuery = Depends(),
+    session: Session = Depends(get_session),
+):
+    """List datasets, one page at a time.
+
+    The cursor of the next page is returned in the ``X-Next-Cursor`` header.
+    """
+    return query.render(session.exec(query.statement).all(), request=request, response=response)
+
+
+@async_router.post("/", response_model=DatasetRead, status_code=201, summary="Register a dataset")
+async def register_dataset_async(
+    request: Request,
+    payload: StorePayload,
+    session: AsyncSession = Depends(get_async_session),
+) -> Dataset:
+    """Store a dataset in the database.
+
+    Concurrent registrations of the same store share a single dataset and a single queued
+    rechunk run.
+    """
+    logger.info(f"Storing dataset: {payload.url}")
+    check_profiling(request, [payload])
+    sanitized_url = sanitize_payload_url(payload)
+    statement = select(Dataset).where(Dataset.md5_id == sanitized_url.md5_id)
+
+    dataset = (await session.exec(statement)).first()
+    if dataset is None:
+        dataset = (await session.scalars(insert_datasets([sanitized_url]))).first()
+        if dataset is not None:
+            rechunk_run = RechunkRun(
+                dataset_id=dataset.id, status="queued", profiling=payload.profile
+            )
+            session.add(rechunk_run)
+            await session.commit()
+            logger.debug(f"Create Dataset: {dataset}")
+            logger.debug(f"Created Rechunk run: {rechunk_run}")
+            # The queued rechunk run is picked up by the validation worker (ncviewjs_backend.worker)
+            return dataset
+        # registered by a concurrent request since the lookup
+        dataset = (await session.exec(statement)).one()
+
+    if not payload.force:
+        logger.info(f"Dataset already stored: {dataset.url} and force Flag is {payload.force}")
+        return dataset
+
+    # the row lock serializes the forced registrations of the dataset
+    await session.exec(select(Dataset.id).where(Dataset.id == dataset.id).with_for_update())
+    if (await session.exec(queued_runs([dataset.id]))).first() is None:
+        rechunk_run = RechunkRun(dataset_id=dataset.id, status="queued", profiling=payload.profile)
+        session.add(rechunk_run)
+        logger.debug(f"Revalidating dataset: {dataset}")
+    else:
+        logger.info(f"Dataset {dataset.id} already has a queued rechunk run")
+        if payload.profile:
+            await session.exec(profile_queued_runs([dataset.id]))
+    await session.commit()
+    return dataset
+
+
+@async_router.post(
+    "/batch", response_model=list[DatasetRegistration], summary="Register a batch of datasets"
+)
+async def register_datasets_async(
+    request: Request,
+    payloads: typing.Annotated[list[StorePayload], Body(max_length=MAX_BATCH_SIZE)],
+    session: AsyncSession = Depends(get_async_session),
+) -> list[DatasetRegistration]:
+    """Store a batch of datasets in the database, in a single transaction.
+
+    The status of each item is one of ``created``, ``exists``, ``requeued`` (an existing
+    dataset registered with ``force``) or ``invalid``.
+    """
+    logger.info(f"Storing a batch of {len(payloads)} datasets")
+    check_profiling(request, payloads)
+    batch = BatchRegistration(payloads)
+    result = await session.exec(batch.lookup())
+    existing = {dataset.md5_id: dataset for dataset in result.all()}
+    datasets = dict(existing)
+    if missing := batch.missing(existing):
+        for dataset in (await session.scalars(insert_datasets(missing))).all():
+            datasets[dataset.md5_id] = dataset
+        if raced := batch.missing(datasets):
+            statement = batch.lookup(sanitized_url.md5_id for sanitized_url in raced)
+            for dataset in (await session.exec(statement)).all():
+                existing[dataset.md5_id] = datasets[dataset.md5_id] = dataset
+    requeued = batch.requeued(existing)
+    queued = set((await session.exec(queued_runs(requeued))).all()) if requeued else set()
+    session.add_all(batch.new_runs(datasets, existing, queued))
+    if profiled := batch.profiled_queued(existing, queued):
+        await session.exec(profile_queued_runs(profiled))
+    await session.commit()
+
+    # The queued rechunk runs are picked up by the validation worker (ncviewjs_backend.worker)
+    return batch.results(datasets, existing)
+
+
+@async_router.get("/{id}", response_model=DatasetWithRechunkRuns, summary="Get a dataset by ID")
+async def get_dataset_by_id_async(
+    request: Request,
+    response: Response,
+    id: int,
+    latest: bool = Query(
+        default=True,
+        description='Whether to filter out rechunk runs and return the latest run only',
+    ),
+    session: AsyncSession = Depends(get_async_session),
+) -> Dataset:
+    """Get a dataset from the database."""
+    logger.info(f"Getting dataset: {id}")
+    row = (await session.exec(_select_dataset(id))).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    # off the event loop: with a flush interval of 0 the access is written through
+    await run_in_threadpool(get_access_tracker().record, row[0].id)
+    if (not_modified := _not_modified(request, response, row, latest=latest)) is not None:
+        return not_modified
+    dataset = row[0]
+    rechunk_runs = await session.exec(_rechunk_runs(id, latest=latest))
+    set_committed_value(dataset, 'rechunk_runs', rechunk_runs.all())
     return dataset
 
 
-@router.get("/", response_model=list[DatasetRead])
-def list_datasets(session: Session = Depends(get_session)):
-    return session.exec(select(Dataset)).all()
+@async_router.get("/", response_model=list[DatasetRead], summary="List datasets")
+async def list_datasets_async(
+    request: Request,
+    response: Response,
+    query: DatasetListQuery = Depends(),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """List datasets, one page at a time.
+
+    The cursor of the next page is returned in the ``X-Next-Cursor`` header.
+    """
+    result = await session.exec(query.statement)
+    return query.render(result.all(), request=request, response=response)
 
 
 # add patch method to update dataset rechunking records in the database
@@ -131,6 +682,13 @@ def update_dataset_by_id(
     if payload.get("cf_axes") is not None:
         dataset.cf_axes = payload["cf_axes"]
 
+    if payload.get("invalidate_metadata_cache"):
+        get_metadata_cache().invalidate(dataset.md5_id)
+        # the stale metadata is served until the validation fetches it again
+        session.exec(select(Dataset.id).where(Dataset.id == dataset.id).with_for_update()).one()
+        if session.exec(queued_runs([dataset.id])).first() is None:
+            session.add(RechunkRun(dataset_id=dataset.id, status="queued"))
+
     session.add(dataset)
     session.commit()
     session.refresh(dataset)
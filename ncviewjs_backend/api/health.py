@@ -1,13 +1,36 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session
 
+from ..access_tracking import get_access_tracker_stats
+from ..chunk_proxy import get_chunk_proxy_stats
 from ..config import Settings, get_settings
+from ..database import get_async_pool_stats, get_pool_stats, get_session
+from ..jobs import queue_stats
+from ..metadata_cache import get_metadata_cache_stats
+from ..profiling import recent_profiles
+from ..run_events import get_run_event_stats
 
 router = APIRouter()
 
 
 @router.get('/')
 def status():
-    return {'status': 'ok'}
+    """Liveness check of the app, which must not depend on the database"""
+    return {
+        'status': 'ok',
+        'database_pool': get_pool_stats(),
+        'async_database_pool': get_async_pool_stats(),
+        'metadata_cache': get_metadata_cache_stats(),
+        'access_tracker': get_access_tracker_stats(),
+        'run_events': get_run_event_stats(),
+        'chunk_proxy': get_chunk_proxy_stats(),
+    }
+
+
+@router.get('/queue')
+def validation_queue(session: Session = Depends(get_session)) -> dict:
+    """Depth and latency of the validation queue, see jobs.queue_stats"""
+    return queue_stats(session)
 
 
 @router.get("/ping")
@@ -17,3 +40,11 @@ async def ping(settings: Settings = Depends(get_settings)) -> dict:
         "environment": settings.environment,
         "testing": settings.testing,
     }
+
+
+@router.get("/profiles/{profile_id}")
+def get_request_profile(profile_id: str) -> dict:
+    """Profile of a request sent with the X-Profile header, see ncviewjs_backend.profiling"""
+    if (summary := recent_profiles.get(profile_id)) is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return summary
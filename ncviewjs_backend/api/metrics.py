@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+
+from ..metrics import CONTENT_TYPE_LATEST, generate_latest, metrics_registry
+
+router = APIRouter()
+
+
+@router.get('', include_in_schema=False)
+def metrics() -> Response:
+    """Metrics in the Prometheus text format"""
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
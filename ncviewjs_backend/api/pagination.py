@@ -0,0 +1,123 @@
+"""Keyset pagination and field projection shared by the list endpoints.
+
+Pages are ordered by a unique key (``id``, or ``(created, id)``) and the cursor returned in
+the ``X-Next-Cursor`` header encodes the key of the last row of the page, so fetching the
+next page is an index range scan instead of an ``OFFSET`` that reads all previous rows.
+"""
+
+import base64
+import binascii
+import datetime
+import json
+import typing
+
+import sqlalchemy
+from fastapi import HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(values: list[typing.Any]) -> str:
+    payload = json.dumps(
+        [value.isoformat() if isinstance(value, datetime.datetime) else value for value in values]
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, *, types: list[type]) -> list[typing.Any]:
+    """Decode a cursor into the key values of the last row of the previous page"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError(cursor)
+        return [
+            datetime.datetime.fromisoformat(value) if kind is datetime.datetime else kind(value)
+            for kind, value in zip(types, values)
+        ]
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+
+
+def parse_fields(
+    fields: str | None, *, allowed: typing.Iterable[str], required: typing.Iterable[str]
+) -> list[str] | None:
+    """Parse a comma separated ``fields`` query parameter
+
+    The ``required`` fields (the pagination keys) are always returned.
+    """
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    if unknown := sorted(set(requested) - set(allowed)):
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys([*required, *requested]))
+
+
+class PageParams:
+    """Query parameters common to all paginated endpoints"""
+
+    def __init__(
+        self,
+        limit: int = Query(
+            default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description='Page size'
+        ),
+        cursor: str | None = Query(
+            default=None, description=f'Cursor returned in the {NEXT_CURSOR_HEADER} header'
+        ),
+        order: typing.Literal['asc', 'desc'] = Query(default='asc', description='Sort order'),
+        fields: str | None = Query(
+            default=None,
+            description='Comma separated list of fields to return, e.g. fields=id,url,size',
+        ),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.order = order
+        self.fields = fields
+
+
+class KeysetPage:
+    """A page of a select statement ordered by ``keys``"""
+
+    def __init__(self, *, params: PageParams, keys: list[sqlalchemy.ColumnElement]):
+        self.params = params
+        self.keys = keys
+
+    def apply(self, statement):
+        """Restrict the statement to the rows following the cursor"""
+        ascending = self.params.order == 'asc'
+        if self.params.cursor is not None:
+            values = decode_cursor(
+                self.params.cursor, types=[key.type.python_type for key in self.keys]
+            )
+            key = sqlalchemy.tuple_(*self.keys) if len(self.keys) > 1 else self.keys[0]
+            bound = sqlalchemy.tuple_(*values) if len(self.keys) > 1 else values[0]
+            statement = statement.where(key > bound if ascending else key < bound)
+        ordering = [key.asc() if ascending else key.desc() for key in self.keys]
+        # one extra row tells whether there is a next page
+        return statement.order_by(*ordering).limit(self.params.limit + 1)
+
+    def render(
+        self, rows: typing.Sequence, *, request: Request, response: Response, projected: bool
+    ):
+        """Trim the extra row and add the next page cursor to the response headers
+
+        Projected rows are serialized directly, bypassing the response model of the route.
+        """
+        rows = list(rows)
+        headers = {}
+        if len(rows) > self.params.limit:
+            rows = rows[: self.params.limit]
+            cursor = encode_cursor([getattr(rows[-1], key.key) for key in self.keys])
+            headers[NEXT_CURSOR_HEADER] = cursor
+            headers['Link'] = f'<{request.url.include_query_params(cursor=cursor)}>; rel="next"'
+
+        if projected:
+            content = jsonable_encoder([dict(row._mapping) for row in rows])
+            return JSONResponse(content=content, headers=headers)
+        response.headers.update(headers)
+        return rows
@@ -1,29 +1,197 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import contextlib
+
+import sqlalchemy
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from ..database import get_session
+from ..database import get_async_session, get_engine, get_session
 from ..logging import get_logger
-from ..models.dataset import RechunkRun, RechunkRunPayload, RechunkRunRead
+from ..models.dataset import (
+    Outcome,
+    RechunkRun,
+    RechunkRunPayload,
+    RechunkRunRead,
+    RechunkRunStatus,
+    RechunkRunWithoutDataset,
+    Status,
+)
+from ..run_events import get_run_event_broadcaster
+from .caching import cache_control, conditional_response, make_etag
+from .pagination import KeysetPage, PageParams, parse_fields
 
 router = APIRouter()
+async_router = APIRouter()
 logger = get_logger()
 
 
-@router.get("/", response_model=list[RechunkRunRead], summary="Get a list of all rechunk runs")
-def list_rechunk_runs(session: Session = Depends(get_session)):
-    return session.exec(select(RechunkRun)).all()
+# the nested dataset cannot be projected, only the columns of the run itself
+RUN_FIELDS = [*RechunkRunWithoutDataset.model_fields, 'dataset_id']
+
+
+@router.get("/", response_model=list[RechunkRunRead], summary="Get a list of rechunk runs")
+def list_rechunk_runs(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    dataset_id: int | None = None,
+    status: Status | None = None,
+    outcome: Outcome | None = None,
+    session: Session = Depends(get_session),
+):
+    """List rechunk runs ordered by id, one page at a time.
+
+    The cursor of the next page is returned in the ``X-Next-Cursor`` header.
+    """
+    keyset = KeysetPage(params=page, keys=[RechunkRun.id])
+    fields = parse_fields(page.fields, allowed=RUN_FIELDS, required=['id'])
+    if fields is None:
+        # the nested datasets of the page are loaded with a single extra query
+        statement = select(RechunkRun).options(selectinload(RechunkRun.dataset))
+    else:
+        statement = sqlalchemy.select(*[getattr(RechunkRun, field) for field in fields])
+
+    if dataset_id is not None:
+        statement = statement.where(RechunkRun.dataset_id == dataset_id)
+    if status is not None:
+        statement = statement.where(RechunkRun.status == status)
+    if outcome is not None:
+        statement = statement.where(RechunkRun.outcome == outcome)
+
+    rows = session.exec(keyset.apply(statement)).all()
+    return keyset.render(rows, request=request, response=response, projected=fields is not None)
+
+
+def _select_run(id: int):
+    return select(RechunkRun).where(RechunkRun.id == id).options(joinedload(RechunkRun.dataset))
+
+
+def _not_modified(request: Request, response: Response, run: RechunkRun) -> Response | None:
+    return conditional_response(
+        request,
+        response,
+        etag=make_etag(run.id, run.updated_at, run.dataset.updated_at),
+        last_modified=max(run.updated_at, run.dataset.updated_at),
+        cache_control=cache_control(request.app.state.settings, status=run.status),
+    )
 
 
 @router.get("/{id}", response_model=RechunkRunRead, summary="Get a rechunk run by id")
-def get_rechunk_run(id: int, session: Session = Depends(get_session)):
+def get_rechunk_run(
+    request: Request, response: Response, id: int, session: Session = Depends(get_session)
+):
     try:
-        return session.exec(select(RechunkRun).where(RechunkRun.id == id)).one()
+        run = session.exec(_select_run(id)).one()
+        return _not_modified(request, response, run) or run
     except NoResultFound:
-        raise HTTPException(status_code=404, content={"detail": f"Run with {id} not found"})
+        raise HTTPException(status_code=404, detail=f"Run with {id} not found")
 
     except MultipleResultsFound:
-        raise HTTPException(status_code=500, content={"detail": f"Multiple runs found for {id}"})
+        raise HTTPException(status_code=500, detail=f"Multiple runs found for {id}")
+
+
+@router.get("/{id}/profile", summary="Get the profile of a rechunk run")
+def get_rechunk_run_profile(id: int, session: Session = Depends(get_session)) -> dict:
+    """Profile of the latest attempt of a run registered with ``profile``.
+
+    See ncviewjs_backend.profiling for the contents of the summary.
+    """
+    run = session.get(RechunkRun, id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Run with {id} not found")
+    if run.profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile recorded for run {id}")
+    return run.profile
+
+
+KEEPALIVE_INTERVAL = 15  # seconds
+MAX_WAIT = 60  # seconds
+
+
+def _read_run_status(id: int) -> RechunkRunStatus | None:
+    with Session(get_engine()) as session:
+        run = session.get(RechunkRun, id)
+        return None if run is None else RechunkRunStatus.model_validate(run, from_attributes=True)
+
+
+def _format_event(event: RechunkRunStatus) -> str:
+    return f"event: status\ndata: {event.model_dump_json()}\n\n"
+
+
+@router.get("/{id}/events", summary="Stream the status changes of a rechunk run")
+async def stream_rechunk_run_events(request: Request, id: int):
+    """Server-sent events with the current status of the run and then each of its changes.
+
+    The stream ends once the run is completed.
+    """
+    broadcaster = get_run_event_broadcaster(request.app.state.settings)
+    stack = contextlib.AsyncExitStack()
+    # subscribe before reading the current status, so that no change is missed in between
+    queue = await stack.enter_async_context(broadcaster.subscribe(id))
+    try:
+        current = await run_in_threadpool(_read_run_status, id)
+    except BaseException:
+        await stack.aclose()
+        raise
+    if current is None:
+        await stack.aclose()
+        raise HTTPException(status_code=404, detail=f"Run with {id} not found")
+    broadcaster.observe(current)
+
+    async def events():
+        async with stack:
+            event = current
+            yield _format_event(event)
+            while event.status != Status.completed:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _format_event(event)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get(
+    "/{id}/wait",
+    response_model=RechunkRunStatus,
+    summary="Wait for the status of a rechunk run to change",
+)
+async def wait_for_rechunk_run(
+    request: Request,
+    id: int,
+    status: Status | None = Query(
+        default=None, description="Status of the run already known by the client"
+    ),
+    timeout: float = Query(default=30, gt=0, le=MAX_WAIT, description="Seconds to wait"),
+):
+    """Long-poll variant of the events stream.
+
+    Returns as soon as the status of the run differs from ``status``, or changes, and with
+    the current status once ``timeout`` runs out.
+    """
+    broadcaster = get_run_event_broadcaster(request.app.state.settings)
+    async with broadcaster.subscribe(id) as queue:
+        current = await run_in_threadpool(_read_run_status, id)
+        if current is None:
+            raise HTTPException(status_code=404, detail=f"Run with {id} not found")
+        broadcaster.observe(current)
+        if status is None or current.status != status or current.status == Status.completed:
+            return current
+        try:
+            return await asyncio.wait_for(queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return current
 
 
 @router.patch("/{id}", response_model=RechunkRunRead, summary="Update a rechunk run by id")
@@ -33,19 +201,53 @@ def update_rechunk_run(
     try:
         logger.info(f"Updating rechunk run: {id} with {payload}")
         run = session.exec(select(RechunkRun).where(RechunkRun.id == id)).one()
-        run.start_time = payload.start_time
-        run.end_time = payload.end_time
-        run.rechunked_dataset = payload.rechunked_dataset
-        run.error_message = payload.error_message
-        run.error_message_traceback = payload.error_message_traceback
-        run.status = payload.status
-        run.outcome = payload.outcome
+        for field, value in payload.model_dump(exclude_unset=True).items():
+            setattr(run, field, value)
         session.add(run)
         session.commit()
         session.refresh(run)
         return run
     except NoResultFound:
-        raise HTTPException(status_code=404, content={"detail": f"Run with {id} not found"})
+        raise HTTPException(status_code=404, detail=f"Run with {id} not found")
+
+    except MultipleResultsFound:
+        raise HTTPException(status_code=500, detail=f"Multiple runs found for {id}")
+
+
+@async_router.get("/{id}", response_model=RechunkRunRead, summary="Get a rechunk run by id")
+async def get_rechunk_run_async(
+    request: Request,
+    response: Response,
+    id: int,
+    session: AsyncSession = Depends(get_async_session),
+):
+    try:
+        run = (await session.exec(_select_run(id))).one()
+        return _not_modified(request, response, run) or run
+    except NoResultFound:
+        raise HTTPException(status_code=404, detail=f"Run with {id} not found")
+
+    except MultipleResultsFound:
+        raise HTTPException(status_code=500, detail=f"Multiple runs found for {id}")
+
+
+@async_router.patch("/{id}", response_model=RechunkRunRead, summary="Update a rechunk run by id")
+async def update_rechunk_run_async(
+    id: int, payload: RechunkRunPayload, session: AsyncSession = Depends(get_async_session)
+):
+    try:
+        logger.info(f"Updating rechunk run: {id} with {payload}")
+        result = await session.exec(
+            select(RechunkRun).where(RechunkRun.id == id).options(selectinload(RechunkRun.dataset))
+        )
+        run = result.one()
+        for field, value in payload.model_dump(exclude_unset=True).items():
+            setattr(run, field, value)
+        session.add(run)
+        await session.commit()
+        return run
+    except NoResultFound:
+        raise HTTPException(status_code=404, detail=f"Run with {id} not found")
 
     except MultipleResultsFound:
-        raise HTTPException(status_code=500, content={"detail": f"Multiple runs found for {id}"})
+        raise HTTPException(status_code=500, detail=f"Multiple runs found for {id}")
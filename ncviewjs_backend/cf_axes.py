@@ -0,0 +1,69 @@
+"""CF axes (X, Y, Z, T) of the variables of a dataset.
+
+cf_xarray's ``ds[variable].cf.axes`` runs its attribute heuristics over all the
+coordinates of the variable every time it is called, so a dataset with hundreds of
+variables over the same coordinates classifies these coordinates hundreds of times. Here
+each dimension coordinate is classified once, from its attributes alone, and each
+variable gets the axes of the coordinates along its dimensions. Only the dimensions and
+attributes of the variables are needed, so the same code serves opened datasets and
+consolidated Zarr metadata.
+
+The result matches ``ds[variable].cf.axes`` (first coordinate of each axis) for datasets
+opened with ``decode_cf=False``, where the only coordinates are the dimension coordinates.
+"""
+
+import functools
+import typing
+
+if typing.TYPE_CHECKING:
+    import xarray as xr
+
+AXES = ('X', 'Y', 'Z', 'T')
+
+
+@functools.cache
+def _criteria() -> dict[str, tuple[tuple[str, tuple[str, ...]], ...]]:
+    import cf_xarray.criteria
+
+    return {axis: tuple(cf_xarray.criteria.coordinate_criteria[axis].items()) for axis in AXES}
+
+
+def classify_coordinate(attrs: typing.Mapping[str, typing.Any]) -> tuple[str, ...]:
+    """Axes a coordinate matches, from the attributes cf_xarray looks at"""
+    return tuple(
+        axis
+        for axis, criteria in _criteria().items()
+        if any(
+            isinstance(value := attrs.get(criterion), str) and value in expected
+            for criterion, expected in criteria
+        )
+    )
+
+
+def cf_axes(
+    variables: typing.Mapping[str, tuple[typing.Sequence[str], typing.Mapping[str, typing.Any]]]
+) -> dict[str, dict[str, str]]:
+    """CF axes of each variable, given the ``(dims, attrs)`` of all the variables"""
+    coordinates = {
+        name: axes
+        for name, (dims, attrs) in variables.items()
+        if tuple(dims) == (name,) and (axes := classify_coordinate(attrs))
+    }
+
+    # variables over the same dimensions share their axes
+    @functools.cache
+    def axes_of(dims: frozenset[str]) -> dict[str, str]:
+        axes = {}
+        for dim in sorted(dims & coordinates.keys()):
+            for axis in coordinates[dim]:
+                axes.setdefault(axis, dim)
+        return axes
+
+    return {name: dict(axes_of(frozenset(dims))) for name, (dims, _) in variables.items()}
+
+
+def dataset_cf_axes(ds: 'xr.Dataset') -> dict[str, dict[str, str]]:
+    """CF axes of the variables of an opened dataset"""
+    return cf_axes(
+        {name: (variable.dims, variable.attrs) for name, variable in ds.variables.items()}
+    )
@@ -0,0 +1,146 @@
+"""Chunk shapes of rechunked variables, planned for the way the viewer reads them.
+
+The shapes depend on the item size of the variable, the sizes of its dimensions, its CF
+axes and an access profile:
+
+- ``map``: the viewer browses maps, one time step after the other. Chunks are square
+  spatial tiles, up to ``SPATIAL_CHUNK_SIZE`` cells a side, holding as many time steps as
+  the byte target allows.
+- ``timeseries``: the viewer extracts the whole time series of a few points. Chunks hold
+  the whole time axis, or as much of it as the byte target allows, over tiles as large as
+  the rest of the target allows.
+
+Chunks never exceed one and a half times the target: tiles have the largest power of two
+side that fits, and the time dimension then gets ``round(target / bytes of the rest of the
+chunk)`` cells, at least one. Dimensions other than the spatial and time ones are kept
+whole when the chunk still fits, and chunked by one otherwise. Variables without spatial
+axes have no tiles: their other dimensions are halved, the largest first, until the chunk
+fits. For 4 byte values the ``map`` profile gives the 256x256 tiles of two time steps the
+viewer was built around.
+
+``predict_requests`` estimates how many chunks a typical viewer session (a ``Session``)
+reads with a given chunking, which ``benchmarks/chunk_planning.py`` compares with the reads
+measured on synthetic stores.
+"""
+
+import math
+import typing
+
+import numpy as np
+import pydantic
+
+SPATIAL_CHUNK_SIZE = 256
+TARGET_CHUNK_BYTES = 5e5
+
+AccessProfile = typing.Literal['map', 'timeseries']
+
+
+class Session(pydantic.BaseModel):
+    """What a typical viewer session reads from a variable
+
+    Maps are browsed over a window of ``viewport`` (Y, X) cells at a random position, for
+    ``time_steps`` consecutive time steps. Time series are extracted at ``points`` random
+    locations, over the whole time axis. Both read the first index of other dimensions.
+    """
+
+    profile: AccessProfile = 'map'
+    viewport: tuple[int, int] = (512, 1024)
+    time_steps: int = 12
+    points: int = 10
+
+
+def _fits(nbytes: float, target: float) -> bool:
+    # the chunk rounds to at most one target
+    return round(nbytes / target) <= 1
+
+
+def _tile(cells: int, itemsize: int, target: float, size: int = SPATIAL_CHUNK_SIZE) -> int:
+    """Side of the largest power of two square tile, up to ``size``, fitting the target
+    along with ``cells`` cells of the other dimensions"""
+    while size > 1 and not _fits(size * size * itemsize * cells, target):
+        size //= 2
+    return size
+
+
+def plan_chunks(
+    *,
+    shape: tuple[int, ...],
+    dims: tuple[str, ...],
+    itemsize: int,
+    axes: dict[str, str],
+    profile: AccessProfile = 'map',
+    target_bytes: float = TARGET_CHUNK_BYTES,
+) -> tuple[int, ...]:
+    """Chunks of a variable of the given ``shape`` along ``dims``, for the access profile"""
+    sizes = dict(zip(dims, shape))
+    spatial = [dim for axis, dim in axes.items() if axis in {'X', 'Y'} and dim in sizes]
+    time = axes.get('T') if axes.get('T') in sizes else None
+    chunks: dict[str, int] = {}
+
+    if profile == 'timeseries' and time is not None:
+        # as much of the time axis as possible, then tiles with what remains of the target
+        chunks[time] = min(sizes[time], max(1, round(target_bytes / itemsize)))
+        side = _tile(chunks[time], itemsize, target_bytes)
+    else:
+        side = _tile(1, itemsize, target_bytes)
+    for dim in spatial:
+        chunks[dim] = min(side, sizes[dim])
+
+    def chunk_bytes() -> int:
+        return itemsize * math.prod(chunks.values())
+
+    others = [dim for dim in dims if dim not in chunks and dim != time]
+    if spatial:
+        for dim in others:
+            chunks[dim] = sizes[dim] if _fits(chunk_bytes() * sizes[dim], target_bytes) else 1
+    else:
+        # the other dims take the place of the tile, reduced evenly rather than one by one
+        chunks.update({dim: sizes[dim] for dim in others})
+        while others and not _fits(chunk_bytes(), target_bytes):
+            largest = max(others, key=lambda dim: chunks[dim])
+            if chunks[largest] == 1:
+                break
+            chunks[largest] = math.ceil(chunks[largest] / 2)
+    if time is not None and time not in chunks:
+        chunks[time] = min(sizes[time], max(1, round(target_bytes / chunk_bytes())))
+    return tuple(max(1, min(chunks[dim], sizes[dim])) for dim in dims)
+
+
+def _expected_chunks(window: int, chunk: int, size: int) -> float:
+    """Chunks overlapping a window of consecutive cells at a random position"""
+    window = min(window, size)
+    starts = np.arange(size - window + 1)
+    return float(np.mean((starts + window - 1) // chunk - starts // chunk + 1))
+
+
+def predict_requests(
+    *,
+    shape: tuple[int, ...],
+    dims: tuple[str, ...],
+    chunks: tuple[int, ...],
+    axes: dict[str, str],
+    session: Session | None = None,
+) -> float:
+    """Expected number of chunks read by a viewer session"""
+    session = session or Session()
+    sizes = dict(zip(dims, shape))
+    chunking = dict(zip(dims, chunks))
+    time = axes.get('T') if axes.get('T') in sizes else None
+    spatial = {axis: dim for axis, dim in axes.items() if axis in {'X', 'Y'} and dim in sizes}
+
+    if session.profile == 'map':
+        viewport = dict(zip(('Y', 'X'), session.viewport))
+        count = math.prod(
+            _expected_chunks(viewport[axis], chunking[dim], sizes[dim])
+            for axis, dim in spatial.items()
+        )
+        if time is not None:
+            count *= _expected_chunks(session.time_steps, chunking[time], sizes[time])
+        return count
+
+    tiles = math.prod(math.ceil(sizes[dim] / chunking[dim]) for dim in spatial.values())
+    # random points fall in the same tile more often as there are fewer tiles
+    distinct = tiles * (1 - (1 - 1 / tiles) ** session.points)
+    if time is not None:
+        distinct *= math.ceil(sizes[time] / chunking[time])
+    return distinct
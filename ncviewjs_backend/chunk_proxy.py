@@ -0,0 +1,355 @@
+"""Viewer-shaped chunks assembled on demand from the source store.
+
+The persistent rechunking of ``flows/ncview_rechunk.py`` rewrote every store to 256x256
+spatial tiles and a few time steps per chunk. The proxy serves the same chunks without
+writing anything: each output chunk is assembled from the overlapping source chunks, which
+are fetched concurrently with bounded parallelism and decoded by zarr, and kept in a size
+bounded LRU cache with an optional local disk tier.
+
+Output chunks are uncompressed and use the C order, the ``.zarray`` served next to them
+describes them. Only Zarr v2 stores are supported.
+"""
+
+import collections
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import math
+import os
+import pathlib
+import tempfile
+import threading
+import typing
+
+import fsspec
+import numpy as np
+import pydantic
+import zarr
+
+from .chunk_planning import plan_chunks
+from .config import Settings, get_settings
+from .logging import get_logger
+from .singleflight import SingleFlight
+
+logger = get_logger()
+
+_proxy: typing.Optional['ChunkProxy'] = None
+_proxy_lock = threading.Lock()
+
+
+def viewer_chunks(
+    *, shape: tuple[int, ...], dims: tuple[str, ...], axes: dict[str, str], itemsize: int = 4
+) -> tuple[int, ...]:
+    """Chunks of the rechunked variable for map browsing, see ``chunk_planning``"""
+    return plan_chunks(shape=shape, dims=dims, itemsize=itemsize, axes=axes, profile='map')
+
+
+class ProxiedArray(pydantic.BaseModel):
+    """A source array along with the chunks it is served with"""
+
+    name: str
+    zarray: dict
+    attrs: dict
+    chunks: tuple[int, ...]
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return tuple(self.zarray['shape'])
+
+    @property
+    def source_chunks(self) -> tuple[int, ...]:
+        return tuple(self.zarray['chunks'])
+
+    @property
+    def separator(self) -> str:
+        return self.zarray.get('dimension_separator') or '.'
+
+    def metadata(self) -> dict:
+        """``.zarray`` of the proxied array"""
+        return {
+            **self.zarray,
+            'chunks': list(self.chunks),
+            'compressor': None,
+            'filters': None,
+            'order': 'C',
+            'dimension_separator': '.',
+        }
+
+    def output_selection(self, chunk_key: str) -> tuple[slice, ...]:
+        """Region of the array covered by an output chunk, ValueError for invalid keys"""
+        if not self.shape:
+            if chunk_key != '0':
+                raise ValueError(chunk_key)
+            return ()
+        indices = [int(index) for index in chunk_key.split('.')]
+        if len(indices) != len(self.shape):
+            raise ValueError(chunk_key)
+        selection = []
+        for index, size, chunk in zip(indices, self.shape, self.chunks):
+            if not 0 <= index < math.ceil(size / chunk):
+                raise ValueError(chunk_key)
+            selection.append(slice(index * chunk, min((index + 1) * chunk, size)))
+        return tuple(selection)
+
+    def source_keys(self, selection: tuple[slice, ...]) -> list[str]:
+        """Keys of the source chunks overlapping the region"""
+        if not self.shape:
+            return ['0']
+        ranges = [
+            range(region.start // chunk, math.ceil(region.stop / chunk))
+            for region, chunk in zip(selection, self.source_chunks)
+        ]
+        return [self.separator.join(map(str, indices)) for indices in itertools.product(*ranges)]
+
+
+def plan_array(
+    consolidated_metadata: dict, name: str, *, axes: dict[str, str] | None = None
+) -> ProxiedArray:
+    """Plan how a variable of the store is served, KeyError when there is no such array"""
+    metadata = consolidated_metadata.get('metadata', {})
+    zarray = metadata[f'{name}/.zarray']
+    if np.dtype(zarray['dtype']).hasobject:
+        raise KeyError(name)
+    attrs = metadata.get(f'{name}/.zattrs', {})
+    dims = tuple(attrs.get('_ARRAY_DIMENSIONS', ()))
+    shape = tuple(zarray['shape'])
+    if len(dims) != len(shape):
+        dims = tuple(f'dim_{index}' for index in range(len(shape)))
+    chunks = viewer_chunks(
+        shape=shape, dims=dims, axes=axes or {}, itemsize=np.dtype(zarray['dtype']).itemsize
+    )
+    return ProxiedArray(name=name, zarray=zarray, attrs=attrs, chunks=chunks)
+
+
+class ChunkCache:
+    """LRU cache of output chunks bounded by their total size
+
+    With a ``directory`` the chunks are also written to disk, where they survive restarts
+    and chunks evicted from memory can be found again.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_bytes: int = 256 * 2**20,
+        directory: str | None = None,
+        max_disk_bytes: int = 2 * 2**30,
+    ):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.directory = pathlib.Path(directory) if directory else None
+        self._entries: collections.OrderedDict[str, bytes] = collections.OrderedDict()
+        self._files: collections.OrderedDict[str, int] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.disk_nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # least recently used first
+            for path in sorted(self.directory.glob('*.chunk'), key=lambda p: p.stat().st_mtime):
+                self._files[path.stem] = path.stat().st_size
+                self.disk_nbytes += path.stat().st_size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _file_name(self, key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _remember(self, key: str, value: bytes) -> None:
+        # caller holds the lock
+        if key in self._entries:
+            self.nbytes -= len(self._entries.pop(key))
+        self._entries[key] = value
+        self.nbytes += len(value)
+        while self.nbytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= len(evicted)
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            if (value := self._entries.get(key)) is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.directory is not None:
+            name = self._file_name(key)
+            try:
+                value = (self.directory / f'{name}.chunk').read_bytes()
+            except FileNotFoundError:
+                value = None
+            if value is not None:
+                with self._lock:
+                    if name in self._files:
+                        self._files.move_to_end(name)
+                    self.disk_hits += 1
+                    self._remember(key, value)
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._remember(key, value)
+        if self.directory is None or len(value) > self.max_disk_bytes:
+            return
+
+        name = self._file_name(key)
+        # write to a temporary file first so that readers never see partial chunks
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+        os.replace(tmp, self.directory / f'{name}.chunk')
+        with self._lock:
+            self.disk_nbytes += len(value) - self._files.pop(name, 0)
+            self._files[name] = len(value)
+            while self.disk_nbytes > self.max_disk_bytes and self._files:
+                evicted, size = self._files.popitem(last=False)
+                self.disk_nbytes -= size
+                (self.directory / f'{evicted}.chunk').unlink(missing_ok=True)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'nbytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'disk_entries': len(self._files),
+            'disk_nbytes': self.disk_nbytes,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+        }
+
+
+class ChunkProxy:
+    """Assemble output chunks from source chunks fetched by a bounded pool of threads"""
+
+    def __init__(self, *, concurrency: int = 8, cache: ChunkCache | None = None):
+        self.concurrency = concurrency
+        self.cache = cache or ChunkCache()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix='chunk-fetch'
+        )
+        self._plans: collections.OrderedDict[tuple, ProxiedArray] = collections.OrderedDict()
+        self._plans_lock = threading.Lock()
+        self._flights = SingleFlight()
+        self.source_chunks_fetched = 0
+
+    def plan(
+        self,
+        *,
+        digest: str,
+        name: str,
+        load: typing.Callable[[], dict],
+        axes: dict[str, str] | None = None,
+    ) -> ProxiedArray:
+        """Plan of the array, ``load`` returns the consolidated metadata on a miss"""
+        # the chunk shape depends on the axes, which are edited independently of the store
+        key = (digest, name, tuple(sorted((axes or {}).items())))
+        with self._plans_lock:
+            if (array := self._plans.get(key)) is not None:
+                self._plans.move_to_end(key)
+                return array
+        array = plan_array(load(), name, axes=axes)
+        with self._plans_lock:
+            self._plans[key] = array
+            while len(self._plans) > 1024:
+                self._plans.popitem(last=False)
+        return array
+
+    def fetch(self, url: str, keys: list[str]) -> dict[str, bytes]:
+        """Fetch the raw source chunks concurrently, missing chunks are left out"""
+        fs, path = fsspec.core.url_to_fs(url)
+        path = path.rstrip('/')
+
+        def fetch_one(key: str) -> tuple[str, bytes | None]:
+            try:
+                return key, fs.cat_file(f'{path}/{key}')
+            except FileNotFoundError:
+                return key, None
+
+        chunks = {}
+        for key, value in self._executor.map(fetch_one, keys):
+            if value is not None:
+                chunks[key] = value
+        self.source_chunks_fetched += len(keys)
+        return chunks
+
+    def assemble(self, *, url: str, array: ProxiedArray, chunk_key: str) -> bytes:
+        selection = array.output_selection(chunk_key)
+        keys = array.source_keys(selection)
+        # zarr decodes the fetched chunks, missing ones read as the fill value
+        store = self.fetch(f'{url.rstrip("/")}/{array.name}', keys)
+        store['.zarray'] = json.dumps(array.zarray).encode()
+        source = zarr.open_array(store=store, mode='r')
+        data = source[selection]
+        if data.shape == array.chunks:
+            return np.ascontiguousarray(data).tobytes()
+
+        # edge chunks are padded to the full chunk shape, like zarr stores them
+        fill_value = source.fill_value if source.fill_value is not None else 0
+        padded = np.full(array.chunks, fill_value, dtype=source.dtype)
+        padded[tuple(slice(0, size) for size in data.shape)] = data
+        return padded.tobytes()
+
+    def get_chunk(self, *, key: str, url: str, array: ProxiedArray, chunk_key: str) -> bytes:
+        """Return the output chunk from the cache, assembling it on a miss
+
+        Concurrent misses of the same chunk share a single assembly.
+        """
+        if (value := self.cache.get(key)) is not None:
+            return value
+
+        def assemble() -> bytes:
+            value = self.assemble(url=url, array=array, chunk_key=chunk_key)
+            self.cache.put(key, value)
+            return value
+
+        return self._flights.do(key, assemble)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            'concurrency': self.concurrency,
+            'source_chunks_fetched': self.source_chunks_fetched,
+            'coalesced': self._flights.coalesced,
+            'cache': self.cache.stats(),
+        }
+
+
+def get_chunk_proxy(settings: Settings | None = None) -> ChunkProxy:
+    """Return the process-wide chunk proxy, creating it from the settings if needed"""
+    global _proxy
+    with _proxy_lock:
+        if _proxy is None:
+            settings = settings or get_settings()
+            _proxy = ChunkProxy(
+                concurrency=settings.chunk_proxy_concurrency,
+                cache=ChunkCache(
+                    max_bytes=settings.chunk_cache_size,
+                    directory=settings.chunk_cache_dir,
+                    max_disk_bytes=settings.chunk_cache_disk_size,
+                ),
+            )
+        return _proxy
+
+
+def close_chunk_proxy() -> None:
+    """Stop the fetching threads and drop the process-wide proxy"""
+    global _proxy
+    with _proxy_lock:
+        proxy, _proxy = _proxy, None
+    if proxy is not None:
+        proxy.close()
+
+
+def get_chunk_proxy_stats() -> dict[str, typing.Any] | None:
+    """Return the proxy counters or None if no proxy has been created"""
+    return None if _proxy is None else _proxy.stats()
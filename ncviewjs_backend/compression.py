@@ -0,0 +1,133 @@
+"""Compression codecs of rechunked stores, picked from a benchmark of sample chunks.
+
+Rechunked variables keep the compressor of the source by default. They can be re-encoded
+with one of ``CODECS`` instead: Blosc with zstd or lz4 and byte shuffling, or plain zlib,
+which every Zarr client in the browser can decode. ``benchmark_codecs`` encodes a few
+chunks of a variable, sampled across the array with the shape of the rechunked chunks,
+with every candidate and measures the compression ratio and the encoding and decoding
+throughputs. ``select_codec`` then picks the codec with which a chunk is fetched and
+decoded the fastest: the encoded size over the bandwidth of the viewer plus the time to
+decode it.
+"""
+
+import math
+import time
+import typing
+
+import numcodecs
+import numpy as np
+import pydantic
+import zarr
+from numcodecs.abc import Codec
+from numcodecs.compat import ensure_bytes
+
+CODECS: dict[str, Codec] = {
+    'blosc-zstd': numcodecs.Blosc(cname='zstd', clevel=5, shuffle=numcodecs.Blosc.SHUFFLE),
+    'blosc-lz4': numcodecs.Blosc(cname='lz4', clevel=5, shuffle=numcodecs.Blosc.SHUFFLE),
+    'zlib': numcodecs.Zlib(level=5),
+}
+
+# bytes per second a viewer typically downloads chunks at
+VIEWER_BANDWIDTH = 10e6
+
+
+class CodecBenchmark(pydantic.BaseModel):
+    codec: str
+    config: dict
+    ratio: float
+    encode_mb_per_s: float
+    decode_mb_per_s: float
+    # seconds to download and decode a chunk of the average size of the samples
+    chunk_seconds: float
+
+
+def sample_regions(
+    shape: tuple[int, ...], chunks: tuple[int, ...], samples: int
+) -> list[tuple[slice, ...]]:
+    """Regions of up to ``samples`` chunks, spread evenly over the chunks of the array"""
+    grid = [math.ceil(size / chunk) for size, chunk in zip(shape, chunks)]
+    count = math.prod(grid)
+    if count == 0:
+        return []
+    indices = sorted({int(index) for index in np.linspace(0, count - 1, min(samples, count))})
+    regions = []
+    for index in indices:
+        position = np.unravel_index(index, grid) if grid else ()
+        regions.append(
+            tuple(
+                slice(int(i) * chunk, min((int(i) + 1) * chunk, size))
+                for i, chunk, size in zip(position, chunks, shape)
+            )
+        )
+    return regions
+
+
+def _best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_codecs(
+    array: zarr.Array,
+    *,
+    chunks: tuple[int, ...] | None = None,
+    codecs: typing.Mapping[str, Codec] | None = None,
+    samples: int = 3,
+    repeat: int = 3,
+    bandwidth: float = VIEWER_BANDWIDTH,
+) -> list[CodecBenchmark]:
+    """Benchmark the codecs on sample chunks of the array, of shape ``chunks``"""
+    codecs = CODECS if codecs is None else codecs
+    chunks = array.chunks if chunks is None else chunks
+    data = [
+        np.ascontiguousarray(array[region])
+        for region in sample_regions(array.shape, chunks, samples)
+    ]
+    nbytes = sum(sample.nbytes for sample in data)
+    results = []
+    for name, codec in codecs.items():
+        encoded = [codec.encode(sample) for sample in data]
+        size = sum(len(ensure_bytes(chunk)) for chunk in encoded)
+        encode_seconds = _best_of(lambda: [codec.encode(sample) for sample in data], repeat)
+        decode_seconds = _best_of(lambda: [codec.decode(chunk) for chunk in encoded], repeat)
+        results.append(
+            CodecBenchmark(
+                codec=name,
+                config=codec.get_config(),
+                ratio=round(nbytes / size, 3) if size else 1.0,
+                encode_mb_per_s=round(nbytes / 1e6 / max(encode_seconds, 1e-9), 1),
+                decode_mb_per_s=round(nbytes / 1e6 / max(decode_seconds, 1e-9), 1),
+                chunk_seconds=(
+                    round((size / bandwidth + decode_seconds) / len(data), 6) if data else 0.0
+                ),
+            )
+        )
+    return results
+
+
+def select_codec(results: list[CodecBenchmark]) -> CodecBenchmark:
+    """The codec whose chunks are downloaded and decoded the fastest"""
+    return min(results, key=lambda result: result.chunk_seconds)
+
+
+def choose_codec(
+    array: zarr.Array, *, chunks: tuple[int, ...], codec: str = 'auto', **kwargs
+) -> tuple[Codec | None, dict]:
+    """Compressor of the rechunked variable and the benchmark it was chosen from
+
+    ``codec`` is ``auto`` for the fastest codec, the compressor of the source included, or
+    the name of one of ``CODECS``. The benchmark is recorded with the rechunk run.
+    """
+    candidates = dict(CODECS)
+    if array.compressor is not None:
+        candidates['source'] = array.compressor
+    results = benchmark_codecs(array, chunks=chunks, codecs=candidates, **kwargs)
+    selected = select_codec(results).codec if codec == 'auto' else codec
+    return candidates[selected], {
+        'selected': selected,
+        'results': [result.model_dump() for result in results],
+    }
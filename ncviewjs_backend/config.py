@@ -12,6 +12,41 @@ class Settings(pydantic_settings.BaseSettings):
     environment: typing.Literal["dev", "prod"] = "dev"
     testing: bool = False
     database_url: str | None = None
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout: float = 30
+    database_pool_pre_ping: bool = True
+    database_pool_recycle: int = 1800  # seconds
+    # Serve the dataset and run endpoints through an asyncpg backed AsyncSession
+    async_database: bool = False
+    # Validation job queue, see ncviewjs_backend.worker
+    worker_concurrency: int = 2
+    worker_poll_interval: float = 5  # seconds
+    worker_host_concurrency: int = 1  # runs of a worker processed in parallel per origin host
+    job_timeout: float = 300  # seconds before a validation is given up as timed out
+    worker_metrics_port: int | None = None  # serve the worker's Prometheus metrics on this port
+    job_lease_seconds: int = 600
+    job_max_attempts: int = 3
+    job_retry_backoff: float = 30  # seconds, doubled after every failed attempt
+    job_retry_backoff_max: float = 3600  # seconds
+    # Store metadata cache, see ncviewjs_backend.metadata_cache
+    metadata_cache_size: int = 256
+    metadata_cache_ttl: float = 300  # seconds before an entry is revalidated
+    metadata_cache_shared: bool = False  # share entries between processes through postgres
+    # Buffered last_accessed updates, see ncviewjs_backend.access_tracking
+    # At most this many seconds of accesses are lost if the process dies, 0 writes through
+    access_flush_interval: float = 30
+    access_max_pending: int = 10_000  # datasets buffered before a flush is forced
+    # Cache-Control of completed runs, see ncviewjs_backend.api.caching
+    http_cache_max_age: int = 60  # seconds
+    http_cache_shared_max_age: int = 3600  # seconds, for CDNs and other shared caches
+    # On-demand rechunking, see ncviewjs_backend.chunk_proxy
+    chunk_proxy_concurrency: int = 8  # source chunks fetched in parallel
+    chunk_cache_size: int = 256 * 2**20  # bytes of output chunks kept in memory
+    chunk_cache_dir: str | None = None  # optional disk tier
+    chunk_cache_disk_size: int = 2 * 2**30  # bytes
+    # Opt-in profiling of requests and validation jobs, see ncviewjs_backend.profiling
+    profiling_enabled: bool = False
     scratch_bucket: str | pydantic.DirectoryPath = "s3://carbonplan-data-viewer-staging/tmp"
     staging_bucket: str | pydantic.DirectoryPath = "s3://carbonplan-data-viewer-staging"
     production_bucket: str | pydantic.DirectoryPath = "s3://carbonplan-data-viewer-production"
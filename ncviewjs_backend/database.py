@@ -1,15 +1,176 @@
+import threading
+import time
 import typing
 
+import sqlalchemy
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlmodel import Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from .config import get_settings
+from .config import Settings, get_settings
+from .logging import get_logger
+
+logger = get_logger()
+
+_engine: sqlalchemy.Engine | None = None
+_async_engine: AsyncEngine | None = None
+_engine_lock = threading.Lock()
+
+
+class _WaitTimeMixin:
+    """Keep track of how long callers wait for a connection to be checked out of the pool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.checkouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.wait_time_total += elapsed
+            self.wait_time_max = max(self.wait_time_max, elapsed)
+            self.checkouts += 1
+
+
+class InstrumentedQueuePool(_WaitTimeMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_WaitTimeMixin, AsyncAdaptedQueuePool):
+    pass
 
 
 def get_session() -> Session:
-    with Session(get_engine()) as session:
+    # Like the async sessions below, request sessions do not expire attributes on commit,
+    # the objects returned by the endpoints are serialized without being loaded again
+    with Session(get_engine(), expire_on_commit=False) as session:
         yield session
 
 
+async def get_async_session() -> AsyncSession:
+    # Attributes are not expired on commit because lazy loading them is not possible
+    # once the greenlet that ran the commit is gone
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+
+def _pool_options(settings: Settings) -> dict[str, typing.Any]:
+    return {
+        'pool_size': settings.database_pool_size,
+        'max_overflow': settings.database_max_overflow,
+        'pool_timeout': settings.database_pool_timeout,
+        'pool_pre_ping': settings.database_pool_pre_ping,
+        'pool_recycle': settings.database_pool_recycle,
+    }
+
+
+def async_database_url(url: str) -> str:
+    """Convert a postgres database URL to one using the asyncpg driver"""
+    scheme, rest = url.split('://', 1)
+    if scheme in {'postgres', 'postgresql', 'postgresql+psycopg2'}:
+        scheme = 'postgresql+asyncpg'
+    return f'{scheme}://{rest}'
+
+
+def create_db_engine(settings: Settings) -> sqlalchemy.Engine:
+    """Create a pooled engine from the settings"""
+    return create_engine(
+        settings.database_url,
+        connect_args={"options": "-c timezone=utc"},
+        poolclass=InstrumentedQueuePool,
+        **_pool_options(settings),
+    )
+
+
+def create_async_db_engine(settings: Settings) -> AsyncEngine:
+    """Create a pooled asyncpg engine from the settings"""
+    return create_async_engine(
+        async_database_url(settings.database_url),
+        connect_args={"server_settings": {"timezone": "utc"}},
+        poolclass=InstrumentedAsyncQueuePool,
+        **_pool_options(settings),
+    )
+
+
+def init_engine(settings: Settings | None = None) -> sqlalchemy.Engine:
+    """Create the process-wide engine if it does not exist yet and return it"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_db_engine(settings or get_settings())
+            logger.info(f"Created database engine with pool: {_engine.pool.status()}")
+        return _engine
+
+
+def init_async_engine(settings: Settings | None = None) -> AsyncEngine:
+    """Create the process-wide async engine if it does not exist yet and return it"""
+    global _async_engine
+    with _engine_lock:
+        if _async_engine is None:
+            _async_engine = create_async_db_engine(settings or get_settings())
+            logger.info(f"Created async database engine with pool: {_async_engine.pool.status()}")
+        return _async_engine
+
+
 def get_engine() -> typing.Any:
-    settings = get_settings()
-    return create_engine(settings.database_url, connect_args={"options": "-c timezone=utc"})
+    if _engine is None:
+        return init_engine()
+    return _engine
+
+
+def get_async_engine() -> AsyncEngine:
+    if _async_engine is None:
+        return init_async_engine()
+    return _async_engine
+
+
+def dispose_engine() -> None:
+    """Close all pooled connections and drop the process-wide engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            logger.info("Disposing database engine...")
+            _engine.dispose()
+            _engine = None
+
+
+async def dispose_async_engine() -> None:
+    """Close all pooled connections and drop the process-wide async engine"""
+    global _async_engine
+    engine, _async_engine = _async_engine, None
+    if engine is not None:
+        logger.info("Disposing async database engine...")
+        await engine.dispose()
+
+
+def _pool_stats(pool: sqlalchemy.Pool) -> dict[str, typing.Any]:
+    stats = {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': pool.overflow(),
+    }
+    if isinstance(pool, _WaitTimeMixin):
+        stats['checkouts'] = pool.checkouts
+        stats['wait_time_total'] = round(pool.wait_time_total, 6)
+        stats['wait_time_max'] = round(pool.wait_time_max, 6)
+        stats['wait_time_mean'] = (
+            round(pool.wait_time_total / pool.checkouts, 6) if pool.checkouts else 0.0
+        )
+    return stats
+
+
+def get_pool_stats() -> dict[str, typing.Any] | None:
+    """Return connection pool statistics or None if no engine has been created"""
+    return None if _engine is None else _pool_stats(_engine.pool)
+
+
+def get_async_pool_stats() -> dict[str, typing.Any] | None:
+    """Return async connection pool statistics or None if no async engine has been created"""
+    return None if _async_engine is None else _pool_stats(_async_engine.pool)
@@ -1,10 +1,20 @@
+import contextlib
+import datetime
+import math
+import threading
+import time
 import traceback
 
 import dask.utils
+import numpy as np
+import pydantic
 import xarray as xr
 from sqlmodel import Session
 
+from .cf_axes import cf_axes, dataset_cf_axes
 from .logging import get_logger
+from .metadata_cache import MetadataUnavailableError, fetch_zarr_metadata, get_metadata_cache
+from .metrics import observe_validation
 from .models.dataset import Dataset, RechunkRun
 
 logger = get_logger()
@@ -24,7 +34,62 @@ class UnableToOpenDatasetError(Exception):
         self.message = message
 
 
-def validate_dataset_size(dataset: xr.Dataset) -> None:
+class ValidationTimeoutError(Exception):
+    """Exception raised when the store could not be read within the job timeout"""
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+_abandoned = threading.local()
+
+
+@contextlib.contextmanager
+def track_abandoned_calls():
+    """Collect the threads of the calls that timed out in this thread within the block
+
+    The threads are still running when the block exits, the caller can keep accounting for
+    the resources they hold until they finish.
+    """
+    previous = getattr(_abandoned, 'threads', None)
+    _abandoned.threads = threads = []
+    try:
+        yield threads
+    finally:
+        _abandoned.threads = previous
+
+
+def call_with_timeout(func, *args, timeout: float | None, **kwargs):
+    """Call ``func`` in a daemon thread and give up waiting after ``timeout`` seconds
+
+    Reads of a store cannot be interrupted: the thread of a call that timed out is left to
+    finish on its own and its result is discarded. It is recorded by the enclosing
+    ``track_abandoned_calls``, if any.
+    """
+    if timeout is None:
+        return func(*args, **kwargs)
+
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = func(*args, **kwargs)
+        except BaseException as exc:
+            outcome['error'] = exc
+
+    thread = threading.Thread(target=target, name='validation', daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        if (threads := getattr(_abandoned, 'threads', None)) is not None:
+            threads.append(thread)
+        raise ValidationTimeoutError(f'Timed out after {timeout}s')
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def validate_dataset_size(dataset: 'xr.Dataset | ZarrStoreInfo') -> None:
     """Validate that the dataset is not too large to be processed"""
 
     DATASET_SIZE_THRESHOLD = 60e9  # 60 GB
@@ -37,16 +102,11 @@ def validate_dataset_size(dataset: xr.Dataset) -> None:
         )
 
 
-def validate_zarr_store(url: str) -> None:
-    """Validate that the Zarr store is accessible"""
+def open_zarr_store(url: str) -> xr.Dataset:
+    """Open the Zarr store without loading any data"""
 
     try:
-        with xr.open_dataset(url, engine='zarr', chunks={}, decode_cf=False) as ds:
-            pass
-        del ds
-
-    except DatasetTooLargeError as exc:
-        raise DatasetTooLargeError(exc) from exc
+        return xr.open_dataset(url, engine='zarr', chunks={}, decode_cf=False)
 
     except Exception as exc:
         raise UnableToOpenDatasetError(f'Unable to open Zarr store: {url} due to {exc}') from exc
@@ -54,51 +114,268 @@ def validate_zarr_store(url: str) -> None:
 
 def retrieve_CF_axes(ds: xr.Dataset) -> dict[str, dict[str, str]]:
     """Retrieve the CF dimensions from the dataset"""
-    import cf_xarray  # noqa
+    return dataset_cf_axes(ds)
+
+
+class ZarrArrayInfo(pydantic.BaseModel):
+    """Metadata of a single Zarr array, parsed without opening it"""
+
+    name: str
+    shape: tuple[int, ...]
+    chunks: tuple[int, ...]
+    dtype: str
+    itemsize: int
+    dims: tuple[str, ...]
+    attrs: dict = {}
+
+    @property
+    def nbytes(self) -> int:
+        return math.prod(self.shape) * self.itemsize
+
+    @property
+    def chunk_grid(self) -> tuple[int, ...]:
+        """Number of chunks along each dimension"""
+        return tuple(math.ceil(size / chunk) for size, chunk in zip(self.shape, self.chunks))
+
+    @property
+    def nchunks(self) -> int:
+        return math.prod(self.chunk_grid)
+
+
+class ZarrStoreInfo(pydantic.BaseModel):
+    """Metadata of the arrays at the root of a Zarr store"""
+
+    arrays: dict[str, ZarrArrayInfo]
+    attrs: dict = {}
+    zarr_format: int = 2
+
+    @classmethod
+    def from_xarray(cls, ds: xr.Dataset) -> 'ZarrStoreInfo':
+        arrays = {
+            name: ZarrArrayInfo(
+                name=name,
+                shape=variable.shape,
+                chunks=variable.encoding.get('chunks') or variable.shape,
+                dtype=variable.dtype.str,
+                itemsize=variable.dtype.itemsize,
+                dims=variable.dims,
+                attrs=variable.attrs,
+            )
+            for name, variable in ds.variables.items()
+        }
+        return cls(arrays=arrays, attrs=ds.attrs)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    @property
+    def size(self) -> str:
+        return dask.utils.format_bytes(self.nbytes)
+
+    @property
+    def cf_axes(self) -> dict[str, dict[str, str]]:
+        return retrieve_CF_axes_from_metadata(self)
+
+
+def _parse_dtype(dtype: str | list) -> np.dtype:
+    if isinstance(dtype, list):
+        # structured dtype
+        return np.dtype([tuple(field) for field in dtype])
+    try:
+        return np.dtype(dtype)
+    except TypeError:
+        # variable length types such as the Zarr v3 "string" data type
+        return np.dtype('O')
+
+
+def _parse_v2_metadata(metadata: dict) -> ZarrStoreInfo:
+    entries = metadata['metadata']
+    arrays = {}
+    for key, zarray in entries.items():
+        name, _, leaf = key.rpartition('/')
+        # only arrays at the root of the store are part of the dataset
+        if leaf != '.zarray' or not name or '/' in name:
+            continue
+        attrs = dict(entries.get(f'{name}/.zattrs', {}))
+        dims = attrs.pop('_ARRAY_DIMENSIONS', None)
+        if dims is None:
+            raise MetadataUnavailableError(f'Array {name} has no _ARRAY_DIMENSIONS attribute')
+        dtype = _parse_dtype(zarray['dtype'])
+        arrays[name] = ZarrArrayInfo(
+            name=name,
+            shape=zarray['shape'],
+            chunks=zarray['chunks'],
+            dtype=dtype.str,
+            itemsize=dtype.itemsize,
+            dims=dims,
+            attrs=attrs,
+        )
+    return ZarrStoreInfo(arrays=arrays, attrs=entries.get('.zattrs', {}), zarr_format=2)
+
+
+def _parse_v3_metadata(metadata: dict) -> ZarrStoreInfo:
+    consolidated = (metadata.get('consolidated_metadata') or {}).get('metadata')
+    if consolidated is None:
+        raise MetadataUnavailableError('zarr.json has no consolidated metadata')
+    arrays = {}
+    for name, node in consolidated.items():
+        if node.get('node_type') != 'array' or '/' in name:
+            continue
+        dims = node.get('dimension_names')
+        if dims is None or None in dims:
+            raise MetadataUnavailableError(f'Array {name} has no dimension names')
+        dtype = _parse_dtype(node['data_type'])
+        arrays[name] = ZarrArrayInfo(
+            name=name,
+            shape=node['shape'],
+            chunks=node['chunk_grid']['configuration']['chunk_shape'],
+            dtype=dtype.str,
+            itemsize=dtype.itemsize,
+            dims=dims,
+            attrs=node.get('attributes', {}),
+        )
+    return ZarrStoreInfo(arrays=arrays, attrs=metadata.get('attributes', {}), zarr_format=3)
 
-    results = {}
-    for variable in ds.variables:
-        axes = ds[variable].cf.axes
-        for key, value in axes.items():
-            axes[key] = value[0]
-        results[variable] = axes
-    return results
+
+def parse_zarr_metadata(metadata: dict) -> ZarrStoreInfo:
+    """Parse consolidated Zarr v2 (.zmetadata) or v3 (zarr.json) metadata"""
+    try:
+        if 'zarr_consolidated_format' in metadata:
+            return _parse_v2_metadata(metadata)
+        if metadata.get('zarr_format') == 3:
+            return _parse_v3_metadata(metadata)
+    except (KeyError, TypeError, ValueError) as exc:
+        raise MetadataUnavailableError(f'Unable to parse consolidated metadata: {exc}') from exc
+    raise MetadataUnavailableError('Unknown consolidated metadata format')
 
 
-def get_dataset_info(url: str) -> dict[str, str]:
-    """Get the dataset info from the store"""
-    with xr.open_dataset(url, engine='zarr', chunks={}, decode_cf=False) as ds:
-        return {'size': dask.utils.format_bytes(ds.nbytes), 'cf_axes': retrieve_CF_axes(ds)}
+def inspect_zarr_store(url: str, *, cache_key: str | None = None) -> ZarrStoreInfo:
+    """Read shapes, dtypes, sizes and attributes of the store from its consolidated metadata
 
+    With a ``cache_key`` (the dataset md5_id) the metadata goes through the metadata cache.
+    """
+    if cache_key is None:
+        return parse_zarr_metadata(fetch_zarr_metadata(url))
+    return parse_zarr_metadata(get_metadata_cache().get(key=cache_key, url=url))
 
-def process_dataset(*, dataset: Dataset, rechunk_run: RechunkRun, session: Session) -> None:
-    """Validate that the store is accessible and update the dataset in the database"""
+
+def load_zarr_store_info(url: str, *, cache_key: str | None = None) -> ZarrStoreInfo:
+    """Inspect the store metadata, falling back to xarray when it cannot be parsed directly"""
     try:
-        validate_and_rechunk(dataset=dataset, session=session, rechunk_run=rechunk_run)
+        return inspect_zarr_store(url, cache_key=cache_key)
+    except MetadataUnavailableError as exc:
+        logger.info(f'Falling back to xarray to inspect {url}: {exc.message}')
+    except Exception as exc:
+        raise UnableToOpenDatasetError(f'Unable to open Zarr store: {url} due to {exc}') from exc
+
+    with open_zarr_store(url) as ds:
+        return ZarrStoreInfo.from_xarray(ds)
+
+
+def retrieve_CF_axes_from_metadata(info: ZarrStoreInfo) -> dict[str, dict[str, str]]:
+    """Retrieve the CF dimensions from the store metadata, mirroring ``retrieve_CF_axes``"""
+    return cf_axes({name: (array.dims, array.attrs) for name, array in info.arrays.items()})
+
+
+@contextlib.contextmanager
+def timed(timings: dict[str, float], phase: str):
+    """Record how long the block took, in seconds, under ``phase``"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = round(time.perf_counter() - start, 6)
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Whether a failed validation may succeed when it is attempted again"""
+    return not isinstance(exc, DatasetTooLargeError)
+
+
+def process_dataset(
+    *,
+    dataset: Dataset,
+    rechunk_run: RechunkRun,
+    session: Session,
+    retry_delay: float | None = None,
+    timeout: float | None = None,
+) -> None:
+    """Validate that the store is accessible and update the dataset in the database
+
+    When ``retry_delay`` is given, a run failing with a retryable error is queued again
+    to be attempted after ``retry_delay`` seconds instead of being marked as failed. A
+    store that cannot be read within ``timeout`` seconds completes the run as timed out.
+    """
+    try:
+        validate_and_rechunk(
+            dataset=dataset, session=session, rechunk_run=rechunk_run, timeout=timeout
+        )
+        observe_validation(
+            timings=rechunk_run.timings or {}, protocol=dataset.protocol, outcome='success'
+        )
     except Exception as exc:
         # update the rechunk run in the database
-        rechunk_run.status = "completed"
-        rechunk_run.outcome = "failure"
         trace = traceback.format_exc()
         rechunk_run.error_message = trace.splitlines()[-1]
         rechunk_run.error_message_traceback = trace
+        if isinstance(exc, ValidationTimeoutError):
+            rechunk_run.status = "completed"
+            rechunk_run.outcome = "timed_out"
+            rechunk_run.end_time = datetime.datetime.utcnow()
+        elif retry_delay is not None and is_retryable(exc):
+            rechunk_run.status = "queued"
+            rechunk_run.next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(
+                seconds=retry_delay
+            )
+            logger.warning(f'Rechunking run: {rechunk_run.id} will be retried in {retry_delay}s')
+        else:
+            rechunk_run.status = "completed"
+            rechunk_run.outcome = "failure"
+            rechunk_run.end_time = datetime.datetime.utcnow()
         _update_entry_in_db(session=session, item=rechunk_run)
+        observe_validation(
+            timings=rechunk_run.timings or {},
+            protocol=dataset.protocol,
+            outcome=rechunk_run.outcome or 'retried',
+        )
         logger.error(f'Rechunking run: {rechunk_run}\nfailed with error: {exc}')
         raise RuntimeError('Dataset processing failed.') from exc
 
 
-def validate_and_rechunk(*, dataset: Dataset, session: Session, rechunk_run: RechunkRun):
+def validate_and_rechunk(
+    *,
+    dataset: Dataset,
+    session: Session,
+    rechunk_run: RechunkRun,
+    timeout: float | None = None,
+):
     """Validate the store and rechunk the dataset"""
-    rechunk_run.status = 'in_progress'
-    _update_entry_in_db(session=session, item=rechunk_run)
+    if rechunk_run.status != 'in_progress':
+        rechunk_run.status = 'in_progress'
+        _update_entry_in_db(session=session, item=rechunk_run)
 
-    # Update the dataset in the database with the CF axes
-    ds_info = get_dataset_info(dataset.url)
-    dataset.cf_axes = ds_info['cf_axes']
-    dataset.size = ds_info['size']
-    _update_entry_in_db(session=session, item=dataset)
-    validate_zarr_store(dataset.url)
-    logger.info(f'Validation of store: {dataset.url} succeeded')
+    # Open the store once and derive everything the validation needs from its metadata
+    timings = {}
+    try:
+        with timed(timings, 'open'):
+            store = call_with_timeout(
+                load_zarr_store_info, dataset.url, cache_key=dataset.md5_id, timeout=timeout
+            )
+        with timed(timings, 'cf_axes'):
+            dataset.cf_axes = store.cf_axes
+        with timed(timings, 'size'):
+            dataset.size = store.size
+        with timed(timings, 'db_write'):
+            _update_entry_in_db(session=session, item=dataset)
+        validate_dataset_size(store)
+        with timed(timings, 'metadata_write'):
+            # keep the validated metadata for the zmetadata endpoint, stores inspected
+            # with xarray have no consolidated metadata to serve
+            get_metadata_cache().persist(dataset.md5_id)
+    finally:
+        rechunk_run.timings = timings
+    logger.info(f'Validation of store: {dataset.url} succeeded in {timings}')
 
     # NOTE: Rechunk the dataset: This is currently disabled because we are using the zarr proxy
     # to serve the data. This will be re-enabled if and when we end up with
@@ -122,6 +399,14 @@ def validate_and_rechunk(*, dataset: Dataset, session: Session, rechunk_run: Rec
     # output = subprocess.check_output(command, shell=True).decode('utf-8')
 
     # logger.info(f'Output of prefect deployment run: \n{output}')
+
+    # With the persistent rechunking disabled, a validated store is all there is to do
+    rechunk_run.status = 'completed'
+    rechunk_run.outcome = 'success'
+    rechunk_run.error_message = None
+    rechunk_run.error_message_traceback = None
+    rechunk_run.end_time = datetime.datetime.utcnow()
+    _update_entry_in_db(session=session, item=rechunk_run)
     logger.info(f'Updating of dataset: {dataset} succeeded')
 
 
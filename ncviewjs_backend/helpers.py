@@ -1,7 +1,6 @@
 import re
 
 import pydantic
-import upath
 
 from .schemas.dataset import SanitizedURL
 
@@ -24,82 +23,103 @@ def gs_to_https(*, gs_url: pydantic.AnyUrl) -> pydantic.HttpUrl:
     return gs_url.replace('gs://', 'https://storage.googleapis.com/')
 
 
-def parse_s3_url(url: str) -> tuple[str, str]:
-    bucket = None
-    key = None
+_URL = re.compile(r'([A-Za-z][A-Za-z0-9+.-]*)://([^/?#]*)([^?#]*)(.*)', re.DOTALL)
 
-    # https://bucket-name.s3.region-code.amazonaws.com/key-name
+# https://bucket.s3.amazonaws.com, https://bucket.s3.region.amazonaws.com,
+# https://bucket.s3-region.amazonaws.com and https://bucket.s3.dualstack.region.amazonaws.com
+_S3_VIRTUAL_HOST = re.compile(r'(.+)\.s3(?:[.-][^.]+)*\.amazonaws\.com')
+# https://s3.amazonaws.com/bucket, https://s3.region.amazonaws.com/bucket, ...
+_S3_PATH_STYLE_HOST = re.compile(r's3(?:[.-][^.]+)*\.amazonaws\.com')
+# https://AccessPointName-AccountId.s3-accesspoint.region.amazonaws.com
+_S3_ACCESS_POINT_HOST = re.compile(r'(.+)-[^.-]+\.s3-accesspoint\.[^.]+\.amazonaws\.com')
+# https://account.blob.core.windows.net/container/key
+_AZ_BLOB_HOST = re.compile(r'([^.]+)\.blob\.core\.windows\.net')
 
-    if match := re.search('^https?://([^.]+).s3.([^.]+).amazonaws.com(.*?)$', url):
-        bucket, key = match[1], match[3]
 
-    # https://AccessPointName-AccountId.s3-accesspoint.region.amazonaws.com.
-    if match := re.search(
-        '^https?://([^.]+)-([^.]+).s3-accesspoint.([^.]+).amazonaws.com(.*?)$', url
-    ):
-        bucket, key = match[1], match[4]
+def _split_path(path: str) -> tuple[str, str]:
+    bucket, _, key = path.lstrip('/').partition('/')
+    return bucket, key
 
-    # S3://bucket-name/key-name
-    if match := re.search('^s3://([^.]+)(.*?)$', url):
-        bucket, key = match[1], match[2]
 
-    # https://bucket-name.s3.amazonaws.com/key-name
-    if match := re.search('^https?://([^.]+).s3.amazonaws.com(.*?)$', url):
-        bucket, key = match[1], match[2]
+def _parse_s3_https(host: str, netloc: str, path: str, rest: str) -> tuple[str, str] | None:
+    # the key of the virtual-hosted forms keeps the query string
+    if match := _S3_ACCESS_POINT_HOST.fullmatch(host):
+        return match[1], path + rest
+    if _S3_PATH_STYLE_HOST.fullmatch(host):
+        return _split_path(path)
+    if match := _S3_VIRTUAL_HOST.fullmatch(host):
+        return match[1], path + rest
+    return None
 
-    return bucket, key
 
+def _parse_gs_https(host: str, netloc: str, path: str, rest: str) -> tuple[str, str] | None:
+    if host != 'storage.googleapis.com':
+        return None
+    bucket, key = _split_path(path)
+    return bucket, key + rest
 
-def parse_gs_url(url: str) -> tuple[str, str]:
-    bucket = None
-    key = None
 
-    # https://storage.googleapis.com/carbonplan-share/maps-demo/2d/prec-regrid
-    path = url.split('storage.googleapis.com/')[1]
-    bucket, key = path.split('/', 1)
-    return bucket, key
+def _parse_az_https(host: str, netloc: str, path: str, rest: str) -> tuple[str, str] | None:
+    if match := _AZ_BLOB_HOST.fullmatch(host):
+        return match[1], path + rest
+    return None
 
 
-def parse_az_url(url: str) -> tuple[str, str]:
-    bucket = None
-    key = None
+# (host suffix, parser) pairs tried in order for http(s) URLs
+_HTTP_HOSTS = (
+    ('.amazonaws.com', _parse_s3_https),
+    ('.googleapis.com', _parse_gs_https),
+    ('.blob.core.windows.net', _parse_az_https),
+)
 
-    if match := re.search('^https?://([^.]+).blob.core.windows.net(.*?)$', url):
-        bucket, key = match[1], match[2]
 
-    return bucket, key
+def _parse_http(netloc: str, path: str, rest: str) -> tuple[str, str] | None:
+    host = netloc.rpartition('@')[2].partition(':')[0].lower()
+    for suffix, parse in _HTTP_HOSTS:
+        if host.endswith(suffix):
+            return parse(host, netloc, path, rest)
+    return netloc, path
 
 
-def sanitize_url(url: pydantic.AnyUrl) -> SanitizedURL:
-    """Sanitize a URL by removing any trailing slashes and parsing it with universal_pathlib"""
+def _parse_bucket(netloc: str, path: str, rest: str) -> tuple[str, str]:
+    return netloc, path
 
-    # Remove trailing slashes
-    url = url.rstrip("/")
-    url_path = upath.UPath(url)
-    parsed_url = url_path._url
-    bucket = None
-    key = None
 
-    if parsed_url.scheme in {'http', 'https'}:
-        if 'amazonaws.com' in parsed_url.netloc:
-            bucket, key = parse_s3_url(url)
+def _parse_abfs(netloc: str, path: str, rest: str) -> tuple[str, str]:
+    # abfs://container@account.dfs.core.windows.net/key
+    return netloc.partition('@')[0], path
 
-        elif 'googleapis.com' in parsed_url.netloc:
-            bucket, key = parse_gs_url(url)
 
-        elif 'blob.core.windows.net' in parsed_url.netloc:
-            bucket, key = parse_az_url(url)
+_SCHEMES = {
+    'http': _parse_http,
+    'https': _parse_http,
+    's3': _parse_bucket,
+    'gs': _parse_bucket,
+    'az': _parse_bucket,
+    'abfs': _parse_abfs,
+}
 
-        else:
-            bucket, key = parsed_url.netloc, parsed_url.path
 
-    elif parsed_url.scheme in {'s3', 'gs', 'az', 'abfs'}:
-        bucket, key = parsed_url.netloc, parsed_url.path
+def sanitize_url(url: pydantic.AnyUrl) -> SanitizedURL:
+    """Sanitize a URL by removing any trailing slashes and splitting it into bucket and key
 
-    if parsed_url.scheme == 'gs':
-        url = gs_to_https(gs_url=url)
+    The scheme and host select the parser from a dispatch table, so a URL is matched
+    against at most one precompiled pattern.
+    """
 
-    elif parsed_url.scheme == 's3':
+    # Remove trailing slashes
+    url = url.rstrip("/")
+    match = _URL.fullmatch(url)
+    parse = match and _SCHEMES.get(match[1].lower())
+    parsed = parse and parse(match[2], match[3], match[4])
+    if not parsed or not parsed[0]:
+        raise ValueError(f'Unsupported store URL: {url}')
+
+    bucket, key = parsed
+    protocol = match[1].lower()
+    if protocol == 'gs':
+        url = gs_to_https(gs_url=url)
+    elif protocol == 's3':
         url = s3_to_https(s3_url=url)
 
-    return SanitizedURL(url=str(url), protocol=parsed_url.scheme, key=key, bucket=bucket)
+    return SanitizedURL(url=str(url), protocol=protocol, key=key, bucket=bucket)
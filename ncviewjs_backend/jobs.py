@@ -0,0 +1,289 @@
+"""Durable job queue for dataset validation built on top of the RechunkRun table.
+
+Registering a dataset inserts a ``RechunkRun`` with ``status="queued"``. Workers claim
+runs with ``SELECT ... FOR UPDATE SKIP LOCKED`` so that several workers never pick up the
+same run, hold a lease on the run while they process it and either complete it, or put it
+back in the queue with an exponential backoff when the attempt failed.
+"""
+
+import collections
+import contextlib
+import datetime
+import threading
+import typing
+import urllib.parse
+
+from sqlalchemy import func, or_, update
+from sqlmodel import Session, and_, select
+
+from .config import Settings
+from .dataset_processing import process_dataset
+from .logging import get_logger
+from .models.dataset import Dataset, Outcome, RechunkRun, Status
+from .profiling import Profiler
+
+logger = get_logger()
+
+
+def _utcnow() -> datetime.datetime:
+    # the timestamp columns store naive UTC values
+    return datetime.datetime.utcnow()
+
+
+def origin_host(url: str) -> str:
+    """Host serving the store, the bucket for object storage URLs such as s3://bucket/key"""
+    return urllib.parse.urlsplit(url).netloc or 'local'
+
+
+def origin_host_expression(url=Dataset.url):
+    """SQL version of origin_host"""
+    netloc = func.substring(url, '^[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)')
+    return func.coalesce(func.nullif(netloc, ''), 'local')
+
+
+def claim_next_run(
+    session: Session,
+    *,
+    worker_id: str,
+    lease_seconds: int,
+    exclude_hosts: typing.Collection[str] = (),
+) -> RechunkRun | None:
+    """Claim the oldest runnable run and lease it to the worker
+
+    Runnable runs are queued runs whose backoff delay has passed and in progress runs
+    whose lease expired because the worker holding them went away. Runs of stores served
+    by ``exclude_hosts`` are left to other workers, or to later claims.
+    """
+    now = _utcnow()
+    statement = (
+        select(RechunkRun)
+        .where(
+            or_(
+                and_(
+                    RechunkRun.status == Status.queued,
+                    or_(RechunkRun.next_attempt_at.is_(None), RechunkRun.next_attempt_at <= now),
+                ),
+                and_(
+                    RechunkRun.status == Status.in_progress,
+                    RechunkRun.lease_expires_at < now,
+                ),
+            )
+        )
+        .order_by(RechunkRun.id)
+        .limit(1)
+        .with_for_update(skip_locked=True, of=RechunkRun)
+    )
+    if exclude_hosts:
+        statement = statement.join(Dataset, Dataset.id == RechunkRun.dataset_id).where(
+            origin_host_expression().not_in(list(exclude_hosts))
+        )
+    run = session.exec(statement).first()
+    if run is None:
+        session.rollback()
+        return None
+
+    run.status = Status.in_progress
+    run.attempts += 1
+    run.worker_id = worker_id
+    run.lease_expires_at = now + datetime.timedelta(seconds=lease_seconds)
+    run.start_time = now
+    run.end_time = None
+    session.add(run)
+    session.commit()
+    session.refresh(run)
+    logger.info(f'Worker {worker_id} claimed rechunk run {run.id} (attempt {run.attempts})')
+    return run
+
+
+def renew_lease(session: Session, *, run_id: int, worker_id: str, lease_seconds: int) -> bool:
+    """Extend the lease of a run that is still held by the worker"""
+    result = session.exec(
+        update(RechunkRun)
+        .where(RechunkRun.id == run_id)
+        .where(RechunkRun.worker_id == worker_id)
+        .where(RechunkRun.status == Status.in_progress)
+        .values(lease_expires_at=_utcnow() + datetime.timedelta(seconds=lease_seconds))
+    )
+    session.commit()
+    return result.rowcount == 1
+
+
+def requeue_stale_runs(session: Session) -> int:
+    """Put in progress runs whose worker lease expired back in the queue
+
+    Runs in progress without a worker, such as those started by the Prefect flow, hold no
+    lease and are left alone.
+    """
+    result = session.exec(
+        update(RechunkRun)
+        .where(RechunkRun.status == Status.in_progress)
+        .where(RechunkRun.worker_id.is_not(None))
+        .where(RechunkRun.lease_expires_at < _utcnow())
+        .values(status=Status.queued, worker_id=None, lease_expires_at=None, next_attempt_at=None)
+    )
+    session.commit()
+    if result.rowcount:
+        logger.info(f'Requeued {result.rowcount} stale rechunk run(s)')
+    return result.rowcount
+
+
+def retry_delay(*, attempts: int, settings: Settings) -> float | None:
+    """Seconds to wait before the next attempt or None when the run should not be retried"""
+    if attempts >= settings.job_max_attempts:
+        return None
+    return min(settings.job_retry_backoff * 2 ** (attempts - 1), settings.job_retry_backoff_max)
+
+
+def execute_run(session: Session, *, run: RechunkRun, settings: Settings) -> None:
+    """Process a claimed run and release its lease"""
+    worker_id = run.worker_id
+    dataset = session.get(Dataset, run.dataset_id)
+    profiler = Profiler() if run.profiling else None
+    try:
+        with profiler or contextlib.nullcontext():
+            process_dataset(
+                dataset=dataset,
+                rechunk_run=run,
+                session=session,
+                retry_delay=retry_delay(attempts=run.attempts, settings=settings),
+                timeout=settings.job_timeout,
+            )
+    except RuntimeError:
+        logger.info(f'Rechunk run {run.id} attempt {run.attempts} failed')
+    finally:
+        if profiler is not None and profiler.summary is not None:
+            # the profile of the latest attempt
+            run.profile = profiler.summary
+        session.add(run)
+        session.commit()
+        # the lease may have expired and the run been claimed by another worker meanwhile
+        session.exec(
+            update(RechunkRun)
+            .where(RechunkRun.id == run.id)
+            .where(RechunkRun.worker_id == worker_id)
+            .values(worker_id=None, lease_expires_at=None)
+        )
+        session.commit()
+        session.refresh(run)
+
+
+def queue_stats(session: Session, *, window: float = 3600) -> dict[str, typing.Any]:
+    """Depth of the queue and latency of the runs completed in the last ``window`` seconds"""
+    now = _utcnow()
+    since = now - datetime.timedelta(seconds=window)
+    queued = RechunkRun.status == Status.queued
+    runnable = and_(
+        queued, or_(RechunkRun.next_attempt_at.is_(None), RechunkRun.next_attempt_at <= now)
+    )
+    recent = and_(RechunkRun.end_time > since, RechunkRun.start_time.is_not(None))
+    duration = func.extract('epoch', RechunkRun.end_time - RechunkRun.start_time)
+    row = session.exec(
+        select(
+            func.count().filter(runnable),
+            func.count().filter(and_(queued, ~runnable)),
+            func.count().filter(RechunkRun.status == Status.in_progress),
+            # queued runs are left untouched from the time they are queued until claimed
+            func.min(RechunkRun.updated_at).filter(runnable),
+            func.count().filter(recent),
+            func.count().filter(and_(recent, RechunkRun.outcome == Outcome.timed_out)),
+            func.percentile_cont(0.5).within_group(duration).filter(recent),
+            func.percentile_cont(0.95).within_group(duration).filter(recent),
+        ).where(
+            or_(
+                RechunkRun.status.in_([Status.queued, Status.in_progress]),
+                RechunkRun.end_time > since,
+            )
+        )
+    ).one()
+    runnable_count, delayed, in_progress, oldest, completed, timed_out, p50, p95 = row
+    return {
+        'queued': runnable_count,
+        'delayed': delayed,
+        'in_progress': in_progress,
+        'oldest_queued_seconds': (now - oldest).total_seconds() if oldest else None,
+        'completed': completed,
+        'timed_out': timed_out,
+        'duration_p50_seconds': p50,
+        'duration_p95_seconds': p95,
+    }
+
+
+class HostLimiter:
+    """Count the runs in progress per origin host, so that one slow host cannot hold all
+    the threads of a worker
+
+    The reads abandoned by runs that timed out keep the slot of their run until their
+    thread finishes, so a hanging host never has more than ``limit`` reads in flight.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._counts: collections.Counter[str] = collections.Counter()
+        self._abandoned: collections.defaultdict[str, list[threading.Thread]] = (
+            collections.defaultdict(list)
+        )
+        self._lock = threading.Lock()
+
+    def _in_flight(self) -> collections.Counter[str]:
+        # caller holds the lock
+        counts = collections.Counter(self._counts)
+        for host, threads in list(self._abandoned.items()):
+            threads[:] = [thread for thread in threads if thread.is_alive()]
+            if threads:
+                counts[host] += len(threads)
+            else:
+                del self._abandoned[host]
+        return counts
+
+    def saturated(self) -> set[str]:
+        with self._lock:
+            return {host for host, count in self._in_flight().items() if count >= self.limit}
+
+    def acquire(self, host: str) -> None:
+        with self._lock:
+            self._counts[host] += 1
+
+    def release(self, host: str, *, abandoned: typing.Iterable[threading.Thread] = ()) -> None:
+        """Release the slot of a run, held on by the ``abandoned`` threads still running"""
+        with self._lock:
+            self._counts[host] -= 1
+            if self._counts[host] <= 0:
+                del self._counts[host]
+            self._abandoned[host].extend(thread for thread in abandoned if thread.is_alive())
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._in_flight())
+
+
+class LeaseKeeper:
+    """Keep renewing the lease of a run in a background thread while it is being processed"""
+
+    def __init__(self, *, engine, run_id: int, worker_id: str, lease_seconds: int):
+        self.engine = engine
+        self.run_id = run_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._renew, name=f'lease-{run_id}', daemon=True)
+
+    def _renew(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                with Session(self.engine) as session:
+                    renew_lease(
+                        session,
+                        run_id=self.run_id,
+                        worker_id=self.worker_id,
+                        lease_seconds=self.lease_seconds,
+                    )
+            except Exception as exc:
+                logger.error(f'Unable to renew lease of rechunk run {self.run_id}: {exc}')
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
@@ -3,8 +3,15 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .api import datasets, health, runs
+from .access_tracking import get_access_tracker, stop_access_tracker
+from .api import datasets, health, metrics, runs
+from .chunk_proxy import close_chunk_proxy
+from .config import Settings, get_settings
+from .database import dispose_async_engine, dispose_engine, init_async_engine, init_engine
 from .logging import get_logger
+from .metrics import MetricsMiddleware, instrument_database
+from .profiling import ProfilingMiddleware
+from .run_events import close_run_event_broadcaster
 
 logger = get_logger()
 
@@ -12,12 +19,26 @@ logger = get_logger()
 @asynccontextmanager
 async def lifespan_event(app: FastAPI):
     logger.info("Application startup...")
+    settings = app.state.settings
+    if settings.database_url is not None:
+        instrument_database()
+        init_engine(settings)
+        if settings.async_database:
+            init_async_engine(settings)
+        get_access_tracker(settings).start()
     yield
     logger.info("Application shutdown...")
+    stop_access_tracker()
+    await close_run_event_broadcaster()
+    close_chunk_proxy()
+    await dispose_async_engine()
+    dispose_engine()
 
 
-def create_application() -> FastAPI:
+def create_application(settings: Settings | None = None) -> FastAPI:
+    settings = settings or get_settings()
     application = FastAPI(lifespan=lifespan_event)
+    application.state.settings = settings
     # TODO: figure out how to set origins to only the frontend domain
     # in the meantime, we can allow everything.
     # in the future we can set origins to any port on localhost and vercel domains
@@ -28,8 +49,20 @@ def create_application() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # let the frontend read the pagination and caching headers
+        expose_headers=["X-Next-Cursor", "Link", "ETag", "Last-Modified"],
     )
+    application.add_middleware(MetricsMiddleware)
+    if settings.profiling_enabled:
+        application.add_middleware(ProfilingMiddleware)
     application.include_router(health.router, tags=["health"], prefix='/health')
+    application.include_router(metrics.router, tags=["health"], prefix='/metrics')
+    if settings.async_database:
+        # The async routes are registered first so that they take precedence over their
+        # sync counterparts; endpoints without an async version fall through to the sync routers
+        logger.info("Serving dataset and run endpoints with the async database layer")
+        application.include_router(datasets.async_router, tags=["datasets"], prefix="/datasets")
+        application.include_router(runs.async_router, tags=["runs"], prefix="/runs")
     application.include_router(datasets.router, tags=["datasets"], prefix="/datasets")
     application.include_router(runs.router, tags=["runs"], prefix="/runs")
     return application
@@ -0,0 +1,304 @@
+import collections
+import datetime
+import hashlib
+import json
+import threading
+import time
+import typing
+
+import fsspec
+import httpx
+import pydantic
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from .config import Settings, get_settings
+from .database import get_engine
+from .logging import get_logger
+from .models.dataset import StoreMetadata
+from .singleflight import SingleFlight
+
+logger = get_logger()
+
+CONSOLIDATED_METADATA_KEYS = ('.zmetadata', 'zarr.json')
+
+_cache: typing.Optional['MetadataCache'] = None
+_cache_lock = threading.Lock()
+
+
+class MetadataUnavailableError(Exception):
+    """Exception raised when the store has no consolidated metadata that can be parsed"""
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+class CachedMetadata(pydantic.BaseModel):
+    """Consolidated metadata of a store along with the validators needed to revalidate it"""
+
+    url: str
+    document_url: str | None = None
+    consolidated_metadata: dict
+    etag: str | None = None
+    last_modified: str | None = None
+    fetched_at: float
+    # written to the storemetadata table, whose row is marked stale when the entry is invalidated
+    persisted: bool = False
+
+
+def fetch_zarr_metadata(url: str) -> dict:
+    """Fetch the consolidated metadata document of the store"""
+    fs, path = fsspec.core.url_to_fs(url)
+    path = path.rstrip('/')
+    for name in CONSOLIDATED_METADATA_KEYS:
+        try:
+            return json.loads(fs.cat_file(f'{path}/{name}'))
+        except FileNotFoundError:
+            continue
+    raise MetadataUnavailableError(f'No consolidated metadata found in {url}')
+
+
+def serialize_metadata(document: dict) -> bytes:
+    """Compact JSON encoding of a consolidated metadata document, as served by the API"""
+    return json.dumps(document, separators=(',', ':')).encode()
+
+
+def metadata_digest(document: dict) -> str:
+    return hashlib.md5(serialize_metadata(document)).hexdigest()
+
+
+class MetadataCache:
+    """Bounded LRU cache of consolidated store metadata keyed by the dataset md5_id
+
+    Entries younger than ``ttl`` seconds are served without contacting the store. Older
+    entries are revalidated with a conditional GET (``If-None-Match``/``If-Modified-Since``)
+    so that an unchanged store costs a single 304 round-trip. Fetched metadata is kept in
+    the memory of the process until ``persist`` writes it to the ``storemetadata`` table,
+    once the store passed validation. With ``shared=True`` processes also reuse the
+    validated metadata persisted by the others.
+
+    Invalidation marks the ``storemetadata`` row of the store stale, whatever the process:
+    the API invalidates entries cached by the worker validating the stores. The row is
+    still served by the zmetadata and chunk endpoints until the metadata is fetched again.
+    Entries persisted in the table are only served from memory while their row is fresh,
+    otherwise the metadata is fetched again. Entries never persisted, those of stores that
+    failed validation, expire with their ``ttl``.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = 256,
+        ttl: float = 300,
+        shared: bool = False,
+        client: httpx.Client | None = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self.client = client or httpx.Client(timeout=30, follow_redirects=True)
+        self._entries: collections.OrderedDict[str, CachedMetadata] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.refreshes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _is_fresh(self, entry: CachedMetadata) -> bool:
+        return time.time() - entry.fetched_at < self.ttl
+
+    def _put(self, key: str, entry: CachedMetadata) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, *, key: str, url: str) -> dict:
+        """Return the consolidated metadata of the store at ``url``"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry.persisted and not self._shared_fresh(key):
+            # invalidated, possibly by another process
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            entry = None
+        if entry is not None and entry.url == url and self._is_fresh(entry):
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                self.hits += 1
+            return entry.consolidated_metadata
+
+        if entry is None and self.shared:
+            entry = self._load_shared(key)
+            if entry is not None and entry.url == url and self._is_fresh(entry):
+                self.shared_hits += 1
+                self._put(key, entry)
+                return entry.consolidated_metadata
+
+        if entry is not None and entry.url != url:
+            entry = None
+        # concurrent misses of the same store share a single fetch
+        return self._flights.do((key, url), lambda: self._refresh(key, url, entry))
+
+    def _refresh(self, key: str, url: str, entry: CachedMetadata | None) -> dict:
+        fetched = self._fetch(url, entry)
+        if fetched is None:
+            # not modified: the cached document is still valid
+            self.revalidations += 1
+            entry = entry.model_copy(update={'fetched_at': time.time()})
+        else:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.refreshes += 1
+            entry = fetched
+
+        self._put(key, entry)
+        return entry.consolidated_metadata
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+        self._mark_stale(key)
+        logger.info(f'Invalidated cached metadata of {key}')
+
+    def persist(self, key: str) -> bool:
+        """Write the cached entry to the storemetadata table, once the store is validated
+
+        The zmetadata and chunk endpoints serve validated metadata from that table.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return False
+        self._store_shared(key, entry)
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self._entries[key] = entry.model_copy(update={'persisted': True})
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'refreshes': self.refreshes,
+            'coalesced': self._flights.coalesced,
+        }
+
+    def _fetch(self, url: str, entry: CachedMetadata | None) -> CachedMetadata | None:
+        """Fetch the metadata, returning None when the cached entry is still valid"""
+        if not url.startswith(('http://', 'https://')):
+            # conditional requests are only possible over HTTP
+            return CachedMetadata(
+                url=url, consolidated_metadata=fetch_zarr_metadata(url), fetched_at=time.time()
+            )
+
+        candidates = (
+            [entry.document_url]
+            if entry is not None and entry.document_url
+            else [f'{url}/{name}' for name in CONSOLIDATED_METADATA_KEYS]
+        )
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        for document_url in candidates:
+            response = self.client.get(document_url, headers=headers)
+            if response.status_code == 304:
+                return None
+            if response.status_code == 404:
+                continue
+            response.raise_for_status()
+            return CachedMetadata(
+                url=url,
+                document_url=document_url,
+                consolidated_metadata=response.json(),
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                fetched_at=time.time(),
+            )
+        raise MetadataUnavailableError(f'No consolidated metadata found in {url}')
+
+    def _load_shared(self, key: str) -> CachedMetadata | None:
+        with Session(get_engine()) as session:
+            row = session.get(StoreMetadata, key)
+            if row is None or row.stale:
+                return None
+            return CachedMetadata(
+                url=row.url,
+                document_url=row.document_url,
+                consolidated_metadata=row.consolidated_metadata,
+                etag=row.etag,
+                last_modified=row.last_modified,
+                fetched_at=row.fetched_at.replace(tzinfo=datetime.timezone.utc).timestamp(),
+                persisted=True,
+            )
+
+    def _shared_fresh(self, key: str) -> bool:
+        with Session(get_engine()) as session:
+            stale = session.exec(
+                select(StoreMetadata.stale).where(StoreMetadata.md5_id == key)
+            ).first()
+            return stale is False
+
+    def _store_shared(self, key: str, entry: CachedMetadata) -> None:
+        with Session(get_engine()) as session:
+            session.merge(
+                StoreMetadata(
+                    md5_id=key,
+                    url=entry.url,
+                    document_url=entry.document_url,
+                    consolidated_metadata=entry.consolidated_metadata,
+                    digest=metadata_digest(entry.consolidated_metadata),
+                    etag=entry.etag,
+                    last_modified=entry.last_modified,
+                    fetched_at=datetime.datetime.utcfromtimestamp(entry.fetched_at),
+                    stale=False,
+                )
+            )
+            session.commit()
+
+    def _mark_stale(self, key: str) -> None:
+        with Session(get_engine()) as session:
+            session.exec(
+                update(StoreMetadata).where(StoreMetadata.md5_id == key).values(stale=True)
+            )
+            session.commit()
+
+
+def get_metadata_cache(settings: Settings | None = None) -> MetadataCache:
+    """Return the process-wide metadata cache, creating it from the settings if needed"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            settings = settings or get_settings()
+            _cache = MetadataCache(
+                max_entries=settings.metadata_cache_size,
+                ttl=settings.metadata_cache_ttl,
+                shared=settings.metadata_cache_shared,
+            )
+        return _cache
+
+
+def get_metadata_cache_stats() -> dict[str, int] | None:
+    """Return the cache counters or None if no cache has been created"""
+    return None if _cache is None else _cache.stats()
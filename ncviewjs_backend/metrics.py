@@ -0,0 +1,199 @@
+"""Prometheus metrics of the API and of the validation worker.
+
+Request latencies are recorded by ``MetricsMiddleware``, database statements by
+SQLAlchemy event hooks installed on all engines, and validation phases by
+``observe_validation``. Pool utilization and queue depth are read when the metrics are
+scraped. The API serves the metrics at ``/metrics``; the worker, a separate process,
+serves its own on ``settings.worker_metrics_port``.
+
+The API runs in several gunicorn worker processes. ``gunicorn.conf.py`` sets
+``PROMETHEUS_MULTIPROC_DIR``, where each process writes its counters and histograms, and
+``/metrics`` serves them summed over the processes. The gauges read when the metrics are
+scraped are those of the process serving the scrape, the queue depth is database-wide.
+"""
+
+import os
+import time
+import typing
+
+import sqlalchemy
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlmodel import Session
+
+from .logging import get_logger
+
+logger = get_logger()
+
+__all__ = ['CONTENT_TYPE_LATEST', 'generate_latest', 'start_http_server']
+
+REQUEST_DURATION = Histogram(
+    'ncviewjs_http_request_duration_seconds',
+    'Time spent handling HTTP requests',
+    ['method', 'route', 'status'],
+)
+DB_QUERIES = Counter('ncviewjs_db_queries_total', 'Database statements executed', ['operation'])
+DB_QUERY_DURATION = Histogram(
+    'ncviewjs_db_query_duration_seconds',
+    'Time spent executing database statements',
+    ['operation'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+VALIDATION_PHASE_DURATION = Histogram(
+    'ncviewjs_validation_phase_duration_seconds',
+    'Time spent in each phase of a dataset validation',
+    ['phase', 'protocol', 'outcome'],
+)
+
+_OPERATIONS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'}
+
+
+def _operation(statement: str) -> str:
+    words = statement.split(maxsplit=1)
+    keyword = words[0].upper() if words else ''
+    return keyword if keyword in _OPERATIONS else 'OTHER'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start_time')
+    if not starts:
+        # the statement started before the listeners were installed
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    operation = _operation(statement)
+    DB_QUERIES.labels(operation).inc()
+    DB_QUERY_DURATION.labels(operation).observe(elapsed)
+
+
+def _handle_error(context) -> None:
+    # failed statements never reach after_cursor_execute, drop their start time so that
+    # the next statements on the pooled connection are not timed from it
+    if context.connection is None or context.execution_context is None:
+        return
+    if starts := context.connection.info.get('query_start_time'):
+        starts.pop()
+
+
+def instrument_database() -> None:
+    """Time the statements of every engine, the async engines included"""
+    if not sqlalchemy.event.contains(
+        sqlalchemy.Engine, 'before_cursor_execute', _before_cursor_execute
+    ):
+        sqlalchemy.event.listen(sqlalchemy.Engine, 'before_cursor_execute', _before_cursor_execute)
+        sqlalchemy.event.listen(sqlalchemy.Engine, 'after_cursor_execute', _after_cursor_execute)
+        sqlalchemy.event.listen(sqlalchemy.Engine, 'handle_error', _handle_error)
+
+
+def observe_validation(*, timings: dict[str, float], protocol: str, outcome: str) -> None:
+    for phase, seconds in timings.items():
+        VALIDATION_PHASE_DURATION.labels(phase, protocol, outcome).observe(seconds)
+
+
+class MetricsMiddleware:
+    """Record the latency of each request, labelled by the route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # the router stores the matched route in the scope, paths without a
+            # route are grouped so that the label values stay bounded
+            route = scope.get('route')
+            REQUEST_DURATION.labels(
+                scope['method'], route.path if route is not None else 'unmatched', str(status)
+            ).observe(time.perf_counter() - start)
+
+
+class StatsCollector(Collector):
+    """Gauges read from the pool, queue and cache statistics when the metrics are scraped"""
+
+    def describe(self) -> list:
+        # keeps the registry from collecting (and querying the database) on registration
+        return []
+
+    def collect(self) -> typing.Iterator[GaugeMetricFamily]:
+        from .access_tracking import get_access_tracker_stats
+        from .database import get_async_pool_stats, get_engine, get_pool_stats
+        from .jobs import queue_stats
+
+        sync_pool = get_pool_stats()
+        pool = GaugeMetricFamily(
+            'ncviewjs_db_pool_connections',
+            'Connections of the database pools',
+            labels=['pool', 'state'],
+        )
+        for name, stats in (('sync', sync_pool), ('async', get_async_pool_stats())):
+            if stats is not None:
+                pool.add_metric([name, 'size'], stats['size'])
+                pool.add_metric([name, 'checked_out'], stats['checked_out'])
+                pool.add_metric([name, 'overflow'], stats['overflow'])
+        yield pool
+
+        if sync_pool is not None:
+            queue = GaugeMetricFamily(
+                'ncviewjs_validation_queue_runs', 'Rechunk runs by queue state', labels=['state']
+            )
+            try:
+                with Session(get_engine()) as session:
+                    stats = queue_stats(session)
+            except sqlalchemy.exc.SQLAlchemyError as exc:
+                logger.warning(f'Unable to read the validation queue: {exc}')
+            else:
+                for state in ('queued', 'delayed', 'in_progress'):
+                    queue.add_metric([state], stats[state])
+                yield queue
+                yield GaugeMetricFamily(
+                    'ncviewjs_validation_queue_oldest_seconds',
+                    'Age of the oldest runnable queued run',
+                    value=stats['oldest_queued_seconds'] or 0,
+                )
+
+        if (tracker := get_access_tracker_stats()) is not None:
+            yield GaugeMetricFamily(
+                'ncviewjs_access_tracker_pending',
+                'Dataset accesses buffered until the next flush',
+                value=tracker['pending'],
+            )
+
+
+_collector = StatsCollector()
+REGISTRY.register(_collector)
+
+
+def metrics_registry() -> CollectorRegistry:
+    """Registry the metrics of the process, or of all the processes of the API, are read from"""
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_collector)
+    return registry
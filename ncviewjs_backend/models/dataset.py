@@ -1,7 +1,9 @@
 import datetime
 import enum
+import typing
 
 import pydantic
+import sqlalchemy
 from sqlmodel import JSON, Column, Field, Relationship, SQLModel
 
 
@@ -22,23 +24,46 @@ class Outcome(str, enum.Enum):
     timed_out = "timed_out"
 
 
+def as_naive_utc(value: datetime.datetime | None) -> datetime.datetime | None:
+    # The database columns store naive UTC timestamps
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
 class RechunkingRecord(pydantic.BaseModel):
     path: str
     use_case: str
+    # time steps of the source already rechunked to the path, new time steps are appended
+    # by the incremental mode of the rechunk flow
+    time_dim: str | None = None
+    time_steps: int | None = None
+    # encoded value of the last time step, to detect sources whose history was rewritten
+    last_time: float | int | str | None = None
+    # pyramid level of the path, resolution halved along X and Y at every level
+    level: int | None = None
+
+    @pydantic.model_serializer(mode='wrap')
+    def drop_unset_fields(self, handler) -> dict:
+        # records of full rechunks are serialized as they always were
+        return {key: value for key, value in handler(self).items() if value is not None}
 
 
 class DatasetBase(SQLModel):
     url: str
-    md5_id: str
-    protocol: str
+    md5_id: str = Field(index=True, unique=True)
+    protocol: str = Field(index=True)
     key: str
-    bucket: str
+    bucket: str = Field(index=True)
     cf_axes: dict[str, dict] | None = Field(default={}, sa_column=Column(JSON))
     last_accessed: datetime.datetime | None = Field(
-        default_factory=datetime.datetime.utcnow, nullable=True
+        default_factory=datetime.datetime.utcnow, nullable=True, index=True
     )
-    created: datetime.datetime | None = Field(
-        default_factory=datetime.datetime.utcnow, nullable=True
+    # never NULL: the (created, id) keyset pagination would skip such rows
+    created: datetime.datetime = Field(
+        default_factory=datetime.datetime.utcnow,
+        nullable=False,
+        sa_column_kwargs={"server_default": sqlalchemy.text("timezone('utc', now())")},
     )
     size: str | None = None
     rechunking: list[RechunkingRecord] | None = Field(
@@ -47,8 +72,16 @@ class DatasetBase(SQLModel):
 
 
 class Dataset(DatasetBase, table=True):
+    # keyset pagination orders by (created, id), see api.pagination
+    __table_args__ = (sqlalchemy.Index('ix_dataset_created_id', 'created', 'id'),)
+
     id: int | None = Field(default=None, primary_key=True)
     rechunk_runs: list["RechunkRun"] = Relationship(back_populates="dataset")
+    # bumped by every update of the row, the ETags of the read endpoints derive from it
+    updated_at: datetime.datetime | None = Field(
+        default_factory=datetime.datetime.utcnow,
+        sa_column_kwargs={"onupdate": datetime.datetime.utcnow},
+    )
 
 
 class DatasetRead(DatasetBase):
@@ -58,17 +91,48 @@ class DatasetRead(DatasetBase):
 class RechunkRunBase(SQLModel):
     error_message: str | None
     error_message_traceback: str | None
-    status: Status = Status.queued
-    outcome: Outcome | None = None
+    # The columns are plain strings in the database (see migrations), so the enums
+    # must not be sent as native postgres enum types
+    status: Status = Field(
+        default=Status.queued, sa_type=sqlalchemy.Enum(Status, native_enum=False)
+    )
+    outcome: Outcome | None = Field(
+        default=None, sa_type=sqlalchemy.Enum(Outcome, native_enum=False), index=True
+    )
     rechunked_dataset: str | None = None
     start_time: datetime.datetime | None = None
-    end_time: datetime.datetime | None = None
+    # the latency metrics of jobs.queue_stats read the recently completed runs
+    end_time: datetime.datetime | None = Field(default=None, index=True)
+    # seconds spent in each validation phase
+    timings: dict[str, float] | None = Field(default=None, sa_column=Column(JSON))
+    # percentage of the rechunking done, reported by the rechunk flow
+    progress: float | None = None
+    # codecs benchmarked on sample chunks of each variable, see ncviewjs_backend.compression
+    codec_benchmark: dict[str, dict] | None = Field(default=None, sa_column=Column(JSON))
 
 
 class RechunkRun(RechunkRunBase, table=True):
+    __table_args__ = (
+        sqlalchemy.Index('ix_rechunkrun_status_next_attempt_at', 'status', 'next_attempt_at'),
+        # the latest run of a dataset is read from this index, see api.datasets
+        sqlalchemy.Index('ix_rechunkrun_dataset_id_id', 'dataset_id', 'id'),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     dataset: Dataset | None = Relationship(back_populates="rechunk_runs")
     dataset_id: int | None = Field(default=None, foreign_key="dataset.id")
+    # job queue bookkeeping, see ncviewjs_backend.jobs
+    attempts: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    next_attempt_at: datetime.datetime | None = None
+    lease_expires_at: datetime.datetime | None = None
+    worker_id: str | None = None
+    # opt-in profiling of the validation, see ncviewjs_backend.profiling
+    profiling: bool = Field(default=False, sa_column_kwargs={"server_default": "false"})
+    profile: dict | None = Field(default=None, sa_column=Column(JSON))
+    updated_at: datetime.datetime | None = Field(
+        default_factory=datetime.datetime.utcnow,
+        sa_column_kwargs={"onupdate": datetime.datetime.utcnow},
+    )
 
 
 class RechunkRunRead(RechunkRunBase):
@@ -85,20 +149,62 @@ class DatasetWithRechunkRuns(DatasetRead):
 
 
 class RechunkRunPayload(pydantic.BaseModel):
-    start_time: datetime.datetime | None
-    end_time: datetime.datetime | None
-    rechunked_dataset: str | None
-    error_message: str | None
-    error_message_traceback: str | None
-    status: Status | None
-    outcome: Outcome | None
+    """Fields of a rechunk run to update, the fields left out are unchanged"""
+
+    start_time: datetime.datetime | None = None
+    end_time: datetime.datetime | None = None
+    rechunked_dataset: str | None = None
+    error_message: str | None = None
+    error_message_traceback: str | None = None
+    status: Status | None = None
+    outcome: Outcome | None = None
+    progress: float | None = pydantic.Field(default=None, ge=0, le=100)
+    codec_benchmark: dict[str, dict] | None = None
+
+    @pydantic.field_validator('start_time', 'end_time')
+    def as_naive_utc(cls, value: datetime.datetime | None) -> datetime.datetime | None:
+        return as_naive_utc(value)
 
     @pydantic.model_validator(mode='before')
     def update_dataset_url(cls, values) -> dict:
         from ..helpers import s3_to_https
 
         for item in {'rechunked_dataset'}:
-            if values[item] is not None and values[item].startswith('s3://'):
+            if values.get(item) is not None and values[item].startswith('s3://'):
                 values[item] = s3_to_https(s3_url=values[item])
 
         return values
+
+
+class RechunkRunStatus(pydantic.BaseModel):
+    """Status of a rechunk run, as pushed to the clients waiting on it"""
+
+    id: int
+    dataset_id: int | None
+    status: Status
+    outcome: Outcome | None = None
+
+
+class DatasetRegistration(pydantic.BaseModel):
+    """Outcome of the registration of one store of a batch"""
+
+    url: str
+    status: typing.Literal['created', 'exists', 'requeued', 'invalid']
+    dataset: DatasetRead | None = None
+    detail: str | None = None
+
+
+class StoreMetadata(SQLModel, table=True):
+    """Consolidated metadata of a store, shared by all processes (see metadata_cache)"""
+
+    md5_id: str = Field(primary_key=True)
+    url: str
+    document_url: str | None = None
+    consolidated_metadata: dict = Field(sa_column=Column(JSON, nullable=False))
+    # md5 of the document as served by the zmetadata endpoint, used as its ETag
+    digest: str | None = None
+    etag: str | None = None
+    last_modified: str | None = None
+    fetched_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
+    # set when the cache is invalidated: the row is still served until it is fetched again
+    stale: bool = Field(default=False, sa_column_kwargs={"server_default": "false"})
@@ -0,0 +1,198 @@
+"""Opt-in profiling of requests and validation jobs.
+
+``Profiler`` samples the Python stacks of the process at a fixed interval and traces
+allocations with ``tracemalloc`` while the block runs, then reduces them to a compact
+summary: the frames seen most often, the peak of traced memory and the largest allocation
+sites. Both the sampling and ``tracemalloc`` cover the whole process, so frames and
+allocations of work running concurrently show up in the profile too, and only one block is
+profiled at a time; a block started while another one is profiled runs unprofiled.
+
+Jobs are profiled when their run is registered with ``profile`` (see ``jobs.execute_run``),
+requests when they carry the ``X-Profile`` header (see ``ProfilingMiddleware``). Both are
+only available with ``settings.profiling_enabled``.
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import typing
+import uuid
+
+from .logging import get_logger
+
+logger = get_logger()
+
+PROFILE_HEADER = 'x-profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+# leaf frames of threads blocked waiting for work, which say nothing about where time goes
+_IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('selectors.py', 'select'),
+    ('queue.py', 'get'),
+    ('socket.py', 'accept'),
+}
+
+_active = threading.Lock()
+
+
+def _frame_label(code) -> tuple[str, str]:
+    return os.path.basename(code.co_filename), code.co_name
+
+
+class Profiler:
+    """Sample the stacks and trace the allocations of the process while the block runs"""
+
+    def __init__(self, *, interval: float = 0.005, top: int = 20):
+        self.interval = interval
+        self.top = top
+        self.summary: dict[str, typing.Any] | None = None
+        self._self_samples: collections.Counter[str] = collections.Counter()
+        self._total_samples: collections.Counter[str] = collections.Counter()
+        self._samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._started_tracing = False
+        self._start = 0.0
+
+    @property
+    def active(self) -> bool:
+        """Whether the block is being profiled"""
+        return self._thread is not None
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own or _frame_label(frame.f_code) in _IDLE_FRAMES:
+                    continue
+                self._samples += 1
+                leaf = True
+                seen = set()
+                while frame is not None:
+                    code = frame.f_code
+                    label = f'{code.co_filename}:{code.co_firstlineno} {code.co_name}'
+                    if leaf:
+                        self._self_samples[label] += 1
+                        leaf = False
+                    # recursive functions are counted once per sample
+                    if label not in seen:
+                        seen.add(label)
+                        self._total_samples[label] += 1
+                    frame = frame.f_back
+
+    def __enter__(self) -> 'Profiler':
+        if not _active.acquire(blocking=False):
+            logger.info('Another profile is in progress, running without profiling')
+            return self
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if not self.active:
+            return
+        try:
+            self._stop.set()
+            self._thread.join()
+            duration = time.perf_counter() - self._start
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                [
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__),
+                ]
+            )
+            if self._started_tracing:
+                tracemalloc.stop()
+        finally:
+            _active.release()
+
+        self.summary = {
+            'duration_seconds': round(duration, 6),
+            'samples': self._samples,
+            'interval_seconds': self.interval,
+            # the hot spots, frames running code themselves rather than waiting on callees
+            'top_frames': [
+                {
+                    'frame': label,
+                    'self_samples': count,
+                    'total_samples': self._total_samples[label],
+                }
+                for label, count in self._self_samples.most_common(self.top)
+            ],
+            'peak_memory_bytes': peak,
+            'allocations': [
+                {
+                    'site': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+                    'size_bytes': stat.size,
+                    'count': stat.count,
+                }
+                for stat in snapshot.statistics('lineno')[: self.top]
+            ],
+        }
+
+
+class RecentProfiles:
+    """The last profiles of requests, kept in memory until they are looked up"""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries: collections.OrderedDict[str, dict] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile_id: str, summary: dict) -> None:
+        with self._lock:
+            self._entries[profile_id] = summary
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, profile_id: str) -> dict | None:
+        with self._lock:
+            return self._entries.get(profile_id)
+
+
+recent_profiles = RecentProfiles()
+
+
+class ProfilingMiddleware:
+    """Profile the requests sent with the ``X-Profile`` header
+
+    The id of the profile is returned in the ``X-Profile-Id`` header, the summary is served
+    by ``GET /health/profiles/{profile_id}`` once the response is complete.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not any(
+            name == PROFILE_HEADER.encode() for name, _ in scope['headers']
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        profiler = Profiler()
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start' and profiler.active:
+                message['headers'] = [
+                    *message.get('headers', []),
+                    (PROFILE_ID_HEADER.encode(), profile_id.encode()),
+                ]
+            await send(message)
+
+        with profiler:
+            await self.app(scope, receive, send_wrapper)
+        if profiler.summary is not None:
+            recent_profiles.add(profile_id, profiler.summary)
+            logger.info(f'Profiled {scope["method"]} {scope["path"]} as {profile_id}')
@@ -0,0 +1,170 @@
+"""Coarsened pyramid levels of rechunked stores, for the viewer to read at low zoom.
+
+Level ``n`` halves the resolution of level ``n - 1`` along the X and Y axes found by the
+CF axis detection (see ``cf_axes``), by averaging 2x2 cells (``mean``) or keeping one cell
+out of four (``nearest``). Integer variables, typically packed or categorical, are always
+downsampled with ``nearest``. Levels are computed from the previous one block by block with
+the pool of a ``StreamingRechunker``, one output chunk per block, and written next to the
+full resolution store as the subgroups ``pyramid/1``, ``pyramid/2``, ... of a multiscale
+group. They keep the chunks of the full resolution variables.
+"""
+
+import functools
+import math
+import typing
+import warnings
+
+import numpy as np
+import pydantic
+import zarr
+
+from .logging import get_logger
+from .rechunking import StreamingRechunker, copy_block, create_like
+
+logger = get_logger()
+
+PYRAMID_GROUP = 'pyramid'
+PYRAMID_USE_CASE = 'ncview-pyramid'
+
+Method = typing.Literal['mean', 'nearest']
+
+
+class PyramidLevel(pydantic.BaseModel):
+    level: int
+    path: str
+
+    @property
+    def factor(self) -> int:
+        return 2**self.level
+
+
+def coarsened_dims(cf_axes: dict[str, dict[str, str]]) -> set[str]:
+    """Dimensions of the X and Y axes of the variables"""
+    return {axes[axis] for axes in cf_axes.values() for axis in ('X', 'Y') if axis in axes}
+
+
+def _fill_value(array: zarr.Array):
+    return array.fill_value if array.fill_value is not None else array.attrs.get('_FillValue')
+
+
+def coarsen(
+    data: np.ndarray, *, axes: tuple[int, ...], method: Method, fill_value=None
+) -> np.ndarray:
+    """Halve the resolution of the data along ``axes``, odd edges keep a single cell"""
+    if method == 'nearest' or data.dtype.kind not in 'fc':
+        return data[
+            tuple(
+                slice(None, None, 2) if axis in axes else slice(None) for axis in range(data.ndim)
+            )
+        ]
+
+    values = data.astype('f8')
+    missing = fill_value is not None and not np.isnan(fill_value)
+    if missing:
+        values[data == fill_value] = np.nan
+    values = np.pad(
+        values,
+        [(0, size % 2 if axis in axes else 0) for axis, size in enumerate(data.shape)],
+        constant_values=np.nan,
+    )
+    shape, reduced = [], []
+    for axis, size in enumerate(values.shape):
+        if axis in axes:
+            shape += [size // 2, 2]
+            reduced.append(len(shape) - 1)
+        else:
+            shape.append(size)
+    with warnings.catch_warnings():
+        # cells only holding missing values are missing in the coarser level too
+        warnings.simplefilter('ignore', RuntimeWarning)
+        result = np.nanmean(values.reshape(shape), axis=tuple(reduced))
+    if missing:
+        result[np.isnan(result)] = fill_value
+    return result.astype(data.dtype)
+
+
+def coarsen_block(
+    parent: zarr.Array,
+    output: zarr.Array,
+    region: tuple[slice, ...],
+    *,
+    axes: tuple[int, ...],
+    method: Method,
+) -> int:
+    """Compute a region of a level from the matching region of the previous level"""
+    selection = tuple(
+        slice(2 * part.start, min(2 * part.stop, size)) if axis in axes else part
+        for axis, (part, size) in enumerate(zip(region, parent.shape))
+    )
+    data = coarsen(parent[selection], axes=axes, method=method, fill_value=_fill_value(parent))
+    output[region] = data
+    return data.nbytes
+
+
+def build_pyramid(
+    source: zarr.Group,
+    *,
+    cf_axes: dict[str, dict[str, str]],
+    levels: int,
+    method: Method = 'mean',
+    rechunker: StreamingRechunker,
+    time_dim: str | None = None,
+    start: int | None = None,
+) -> list[PyramidLevel]:
+    """Write the pyramid levels of the full resolution group ``source`` next to it
+
+    With ``start``, the levels already exist and only the time steps of ``time_dim`` from
+    ``start`` on are computed, after they were appended to ``source``.
+    """
+    dims = coarsened_dims(cf_axes)
+    pyramid = source.require_group(PYRAMID_GROUP)
+    parent = source
+    result = []
+    with rechunker.pool() as pool:
+        for level in range(1, levels + 1):
+            group = pyramid.require_group(str(level))
+            if start is None:
+                group.attrs.update(source.attrs.asdict())
+            for name, array in parent.arrays():
+                base = source[name]
+                names = list(array.attrs.get('_ARRAY_DIMENSIONS', []))
+                axes = tuple(index for index, dim in enumerate(names) if dim in dims)
+                shape = tuple(
+                    math.ceil(size / 2) if index in axes else size
+                    for index, size in enumerate(array.shape)
+                )
+                chunks = tuple(min(chunk, size) or 1 for chunk, size in zip(base.chunks, shape))
+                # a block reads up to four times its size from the previous level
+                if 4 * array.dtype.itemsize * math.prod(chunks) > rechunker.max_mem:
+                    raise ValueError(f'A chunk {chunks} of {name} does not fit in max_mem')
+                origin = None
+                if start is not None:
+                    if time_dim not in names:
+                        continue
+                    output = group[name]
+                    output.resize(shape)
+                    origin = tuple(start if dim == time_dim else 0 for dim in names)
+                else:
+                    output = create_like(group, array, chunks, shape=shape)
+
+                task = (
+                    functools.partial(coarsen_block, axes=axes, method=method)
+                    if axes
+                    else copy_block
+                )
+                rechunker.copy_blocks(pool, array, output, chunks, origin, task=task)
+            logger.info(f'Wrote pyramid level {level} of {source.store}')
+            result.append(PyramidLevel(level=level, path=f'{PYRAMID_GROUP}/{level}'))
+            parent = group
+
+    pyramid.attrs['multiscales'] = [
+        {
+            'datasets': [
+                {'path': str(item.level), 'level': item.level, 'factor': item.factor}
+                for item in result
+            ],
+            'type': 'reduce',
+            'metadata': {'method': method, 'dims': sorted(dims)},
+        }
+    ]
+    return result
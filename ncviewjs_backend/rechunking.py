@@ -0,0 +1,398 @@
+"""Streaming, memory-bounded rechunking of Zarr v2 groups.
+
+Each variable is copied on its own, in blocks that are read and written by a pool of
+threads or processes, with at most one block per worker in memory at a time:
+
+- when a block spanning a whole number of source *and* target chunks (the least common
+  multiple of the two along every dimension) fits in ``max_mem``, blocks are copied
+  straight to the target and every chunk is read and written once. This is the common case
+  when the time chunks of the source and of the target are multiples of each other.
+- otherwise the variable goes through the temp store in two passes: source chunks are
+  written to intermediate chunks that divide both the source and target chunks (their
+  greatest common divisor), which are then read back one target chunk at a time.
+
+Writes always cover whole target (or intermediate) chunks, so blocks never share a chunk
+and can be written concurrently. With a process pool the stores must be reachable from
+the worker processes, e.g. directories or object storage, not in-memory stores.
+"""
+
+import concurrent.futures
+import itertools
+import math
+import os
+import pathlib
+import typing
+
+import dask.utils
+import pydantic
+import zarr
+from numcodecs.abc import Codec
+
+from .logging import get_logger
+
+logger = get_logger()
+
+MEMORY_FRACTION = 0.5
+
+
+def available_memory() -> int:
+    """Bytes of memory available to the process, within the limit of its cgroup if any"""
+    available = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    cgroup = pathlib.Path('/sys/fs/cgroup')
+    try:
+        limit = (cgroup / 'memory.max').read_text().strip()
+        if limit != 'max':
+            usage = int((cgroup / 'memory.current').read_text())
+            available = min(available, int(limit) - usage)
+    except (OSError, ValueError):
+        pass
+    return max(available, 0)
+
+
+def default_max_mem(workers: int) -> int:
+    """Memory for a single block, so that the blocks of all workers fit in memory together"""
+    return int(available_memory() * MEMORY_FRACTION / workers)
+
+
+def parse_bytes(value: int | str) -> int:
+    return dask.utils.parse_bytes(value) if isinstance(value, str) else int(value)
+
+
+def _nbytes(shape: typing.Iterable[int], itemsize: int) -> int:
+    return math.prod(shape) * itemsize
+
+
+def blocks(
+    shape: tuple[int, ...], block: tuple[int, ...], origin: tuple[int, ...] | None = None
+) -> typing.Iterator[tuple[slice, ...]]:
+    """Regions of the array covered by blocks of the given shape
+
+    Blocks are aligned on multiples of ``block``, those before ``origin`` are left out.
+    """
+    if not shape:
+        yield ()
+        return
+    origin = origin or (0,) * len(shape)
+    ranges = [
+        range(start // step, math.ceil(size / step))
+        for start, size, step in zip(origin, shape, block)
+    ]
+    for indices in itertools.product(*ranges):
+        yield tuple(
+            slice(index * step, min((index + 1) * step, size))
+            for index, step, size in zip(indices, block, shape)
+        )
+
+
+def time_range(group: zarr.Group, time_dim: str) -> tuple[int, typing.Any]:
+    """Number of time steps of the group and the (encoded) value of the last one"""
+    times = group[time_dim]
+    if not times.shape[0]:
+        return 0, None
+    return times.shape[0], times[-1].item()
+
+
+class VariablePlan(pydantic.BaseModel):
+    """How a variable is copied to its target chunks"""
+
+    name: str
+    shape: tuple[int, ...]
+    itemsize: int
+    source_chunks: tuple[int, ...]
+    target_chunks: tuple[int, ...]
+    # blocks copied straight to the target, or None when going through the temp store
+    block: tuple[int, ...] | None = None
+    intermediate_chunks: tuple[int, ...] | None = None
+
+    @property
+    def direct(self) -> bool:
+        return self.block is not None
+
+    @property
+    def nbytes(self) -> int:
+        return _nbytes(self.shape, self.itemsize)
+
+
+def plan_variable(
+    *,
+    name: str,
+    shape: tuple[int, ...],
+    itemsize: int,
+    source_chunks: tuple[int, ...],
+    target_chunks: tuple[int, ...],
+    max_mem: int,
+) -> VariablePlan:
+    """Plan the copy of a variable, ValueError when a single chunk does not fit in ``max_mem``"""
+    source_chunks = tuple(min(chunk, size) or 1 for chunk, size in zip(source_chunks, shape))
+    target_chunks = tuple(min(chunk, size) or 1 for chunk, size in zip(target_chunks, shape))
+    plan = VariablePlan(
+        name=name,
+        shape=shape,
+        itemsize=itemsize,
+        source_chunks=source_chunks,
+        target_chunks=target_chunks,
+    )
+    block = tuple(
+        min(math.lcm(source, target), size) or 1
+        for source, target, size in zip(source_chunks, target_chunks, shape)
+    )
+    if _nbytes(block, itemsize) <= max_mem:
+        return plan.model_copy(update={'block': block})
+
+    for chunks in (source_chunks, target_chunks):
+        if _nbytes(chunks, itemsize) > max_mem:
+            raise ValueError(
+                f'A chunk {chunks} of {name} does not fit in max_mem ({max_mem} bytes)'
+            )
+    intermediate = tuple(
+        math.gcd(source, target) for source, target in zip(source_chunks, target_chunks)
+    )
+    return plan.model_copy(update={'intermediate_chunks': intermediate})
+
+
+def copy_block(source: zarr.Array, target: zarr.Array, region: tuple[slice, ...]) -> int:
+    """Copy a region of the source array to the target, returning the bytes copied"""
+    data = source[region]
+    target[region] = data
+    return data.nbytes
+
+
+def create_like(
+    group: zarr.Group,
+    array: zarr.Array,
+    chunks: tuple[int, ...],
+    *,
+    shape: tuple[int, ...] | None = None,
+    **encoding,
+) -> zarr.Array:
+    """Create an array encoded like ``array`` in the group, with other chunks or shape
+
+    ``encoding`` overrides the encoding of ``array``, such as its ``compressor``.
+    """
+    created = group.create(
+        array.basename,
+        shape=array.shape if shape is None else shape,
+        chunks=chunks or True,
+        **{
+            'dtype': array.dtype,
+            'compressor': array.compressor,
+            'filters': array.filters,
+            'fill_value': array.fill_value,
+            'order': array.order,
+            **encoding,
+        },
+        overwrite=True,
+    )
+    created.attrs.update(array.attrs.asdict())
+    return created
+
+
+class StreamingRechunker:
+    """Copy the variables of a group to new chunks, one variable after the other
+
+    ``progress`` is called with the fraction of the bytes copied so far after every block.
+    """
+
+    def __init__(
+        self,
+        *,
+        executor: typing.Literal['threads', 'processes'] = 'threads',
+        workers: int | None = None,
+        max_mem: int | str | None = None,
+        progress: typing.Callable[[float], None] | None = None,
+    ):
+        self.executor = executor
+        self.workers = workers or os.cpu_count() or 1
+        self.max_mem = (
+            parse_bytes(max_mem) if max_mem is not None else default_max_mem(self.workers)
+        )
+        self.progress = progress
+        self._copied = 0
+        self._total = 0
+
+    def plan(
+        self, source: zarr.Group, target_chunks: dict[str, dict[str, int] | tuple[int, ...]]
+    ) -> list[VariablePlan]:
+        """Plan the copy of every array of the group, variables without target chunks
+        are copied with their current chunks"""
+        plans = []
+        for name, array in source.arrays():
+            chunks = target_chunks.get(name, array.chunks)
+            if isinstance(chunks, dict):
+                # chunks by dimension name, as computed from the CF axes of the dataset
+                dims = array.attrs.get('_ARRAY_DIMENSIONS', [])
+                if len(dims) != array.ndim:
+                    dims = [None] * array.ndim
+                chunks = tuple(chunks.get(dim, chunk) for dim, chunk in zip(dims, array.chunks))
+            plans.append(
+                plan_variable(
+                    name=name,
+                    shape=array.shape,
+                    itemsize=array.dtype.itemsize,
+                    source_chunks=array.chunks,
+                    target_chunks=tuple(chunks),
+                    max_mem=self.max_mem,
+                )
+            )
+        return plans
+
+    def pool(self) -> concurrent.futures.Executor:
+        if self.executor == 'processes':
+            return concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='rechunk'
+        )
+
+    def copy_blocks(
+        self,
+        pool: concurrent.futures.Executor,
+        source: zarr.Array,
+        target: zarr.Array,
+        block: tuple[int, ...],
+        origin: tuple[int, ...] | None = None,
+        *,
+        task: typing.Callable[[zarr.Array, zarr.Array, tuple[slice, ...]], int] = copy_block,
+    ) -> None:
+        """Run ``task`` on the pool for every block of the target, from ``origin`` on"""
+        # a bounded window of blocks in flight keeps the memory use to a block per worker
+        pending: set[concurrent.futures.Future] = set()
+        for region in blocks(target.shape, block, origin):
+            if len(pending) >= self.workers:
+                self._collect(pending)
+            pending.add(pool.submit(task, source, target, region))
+        while pending:
+            self._collect(pending)
+
+    def _collect(self, pending: set[concurrent.futures.Future]) -> None:
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            pending.discard(future)
+            self._copied += future.result()
+            if self.progress is not None:
+                self.progress(min(self._copied / self._total, 1.0) if self._total else 1.0)
+
+    def _copy_variable(
+        self,
+        pool: concurrent.futures.Executor,
+        plan: VariablePlan,
+        array: zarr.Array,
+        output: zarr.Array,
+        *,
+        temp: typing.Callable[[], zarr.Group],
+        origin: tuple[int, ...] | None = None,
+    ) -> None:
+        if plan.direct:
+            logger.info(f'Copying {plan.name} in blocks of {plan.block}')
+            self.copy_blocks(pool, array, output, plan.block, origin)
+            return
+
+        logger.info(f'Copying {plan.name} through intermediate chunks {plan.intermediate_chunks}')
+        if origin is not None:
+            # both passes start at a boundary of the source and the target chunks, so that
+            # the target chunks are only read back from intermediate chunks written here
+            origin = tuple(
+                start // math.lcm(source, target) * math.lcm(source, target)
+                for start, source, target in zip(origin, plan.source_chunks, plan.target_chunks)
+            )
+        group = temp()
+        intermediate = create_like(group, array, plan.intermediate_chunks)
+        self.copy_blocks(pool, array, intermediate, plan.source_chunks, origin)
+        self.copy_blocks(pool, intermediate, output, plan.target_chunks, origin)
+        del group[plan.name]
+
+    @staticmethod
+    def _temp(temp_store) -> typing.Callable[[], zarr.Group]:
+        """Open the temp store the first time a variable needs it"""
+        group = None
+
+        def temp() -> zarr.Group:
+            nonlocal group
+            if group is None:
+                group = zarr.open_group(
+                    temp_store if temp_store is not None else zarr.TempStore(), mode='w'
+                )
+            return group
+
+        return temp
+
+    def rechunk(
+        self,
+        source: zarr.Group,
+        target_chunks: dict[str, dict[str, int] | tuple[int, ...]],
+        target_store,
+        *,
+        temp_store=None,
+        compressors: dict[str, Codec | None] | None = None,
+    ) -> list[VariablePlan]:
+        """Copy the group to ``target_store`` with the target chunks and return the plans
+
+        The variables in ``compressors`` are re-encoded with their compressor.
+        """
+        plans = self.plan(source, target_chunks)
+        self._copied = 0
+        # the variables going through the temp store are copied twice
+        self._total = sum(plan.nbytes * (1 if plan.direct else 2) for plan in plans)
+
+        target = zarr.open_group(target_store, mode='w')
+        target.attrs.update(source.attrs.asdict())
+        temp = self._temp(temp_store)
+        with self.pool() as pool:
+            for plan in plans:
+                array = source[plan.name]
+                encoding = {}
+                if compressors and plan.name in compressors:
+                    encoding['compressor'] = compressors[plan.name]
+                output = create_like(target, array, plan.target_chunks, **encoding)
+                self._copy_variable(pool, plan, array, output, temp=temp)
+        return plans
+
+    def append(
+        self, source: zarr.Group, target_store, *, time_dim: str, start: int, temp_store=None
+    ) -> list[VariablePlan]:
+        """Append the time steps of the source from ``start`` on to a store it was rechunked to
+
+        The target keeps its chunks. Only the target chunks holding time steps from
+        ``start`` on are written, so the cost grows with the number of new time steps.
+        ValueError when the source changed in any other way than new time steps.
+        """
+        target = zarr.open_group(target_store, mode='r+')
+        updates = []
+        for name, array in source.arrays():
+            if name not in target:
+                raise ValueError(f'{name} is not in the rechunked store')
+            output = target[name]
+            dims = list(array.attrs.get('_ARRAY_DIMENSIONS', []))
+            axis = dims.index(time_dim) if time_dim in dims else None
+            other = [size for index, size in enumerate(array.shape) if index != axis]
+            if other != [size for index, size in enumerate(output.shape) if index != axis] or (
+                axis is not None and not array.shape[axis] >= output.shape[axis] == start
+            ):
+                raise ValueError(f'{name} changed from {output.shape} to {array.shape}')
+            if axis is None or array.shape[axis] == start:
+                continue
+            plan = plan_variable(
+                name=name,
+                shape=array.shape,
+                itemsize=array.dtype.itemsize,
+                source_chunks=array.chunks,
+                target_chunks=output.chunks,
+                max_mem=self.max_mem,
+            )
+            updates.append((plan, array, output, axis))
+
+        self._copied = 0
+        # the blocks holding the last time steps already copied are rewritten too, so the
+        # progress is only an estimate until the end
+        self._total = sum(
+            plan.nbytes * (plan.shape[axis] - start) // plan.shape[axis] * (1 if plan.direct else 2)
+            for plan, _, _, axis in updates
+        )
+        target.attrs.update(source.attrs.asdict())
+        temp = self._temp(temp_store)
+        with self.pool() as pool:
+            for plan, array, output, axis in updates:
+                output.resize(array.shape)
+                output.attrs.update(array.attrs.asdict())
+                origin = tuple(start if index == axis else 0 for index in range(array.ndim))
+                self._copy_variable(pool, plan, array, output, temp=temp, origin=origin)
+        return [plan for plan, *_ in updates]
@@ -0,0 +1,170 @@
+"""Rechunk run status changes pushed to waiting clients.
+
+A trigger on the ``rechunkrun`` table (see the migrations) sends a ``NOTIFY`` on the
+``rechunk_run_status`` channel whenever a run is created or its status or outcome changes,
+whichever process made the change. Each API process holds a single ``LISTEN`` connection,
+opened when the first client subscribes, and fans the notifications out to the clients
+waiting on the run. When the connection is lost while clients are waiting, it is opened
+again with an exponential backoff and the clients are sent the current status of the runs
+that changed in between.
+"""
+
+import asyncio
+import collections
+import contextlib
+import json
+import typing
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from .config import Settings, get_settings
+from .logging import get_logger
+from .models.dataset import RechunkRunStatus
+
+logger = get_logger()
+
+CHANNEL = 'rechunk_run_status'
+# seconds before the first attempt to reopen a lost connection, doubled after each failure
+RECONNECT_DELAY = 0.5
+RECONNECT_DELAY_MAX = 30.0
+
+_broadcaster: typing.Optional['RunEventBroadcaster'] = None
+
+
+def listener_database_url(url: str) -> str:
+    """Convert a SQLAlchemy database URL to a plain libpq URL usable by asyncpg"""
+    return make_url(url).set(drivername='postgresql').render_as_string(hide_password=False)
+
+
+class RunEventBroadcaster:
+    """Share one LISTEN connection between all the clients waiting on run status changes"""
+
+    def __init__(self, *, database_url: str):
+        self.database_url = listener_database_url(database_url)
+        self._connection: asyncpg.Connection | None = None
+        self._lock: asyncio.Lock | None = None
+        self._subscribers: dict[int, set[asyncio.Queue]] = collections.defaultdict(set)
+        # last status of each watched run known to its subscribers
+        self._last_status: dict[int, tuple] = {}
+        self._reconnecting: asyncio.Task | None = None
+        self._closed = False
+        self.notifications = 0
+        self.reconnections = 0
+
+    async def _listen(self) -> None:
+        self._lock = self._lock or asyncio.Lock()
+        async with self._lock:
+            if self._connection is not None and not self._connection.is_closed():
+                return
+            connection = await asyncpg.connect(self.database_url)
+            connection.add_termination_listener(self._on_termination)
+            await connection.add_listener(CHANNEL, self._on_notification)
+            self._connection = connection
+            logger.info(f'Listening to {CHANNEL} notifications')
+
+    def _on_termination(self, connection: asyncpg.Connection) -> None:
+        logger.warning(f'Lost the {CHANNEL} listener connection')
+        if self._connection is connection:
+            self._connection = None
+        if self._subscribers and not self._closed and self._reconnecting is None:
+            self._reconnecting = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        """Listen again while clients are waiting, then send them the current status"""
+        delay = RECONNECT_DELAY
+        try:
+            while self._subscribers and not self._closed:
+                try:
+                    await self._listen()
+                    await self._publish_current_status()
+                except Exception as exc:
+                    logger.warning(
+                        f'Unable to listen to {CHANNEL} again, retrying in {delay}s: {exc}'
+                    )
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, RECONNECT_DELAY_MAX)
+                else:
+                    self.reconnections += 1
+                    return
+        finally:
+            self._reconnecting = None
+
+    async def _publish_current_status(self) -> None:
+        # the notifications sent while the connection was lost are not delivered again
+        rows = await self._connection.fetch(
+            'SELECT id, dataset_id, status, outcome FROM rechunkrun WHERE id = ANY($1::int[])',
+            list(self._subscribers),
+        )
+        for row in rows:
+            event = RechunkRunStatus.model_validate(dict(row))
+            if self._last_status.get(event.id) != (event.status, event.outcome):
+                self._publish(event)
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str) -> None:
+        self.notifications += 1
+        self._publish(RechunkRunStatus.model_validate(json.loads(payload)))
+
+    def _publish(self, event: RechunkRunStatus) -> None:
+        if event.id in self._subscribers:
+            self._last_status[event.id] = (event.status, event.outcome)
+        for queue in self._subscribers.get(event.id, ()):
+            queue.put_nowait(event)
+
+    def observe(self, event: RechunkRunStatus) -> None:
+        """Record the status of a run read by a subscriber, which is not sent again after a
+        reconnection. A status published since the subscription is more recent and kept."""
+        if event.id in self._subscribers:
+            self._last_status.setdefault(event.id, (event.status, event.outcome))
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, run_id: int) -> typing.AsyncIterator[asyncio.Queue]:
+        """Yield a queue receiving the status changes of the run"""
+        await self._listen()
+        queue: asyncio.Queue[RechunkRunStatus] = asyncio.Queue()
+        self._subscribers[run_id].add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers[run_id].discard(queue)
+            if not self._subscribers[run_id]:
+                del self._subscribers[run_id]
+                self._last_status.pop(run_id, None)
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+        connection, self._connection = self._connection, None
+        if connection is not None and not connection.is_closed():
+            await connection.close()
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            'listening': self._connection is not None,
+            'subscribers': sum(len(queues) for queues in self._subscribers.values()),
+            'notifications': self.notifications,
+            'reconnections': self.reconnections,
+        }
+
+
+def get_run_event_broadcaster(settings: Settings | None = None) -> RunEventBroadcaster:
+    """Return the process-wide broadcaster, creating it from the settings if needed"""
+    global _broadcaster
+    if _broadcaster is None:
+        settings = settings or get_settings()
+        _broadcaster = RunEventBroadcaster(database_url=settings.database_url)
+    return _broadcaster
+
+
+async def close_run_event_broadcaster() -> None:
+    """Close the listener connection and drop the process-wide broadcaster"""
+    global _broadcaster
+    broadcaster, _broadcaster = _broadcaster, None
+    if broadcaster is not None:
+        await broadcaster.close()
+
+
+def get_run_event_stats() -> dict[str, typing.Any] | None:
+    """Return the broadcaster counters or None if no broadcaster has been created"""
+    return None if _broadcaster is None else _broadcaster.stats()
@@ -6,6 +6,8 @@ import pydantic
 class StorePayload(pydantic.BaseModel):
     url: str
     force: bool = False
+    # profile the validation of the store, see ncviewjs_backend.profiling
+    profile: bool = False
 
 
 class SanitizedURL(pydantic.BaseModel):
@@ -0,0 +1,62 @@
+"""Coalescing of concurrent identical operations.
+
+When several threads ask for the same key at once (typically the metadata or the chunks
+of a store that many users just opened), only the first one runs the operation and the
+others wait for it and receive its result, or its exception.
+"""
+
+import threading
+import typing
+
+T = typing.TypeVar('T')
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: typing.Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Run at most one operation per key at a time, sharing its outcome with all callers"""
+
+    def __init__(self):
+        self._calls: dict[typing.Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: typing.Hashable, func: typing.Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'in_flight': len(self._calls),
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+        }
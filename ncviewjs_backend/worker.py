@@ -0,0 +1,150 @@
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+
+from sqlmodel import Session
+
+from .config import Settings, get_settings
+from .database import dispose_engine, init_engine
+from .dataset_processing import track_abandoned_calls
+from .jobs import (
+    HostLimiter,
+    LeaseKeeper,
+    claim_next_run,
+    execute_run,
+    origin_host,
+    queue_stats,
+    requeue_stale_runs,
+)
+from .logging import get_logger
+from .metrics import instrument_database, start_http_server
+from .models.dataset import Dataset
+
+logger = get_logger()
+
+
+class Worker:
+    """Process queued rechunk runs with a fixed number of threads
+
+    At most ``settings.worker_host_concurrency`` of the threads work on stores served by
+    the same host, the other threads keep processing the runs of other hosts.
+    """
+
+    def __init__(self, *, settings: Settings, concurrency: int | None = None):
+        self.settings = settings
+        self.concurrency = concurrency or settings.worker_concurrency
+        self.engine = init_engine(settings)
+        self.stop_event = threading.Event()
+        self.worker_id = f'{socket.gethostname()}-{os.getpid()}'
+        self.hosts = HostLimiter(settings.worker_host_concurrency)
+        # claims are serialized so that the threads never exceed the per-host limit
+        self._claim_lock = threading.Lock()
+        self.processed = 0
+        self.processing_time = 0.0
+
+    def run_once(self, *, worker_id: str | None = None) -> bool:
+        """Claim and process a single run. Returns False when no run can be claimed"""
+        worker_id = worker_id or self.worker_id
+        lease_seconds = self.settings.job_lease_seconds
+        with Session(self.engine) as session:
+            with self._claim_lock:
+                run = claim_next_run(
+                    session,
+                    worker_id=worker_id,
+                    lease_seconds=lease_seconds,
+                    exclude_hosts=self.hosts.saturated(),
+                )
+                if run is None:
+                    return False
+                host = origin_host(session.get(Dataset, run.dataset_id).url)
+                self.hosts.acquire(host)
+
+            start = time.perf_counter()
+            abandoned = []
+            try:
+                with (
+                    LeaseKeeper(
+                        engine=self.engine,
+                        run_id=run.id,
+                        worker_id=worker_id,
+                        lease_seconds=lease_seconds,
+                    ),
+                    track_abandoned_calls() as abandoned,
+                ):
+                    execute_run(session, run=run, settings=self.settings)
+            finally:
+                self.hosts.release(host, abandoned=abandoned)
+                elapsed = time.perf_counter() - start
+                self.processed += 1
+                self.processing_time += elapsed
+                logger.info(f'Processed rechunk run {run.id} of {host} in {elapsed:.2f}s')
+        return True
+
+    def stats(self) -> dict:
+        """Counters of the worker and of the queue it is processing"""
+        with Session(self.engine) as session:
+            queue = queue_stats(session)
+        return {
+            'worker_id': self.worker_id,
+            'concurrency': self.concurrency,
+            'in_progress_by_host': self.hosts.stats(),
+            'processed': self.processed,
+            'mean_processing_seconds': (
+                self.processing_time / self.processed if self.processed else None
+            ),
+            'queue': queue,
+        }
+
+    def _loop(self, index: int) -> None:
+        worker_id = f'{self.worker_id}-{index}'
+        while not self.stop_event.is_set():
+            try:
+                if self.run_once(worker_id=worker_id):
+                    continue
+            except Exception as exc:
+                logger.error(f'Worker {worker_id} failed to process a run: {exc}')
+            self.stop_event.wait(self.settings.worker_poll_interval)
+
+    def start(self) -> list[threading.Thread]:
+        with Session(self.engine) as session:
+            requeue_stale_runs(session)
+
+        threads = [
+            threading.Thread(target=self._loop, args=(index,), name=f'worker-{index}')
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        logger.info(f'Worker {self.worker_id} started with {self.concurrency} thread(s)')
+        return threads
+
+    def stop(self, *args) -> None:
+        logger.info(f'Stopping worker {self.worker_id}...')
+        self.stop_event.set()
+        logger.info(f'Processed {self.processed} run(s) in {self.processing_time:.1f}s')
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Process queued dataset validations')
+    parser.add_argument(
+        '--concurrency', type=int, default=None, help='Number of runs processed in parallel'
+    )
+    args = parser.parse_args(argv)
+
+    settings = get_settings()
+    instrument_database()
+    if settings.worker_metrics_port is not None:
+        start_http_server(settings.worker_metrics_port)
+    worker = Worker(settings=settings, concurrency=args.concurrency)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    for thread in worker.start():
+        thread.join()
+    dispose_engine()
+
+
+if __name__ == '__main__':
+    main()
@@ -8,27 +8,139 @@ from ncviewjs_backend.main import create_application
 
 
 def get_settings_override():
+    return make_settings()
+
+
+def make_settings(**kwargs) -> Settings:
     return Settings(
         testing=1,
         database_url=os.environ.get("DATABASE_URL"),
         scratch_bucket="s3://carbonplan-scratch/temp",
         staging_bucket="s3://carbonplan-scratch/staging",
         production_bucket="s3://carbonplan-scratch/production",
+        **kwargs,
     )
 
 
 @pytest.fixture(scope="module")
 def test_app():
-    app = create_application()
+    app = create_application(make_settings())
     app.dependency_overrides[get_settings] = get_settings_override
     with TestClient(app) as test_client:
         yield test_client
 
 
-@pytest.fixture(scope="module")
-def test_app_with_db():
-    app = create_application()
+@pytest.fixture(scope="module", params=[False, True], ids=["sync", "async"])
+def test_app_with_db(request):
+    app = create_application(make_settings(async_database=request.param))
     app.dependency_overrides[get_settings] = get_settings_override
 
     with TestClient(app) as test_client:
         yield test_client
+
+
+@pytest.fixture
+def session():
+    from sqlmodel import Session
+
+    from ncviewjs_backend.database import dispose_engine, init_engine
+
+    engine = init_engine(make_settings())
+    with Session(engine) as session:
+        yield session
+    dispose_engine()
+
+
+@pytest.fixture
+def validate_dataset(session):
+    """Register and validate a dataset for a store that is not reachable through a URL"""
+    import uuid
+
+    from ncviewjs_backend.dataset_processing import validate_and_rechunk
+    from ncviewjs_backend.models.dataset import Dataset, RechunkRun
+
+    def validate(url: str) -> Dataset:
+        md5_id = uuid.uuid4().hex
+        dataset = Dataset(url=url, md5_id=md5_id, protocol='file', key=url, bucket='tmp')
+        session.add(dataset)
+        session.commit()
+        run = RechunkRun(dataset_id=dataset.id)
+        session.add(run)
+        session.commit()
+        validate_and_rechunk(dataset=dataset, session=session, rechunk_run=run)
+        return dataset
+
+    return validate
+
+
+@pytest.fixture
+def count_queries():
+    """Record the SQL statements executed by any engine, sync or async, within a block"""
+    import contextlib
+
+    import sqlalchemy
+
+    @contextlib.contextmanager
+    def recorder():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        sqlalchemy.event.listen(sqlalchemy.Engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            sqlalchemy.event.remove(
+                sqlalchemy.Engine, 'before_cursor_execute', before_cursor_execute
+            )
+
+    return recorder
+
+
+@pytest.fixture
+def zarr_store(tmp_path):
+    """A small CF compliant Zarr store on the local filesystem"""
+    import numpy as np
+    import xarray as xr
+
+    ds = xr.Dataset(
+        {'air': (('time', 'lat', 'lon'), np.random.rand(4, 10, 20).astype('float32'))},
+        coords={
+            'time': ('time', np.arange(4), {'standard_name': 'time', 'axis': 'T'}),
+            'lat': ('lat', np.linspace(-90, 90, 10), {'units': 'degrees_north', 'axis': 'Y'}),
+            'lon': ('lon', np.linspace(-180, 180, 20), {'units': 'degrees_east', 'axis': 'X'}),
+        },
+    )
+    path = tmp_path / 'air.zarr'
+    ds.to_zarr(path, consolidated=True)
+    return str(path)
+
+
+@pytest.fixture
+def zarr_http_store(zarr_store):
+    """Serve the local Zarr store over HTTP, with Last-Modified/If-Modified-Since support"""
+    import functools
+    import http.server
+    import pathlib
+    import threading
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        requests = []
+
+        def do_GET(self):
+            Handler.requests.append((self.path, self.headers.get('If-Modified-Since')))
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    path = pathlib.Path(zarr_store)
+    server = http.server.ThreadingHTTPServer(
+        ('127.0.0.1', 0), functools.partial(Handler, directory=str(path.parent))
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/{path.name}'
+    yield url, Handler.requests
+    server.shutdown()
@@ -0,0 +1,77 @@
+import datetime
+import uuid
+
+import pytest
+
+from ncviewjs_backend.access_tracking import AccessTracker
+from ncviewjs_backend.models.dataset import Dataset
+
+
+@pytest.fixture
+def datasets(session):
+    rows = []
+    for index in range(2):
+        md5_id = uuid.uuid4().hex
+        rows.append(
+            Dataset(
+                url=f'https://example.com/{md5_id}.zarr',
+                md5_id=md5_id,
+                protocol='https',
+                key=f'{md5_id}.zarr',
+                bucket='example.com',
+                last_accessed=datetime.datetime(2023, 1, 1),
+            )
+        )
+    session.add_all(rows)
+    session.commit()
+    return rows
+
+
+def test_flush_coalesces_accesses(session, datasets, count_queries):
+    first, second = datasets
+    tracker = AccessTracker(flush_interval=60)
+    tracker.record(first.id, datetime.datetime(2023, 1, 2))
+    tracker.record(first.id, datetime.datetime(2023, 1, 4))
+    tracker.record(first.id, datetime.datetime(2023, 1, 3))
+    tracker.record(second.id, datetime.datetime(2023, 1, 5))
+    assert tracker.stats()['pending'] == 2
+
+    with count_queries() as statements:
+        assert tracker.flush() == 2
+    assert len(statements) == 1
+    assert tracker.stats()['pending'] == 0
+
+    session.refresh(first)
+    session.refresh(second)
+    assert first.last_accessed == datetime.datetime(2023, 1, 4)
+    assert second.last_accessed == datetime.datetime(2023, 1, 5)
+
+    # an older access never moves the timestamp back
+    tracker.record(first.id, datetime.datetime(2023, 1, 2))
+    assert tracker.flush() == 0
+    session.refresh(first)
+    assert first.last_accessed == datetime.datetime(2023, 1, 4)
+
+
+def test_full_buffer_is_flushed(session, datasets):
+    tracker = AccessTracker(flush_interval=60, max_pending=2)
+    tracker.record(datasets[0].id)
+    assert tracker.stats()['flushes'] == 0
+    tracker.record(datasets[1].id)
+    stats = tracker.stats()
+    assert (stats['pending'], stats['flushes'], stats['rows_updated']) == (0, 1, 2)
+
+
+def test_write_through(session, datasets):
+    tracker = AccessTracker(flush_interval=0)
+    tracker.record(datasets[0].id)
+    assert tracker.stats()['rows_updated'] == 1
+
+
+def test_stop_flushes_pending_accesses(session, datasets):
+    tracker = AccessTracker(flush_interval=60)
+    tracker.start()
+    tracker.record(datasets[0].id, datetime.datetime(2024, 1, 1))
+    tracker.stop()
+    session.refresh(datasets[0])
+    assert datasets[0].last_accessed == datetime.datetime(2024, 1, 1)
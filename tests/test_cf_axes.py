@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from ncviewjs_backend.cf_axes import cf_axes, classify_coordinate, dataset_cf_axes
+
+
+def cf_xarray_axes(ds: xr.Dataset) -> dict[str, dict[str, str]]:
+    """The per-variable cf_xarray lookup the module replaces"""
+    import cf_xarray  # noqa
+
+    return {
+        name: {axis: names[0] for axis, names in ds[name].cf.axes.items()} for name in ds.variables
+    }
+
+
+def make_dataset() -> xr.Dataset:
+    coords = {
+        'time': ('time', np.arange(2), {'standard_name': 'time'}),
+        'lev': ('lev', np.arange(3), {'_CoordinateAxisType': 'Pressure'}),
+        'lat': ('lat', np.arange(4), {'axis': 'Y'}),
+        'lon': ('lon', np.arange(5), {'axis': 'X'}),
+        'x': ('x', np.arange(6), {'standard_name': 'projection_x_coordinate'}),
+        'member': ('member', np.arange(2), {'long_name': 'ensemble member'}),
+        'bnds': ('bnds', np.arange(2), {'axis': ['not', 'a', 'string']}),
+    }
+    data_vars = {
+        'tas': (('time', 'lat', 'lon'), np.zeros((2, 4, 5))),
+        'ta': (('time', 'lev', 'lat', 'lon'), np.zeros((2, 3, 4, 5))),
+        'proj': (('time', 'lat', 'x', 'lon'), np.zeros((2, 4, 6, 5))),
+        'ens': (('member', 'lat'), np.zeros((2, 4))),
+        'time_bnds': (('time', 'bnds'), np.zeros((2, 2))),
+        'scalar': ((), 0.0),
+    }
+    return xr.Dataset(data_vars, coords=coords)
+
+
+def test_matches_cf_xarray():
+    ds = make_dataset()
+    assert dataset_cf_axes(ds) == cf_xarray_axes(ds)
+    axes = dataset_cf_axes(ds)
+    assert axes['ta'] == {'T': 'time', 'Z': 'lev', 'Y': 'lat', 'X': 'lon'}
+    # the first coordinate in name order wins when several match the axis
+    assert axes['proj']['X'] == 'lon'
+    assert axes['ens'] == {'Y': 'lat'}
+    assert axes['scalar'] == {}
+
+
+def test_matches_cf_xarray_on_stored_dataset(tmp_path):
+    path = str(tmp_path / 'store.zarr')
+    make_dataset().to_zarr(path)
+    with xr.open_dataset(path, engine='zarr', chunks={}, decode_cf=False) as ds:
+        assert dataset_cf_axes(ds) == cf_xarray_axes(ds)
+
+
+@pytest.mark.parametrize(
+    'attrs,axes',
+    [
+        ({'axis': 'T'}, ('T',)),
+        ({'grads_dim': 'z'}, ('Z',)),
+        ({'long_name': 'grid_latitude'}, ('Y',)),
+        ({'units': 'degrees_north'}, ()),
+        ({'axis': 1}, ()),
+        ({}, ()),
+    ],
+)
+def test_classify_coordinate(attrs, axes):
+    assert classify_coordinate(attrs) == axes
+
+
+def test_attributes_only():
+    variables = {
+        'lat': (['lat'], {'axis': 'Y'}),
+        'lon': (['lon'], {'axis': 'X'}),
+        # not a dimension coordinate, its attributes are ignored
+        'lat2d': (['lat', 'lon'], {'axis': 'T'}),
+        **{f'var_{index}': (['lat', 'lon'], {}) for index in range(100)},
+    }
+    axes = cf_axes(variables)
+    assert axes['lat2d'] == axes['var_99'] == {'X': 'lon', 'Y': 'lat'}
+    # the results are independent copies
+    axes['var_0']['T'] = 'time'
+    assert axes['var_1'] == {'X': 'lon', 'Y': 'lat'}
@@ -0,0 +1,116 @@
+import math
+
+import numpy as np
+import pytest
+import zarr
+
+from ncviewjs_backend.chunk_planning import Session, plan_chunks, predict_requests
+
+AXES = {'T': 'time', 'Y': 'lat', 'X': 'lon'}
+DIMS = ('time', 'lat', 'lon')
+
+
+class ReadKeys(dict):
+    """In-memory store recording the chunk keys looked up"""
+
+    def __init__(self):
+        super().__init__()
+        self.read = set()
+
+    def __contains__(self, key):
+        if not key.startswith('.'):
+            self.read.add(key)
+        return super().__contains__(key)
+
+
+@pytest.mark.parametrize(
+    'itemsize, profile, expected',
+    [
+        (4, 'map', (2, 256, 256)),
+        (8, 'map', (1, 256, 256)),
+        (2, 'map', (4, 256, 256)),
+        (4, 'timeseries', (120, 32, 32)),
+        (8, 'timeseries', (120, 16, 16)),
+    ],
+)
+def test_plan_chunks(itemsize, profile, expected):
+    chunks = plan_chunks(
+        shape=(120, 720, 1440), dims=DIMS, itemsize=itemsize, axes=AXES, profile=profile
+    )
+    assert chunks == expected
+    assert 0.3 < math.prod(chunks) * itemsize / 5e5 < 1.5
+
+
+def test_plan_chunks_of_small_or_other_dims():
+    # the budget left by small spatial dims goes to time
+    assert plan_chunks(shape=(1000, 180, 360), dims=DIMS, itemsize=4, axes=AXES) == (3, 180, 256)
+    # long time axes are split in timeseries chunks
+    assert plan_chunks(
+        shape=(10**6, 4, 4), dims=DIMS, itemsize=4, axes=AXES, profile='timeseries'
+    ) == (125_000, 1, 1)
+    # other dims are kept whole when they fit
+    dims = ('member', 'lat', 'lon')
+    assert plan_chunks(shape=(5, 720, 1440), dims=dims, itemsize=4, axes=AXES) == (1, 256, 256)
+    assert plan_chunks(shape=(5, 20, 20), dims=dims, itemsize=4, axes=AXES) == (5, 20, 20)
+    # variables without axes, such as coordinates
+    assert plan_chunks(shape=(1000,), dims=('bnds',), itemsize=8, axes={}) == (1000,)
+
+
+def test_plan_chunks_without_spatial_axes():
+    # dims that do not fit are reduced evenly instead of being chunked by one
+    dims = ('y', 'x')
+    assert plan_chunks(shape=(4000, 8000), dims=dims, itemsize=4, axes={}) == (250, 500)
+    assert plan_chunks(shape=(40, 8000), dims=dims, itemsize=4, axes={}) == (40, 4000)
+    # a time axis gets the target left by the other dims
+    chunks = plan_chunks(
+        shape=(100, 4000, 8000), dims=('time',) + dims, itemsize=4, axes={'T': 'time'}
+    )
+    assert chunks == (1, 250, 500)
+    assert plan_chunks(
+        shape=(10**6, 3000),
+        dims=('time', 'station'),
+        itemsize=4,
+        axes={'T': 'time'},
+        profile='timeseries',
+    ) == (125_000, 1)
+
+
+def test_predict_requests():
+    chunks = (2, 256, 256)
+    session = Session(viewport=(256, 256), time_steps=1)
+    # a viewport of a tile spans two tiles along each axis unless it is aligned with them
+    predicted = predict_requests(
+        shape=(10, 512, 512), dims=DIMS, chunks=chunks, axes=AXES, session=session
+    )
+    assert predicted == pytest.approx((1 + 255 / 257) ** 2)
+    # a point in each tile reads its whole time series
+    session = Session(profile='timeseries', points=10**6)
+    predicted = predict_requests(
+        shape=(10, 512, 512), dims=DIMS, chunks=chunks, axes=AXES, session=session
+    )
+    assert predicted == pytest.approx(4 * 5)
+
+
+@pytest.mark.parametrize('profile', ['map', 'timeseries'])
+def test_predictions_match_reads(profile):
+    shape = (24, 360, 720)
+    chunks = plan_chunks(shape=shape, dims=DIMS, itemsize=4, axes=AXES, profile=profile)
+    store = ReadKeys()
+    array = zarr.create(shape=shape, chunks=chunks, dtype='f4', store=store, fill_value=0)
+    session = Session(profile=profile, viewport=(180, 360), time_steps=6, points=4)
+
+    rng = np.random.default_rng(0)
+    counts = []
+    for _ in range(100):
+        store.read.clear()
+        if profile == 'map':
+            y, x, t = rng.integers(0, 181), rng.integers(0, 361), rng.integers(0, 19)
+            for step in range(t, t + 6):
+                array[step, y : y + 180, x : x + 360]
+        else:
+            for _ in range(4):
+                array[:, rng.integers(0, 360), rng.integers(0, 720)]
+        counts.append(len(store.read))
+
+    predicted = predict_requests(shape=shape, dims=DIMS, chunks=chunks, axes=AXES, session=session)
+    assert np.mean(counts) == pytest.approx(predicted, rel=0.1)
@@ -0,0 +1,157 @@
+import json
+
+import numpy as np
+import pytest
+import zarr
+
+from ncviewjs_backend.chunk_proxy import ChunkCache, ChunkProxy, plan_array, viewer_chunks
+
+SHAPE = (3, 300, 520)
+
+
+@pytest.fixture
+def tiled_store(tmp_path):
+    """A store whose source chunks do not line up with the viewer tiles"""
+    path = str(tmp_path / 'tiled.zarr')
+    group = zarr.open_group(path, mode='w')
+    data = np.arange(np.prod(SHAPE), dtype='float32').reshape(SHAPE)
+    array = group.create_dataset(
+        'tas', data=data, chunks=(1, 100, 100), fill_value=-1, compressor=zarr.Blosc()
+    )
+    array.attrs['_ARRAY_DIMENSIONS'] = ['time', 'lat', 'lon']
+    for dim, size, axis in zip(['time', 'lat', 'lon'], SHAPE, 'TYX'):
+        coordinate = group.create_dataset(dim, data=np.arange(size), chunks=(size,))
+        coordinate.attrs.update({'_ARRAY_DIMENSIONS': [dim], 'axis': axis})
+    zarr.consolidate_metadata(path)
+    return path, data
+
+
+def metadata(path):
+    with open(f'{path}/.zmetadata') as f:
+        return json.load(f)
+
+
+AXES = {'T': 'time', 'Y': 'lat', 'X': 'lon'}
+
+
+def test_viewer_chunks():
+    dims = ('time', 'lat', 'lon')
+    assert viewer_chunks(shape=(10, 720, 1440), dims=dims, axes=AXES) == (2, 256, 256)
+    assert viewer_chunks(shape=(1, 100, 1440), dims=dims, axes=AXES) == (1, 100, 256)
+    # dimensions that are not spatial or time are kept whole
+    assert viewer_chunks(shape=(5, 720), dims=('member', 'lat'), axes=AXES) == (5, 256)
+
+
+@pytest.mark.parametrize('chunk_key', ['0.0.0', '1.1.2', '0.1.0', '1.0.1'])
+def test_assemble(tiled_store, chunk_key):
+    path, data = tiled_store
+    array = plan_array(metadata(path), 'tas', axes=AXES)
+    assert array.chunks == (2, 256, 256)
+
+    proxy = ChunkProxy(concurrency=4)
+    chunk = np.frombuffer(proxy.assemble(url=path, array=array, chunk_key=chunk_key), 'float32')
+    chunk = chunk.reshape(array.chunks)
+
+    selection = array.output_selection(chunk_key)
+    expected = data[selection]
+    region = tuple(slice(0, size) for size in expected.shape)
+    np.testing.assert_array_equal(chunk[region], expected)
+    # edge chunks are padded with the fill value
+    assert (chunk == -1).sum() == chunk.size - expected.size
+
+
+def test_missing_source_chunks_read_as_fill_value(tiled_store):
+    path, _ = tiled_store
+    array = plan_array(metadata(path), 'tas', axes=AXES)
+    proxy = ChunkProxy()
+    proxy.fetch = lambda url, keys: {}
+    chunk = np.frombuffer(proxy.assemble(url=path, array=array, chunk_key='0.0.0'), 'float32')
+    assert (chunk == -1).all()
+
+
+def test_invalid_chunk_keys(tiled_store):
+    path, _ = tiled_store
+    array = plan_array(metadata(path), 'tas', axes=AXES)
+    for chunk_key in ['2.0.0', '0.0', '0.0.3', 'a.b.c', '-1.0.0']:
+        with pytest.raises(ValueError):
+            array.output_selection(chunk_key)
+    with pytest.raises(KeyError):
+        plan_array(metadata(path), 'missing')
+
+
+def test_chunk_cache_is_bounded():
+    cache = ChunkCache(max_bytes=10)
+    cache.put('a', b'12345')
+    cache.put('b', b'12345')
+    assert cache.get('a') == b'12345'
+    cache.put('c', b'12345')
+    # b was the least recently used
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.stats()['nbytes'] == 10
+
+
+def test_chunk_cache_disk_tier(tmp_path):
+    cache = ChunkCache(max_bytes=5, directory=str(tmp_path), max_disk_bytes=10)
+    cache.put('a', b'12345')
+    cache.put('b', b'12345')
+    # evicted from memory, still on disk
+    assert cache.get('a') == b'12345'
+    assert cache.stats()['disk_hits'] == 1
+
+    # the disk tier survives restarts, and is bounded as well
+    cache = ChunkCache(max_bytes=5, directory=str(tmp_path), max_disk_bytes=10)
+    assert cache.stats()['disk_entries'] == 2
+    cache.put('c', b'12345')
+    assert cache.stats()['disk_entries'] == 2
+    assert cache.stats()['disk_nbytes'] == 10
+
+
+def test_get_chunk_endpoint(test_app_with_db, validate_dataset, tiled_store):
+    path, data = tiled_store
+    dataset = validate_dataset(path)
+
+    response = test_app_with_db.get(f'/datasets/{dataset.id}/tas/.zarray')
+    assert response.status_code == 200
+    zarray = response.json()
+    assert zarray['chunks'] == [2, 256, 256]
+    assert zarray['compressor'] is None
+    response = test_app_with_db.get(f'/datasets/{dataset.id}/tas/.zattrs')
+    assert response.json()['_ARRAY_DIMENSIONS'] == ['time', 'lat', 'lon']
+
+    response = test_app_with_db.get(f'/datasets/{dataset.id}/tas/1.0.1')
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/octet-stream'
+    chunk = np.frombuffer(response.content, zarray['dtype']).reshape(zarray['chunks'])
+    np.testing.assert_array_equal(chunk[:1], data[2:3, 0:256, 256:512])
+
+    response = test_app_with_db.get(
+        f'/datasets/{dataset.id}/tas/1.0.1', headers={'If-None-Match': response.headers['ETag']}
+    )
+    assert response.status_code == 304
+
+    assert test_app_with_db.get(f'/datasets/{dataset.id}/tas/9.9.9').status_code == 404
+    assert test_app_with_db.get(f'/datasets/{dataset.id}/missing/0.0.0').status_code == 404
+
+
+def test_chunk_grid_follows_edited_axes(test_app_with_db, validate_dataset, tiled_store):
+    path, data = tiled_store
+    dataset = validate_dataset(path)
+    zarray = test_app_with_db.get(f'/datasets/{dataset.id}/tas/.zarray')
+    chunk = test_app_with_db.get(f'/datasets/{dataset.id}/tas/0.0.0')
+    assert zarray.json()['chunks'] == [2, 256, 256]
+
+    response = test_app_with_db.patch(
+        f'/datasets/{dataset.id}', content=json.dumps({'cf_axes': {'tas': {'T': 'time'}}})
+    )
+    assert response.status_code == 200
+
+    edited = test_app_with_db.get(f'/datasets/{dataset.id}/tas/.zarray')
+    chunks = edited.json()['chunks']
+    assert chunks != [2, 256, 256]
+    assert edited.headers['ETag'] != zarray.headers['ETag']
+    response = test_app_with_db.get(
+        f'/datasets/{dataset.id}/tas/0.0.0', headers={'If-None-Match': chunk.headers['ETag']}
+    )
+    assert response.status_code == 200
+    assert len(response.content) == np.prod(chunks) * 4
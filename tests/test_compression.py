@@ -0,0 +1,71 @@
+import numcodecs
+import numpy as np
+import pytest
+import zarr
+
+from ncviewjs_backend.compression import (
+    CODECS,
+    benchmark_codecs,
+    choose_codec,
+    sample_regions,
+    select_codec,
+)
+from ncviewjs_backend.rechunking import StreamingRechunker
+
+
+@pytest.fixture
+def air():
+    rng = np.random.default_rng(0)
+    data = (280 + rng.normal(0, 5, (6, 64, 96))).round(1).astype('f4')
+    return zarr.array(data, chunks=(6, 16, 96), compressor=numcodecs.Zstd(level=1))
+
+
+def test_sample_regions():
+    assert sample_regions((5, 4), (2, 4), samples=2) == [
+        (slice(0, 2), slice(0, 4)),
+        (slice(4, 5), slice(0, 4)),
+    ]
+    # every chunk when there are fewer than the samples
+    assert len(sample_regions((5, 4), (2, 4), samples=10)) == 3
+    assert sample_regions((), (), samples=3) == [()]
+    assert sample_regions((0, 4), (2, 4), samples=3) == []
+
+
+def test_benchmark_codecs(air):
+    results = benchmark_codecs(air, chunks=(2, 32, 32), samples=2, repeat=1)
+
+    assert [result.codec for result in results] == list(CODECS)
+    for result in results:
+        assert result.ratio > 1
+        assert result.encode_mb_per_s > 0 and result.decode_mb_per_s > 0
+        assert result.chunk_seconds > 0
+    assert results[0].config['cname'] == 'zstd'
+    assert select_codec(results).chunk_seconds == min(r.chunk_seconds for r in results)
+
+
+def test_choose_codec(air):
+    compressor, benchmark = choose_codec(air, chunks=(2, 32, 32), codec='zlib', repeat=1)
+    assert compressor == numcodecs.Zlib(level=5)
+    assert benchmark['selected'] == 'zlib'
+    # the compressor of the source is a candidate too
+    assert {result['codec'] for result in benchmark['results']} == {*CODECS, 'source'}
+
+    compressor, benchmark = choose_codec(air, chunks=(2, 32, 32), repeat=1)
+    best = min(benchmark['results'], key=lambda result: result['chunk_seconds'])
+    assert benchmark['selected'] == best['codec']
+
+
+def test_rechunk_with_compressors(air):
+    source = zarr.group()
+    source.create_dataset('air', data=air[:], chunks=air.chunks, compressor=air.compressor)
+    source.create_dataset('lat', data=np.arange(64, dtype='f8'), chunks=(64,))
+    target = {}
+
+    StreamingRechunker(workers=1, max_mem='10MB').rechunk(
+        source, {'air': (2, 32, 32)}, target, compressors={'air': CODECS['blosc-lz4']}
+    )
+
+    rechunked = zarr.open_group(target, mode='r')
+    assert rechunked['air'].compressor == CODECS['blosc-lz4']
+    assert rechunked['lat'].compressor == source['lat'].compressor
+    np.testing.assert_array_equal(rechunked['air'][:], air[:])
@@ -1,12 +1,144 @@
+import pathlib
+import types
+import uuid
+
 import pytest
+import xarray as xr
 
+from ncviewjs_backend import dataset_processing
 from ncviewjs_backend.dataset_processing import (
+    DatasetTooLargeError,
+    MetadataUnavailableError,
     UnableToOpenDatasetError,
-    validate_zarr_store,
+    ZarrStoreInfo,
+    inspect_zarr_store,
+    load_zarr_store_info,
+    open_zarr_store,
+    parse_zarr_metadata,
+    retrieve_CF_axes,
+    validate_and_rechunk,
+    validate_dataset_size,
 )
+from ncviewjs_backend.models.dataset import Dataset, RechunkRun
 
 
-def test_unable_to_open_store_error():
+def test_unable_to_open_store_error(tmp_path):
     """Test that the Zarr store is accessible"""
     with pytest.raises(UnableToOpenDatasetError):
-        validate_zarr_store('https://raw.githubusercontent.com/foo/bar/baz.zarr')
+        load_zarr_store_info(str(tmp_path / 'missing.zarr'))
+
+
+def test_dataset_too_large():
+    with pytest.raises(DatasetTooLargeError):
+        validate_dataset_size(types.SimpleNamespace(nbytes=61e9))
+    validate_dataset_size(types.SimpleNamespace(nbytes=1e9))
+
+
+def test_load_zarr_store_info(zarr_store):
+    info = load_zarr_store_info(zarr_store)
+    assert info.size == '3.39 kiB'
+    assert info.cf_axes['air'] == {'T': 'time', 'X': 'lon', 'Y': 'lat'}
+
+
+@pytest.fixture
+def open_dataset_calls(monkeypatch):
+    calls = []
+    original_open_dataset = xr.open_dataset
+
+    def open_dataset(*args, **kwargs):
+        calls.append(args)
+        return original_open_dataset(*args, **kwargs)
+
+    monkeypatch.setattr(dataset_processing.xr, 'open_dataset', open_dataset)
+    return calls
+
+
+def test_inspect_zarr_store_matches_xarray(zarr_store, open_dataset_calls):
+    info = inspect_zarr_store(zarr_store)
+    assert not open_dataset_calls
+
+    with open_zarr_store(zarr_store) as ds:
+        assert info.nbytes == ds.nbytes
+        assert info.cf_axes == retrieve_CF_axes(ds)
+        assert set(info.arrays) == set(ds.variables)
+    assert info.arrays['air'].chunk_grid == (1, 1, 1)
+    assert info.arrays['air'].dims == ('time', 'lat', 'lon')
+
+
+def test_parse_zarr_v3_metadata():
+    metadata = {
+        'zarr_format': 3,
+        'node_type': 'group',
+        'attributes': {'title': 'test'},
+        'consolidated_metadata': {
+            'kind': 'inline',
+            'metadata': {
+                'tas': {
+                    'node_type': 'array',
+                    'shape': [365, 180, 360],
+                    'data_type': 'float32',
+                    'chunk_grid': {
+                        'name': 'regular',
+                        'configuration': {'chunk_shape': [10, 90, 90]},
+                    },
+                    'dimension_names': ['time', 'lat', 'lon'],
+                    'attributes': {},
+                },
+                'lat': {
+                    'node_type': 'array',
+                    'shape': [180],
+                    'data_type': 'float64',
+                    'chunk_grid': {'name': 'regular', 'configuration': {'chunk_shape': [180]}},
+                    'dimension_names': ['lat'],
+                    'attributes': {'axis': 'Y'},
+                },
+                'nested/tas': {
+                    'node_type': 'array',
+                    'shape': [1],
+                    'data_type': 'float32',
+                    'chunk_grid': {'name': 'regular', 'configuration': {'chunk_shape': [1]}},
+                    'dimension_names': ['x'],
+                },
+            },
+        },
+    }
+    info = parse_zarr_metadata(metadata)
+    assert set(info.arrays) == {'tas', 'lat'}
+    assert info.nbytes == 365 * 180 * 360 * 4 + 180 * 8
+    assert info.arrays['tas'].chunk_grid == (37, 2, 4)
+    assert info.cf_axes == {'tas': {'Y': 'lat'}, 'lat': {'Y': 'lat'}}
+    assert info.attrs == {'title': 'test'}
+
+
+def test_parse_unknown_metadata():
+    with pytest.raises(MetadataUnavailableError):
+        parse_zarr_metadata({'foo': 'bar'})
+
+
+def test_load_store_info_falls_back_to_xarray(zarr_store, open_dataset_calls):
+    # remove the consolidated metadata so that the store has to be listed by xarray
+    (pathlib.Path(zarr_store) / '.zmetadata').unlink()
+
+    info = load_zarr_store_info(zarr_store)
+    assert len(open_dataset_calls) == 1
+    assert isinstance(info, ZarrStoreInfo)
+    assert info.cf_axes['air'] == {'T': 'time', 'X': 'lon', 'Y': 'lat'}
+
+
+def test_validate_and_rechunk_reads_metadata_once(session, zarr_store, open_dataset_calls):
+    dataset = Dataset(
+        url=zarr_store, md5_id=uuid.uuid4().hex, protocol='file', key='air.zarr', bucket='tmp'
+    )
+    session.add(dataset)
+    session.commit()
+    run = RechunkRun(dataset_id=dataset.id, status='in_progress')
+    session.add(run)
+    session.commit()
+
+    validate_and_rechunk(dataset=dataset, session=session, rechunk_run=run)
+
+    assert not open_dataset_calls
+    assert run.outcome == 'success'
+    assert set(run.timings) == {'open', 'cf_axes', 'size', 'db_write', 'metadata_write'}
+    assert dataset.size == '3.39 kiB'
+    assert dataset.cf_axes['air'] == {'T': 'time', 'X': 'lon', 'Y': 'lat'}
@@ -1,6 +1,16 @@
+import asyncio
+import concurrent.futures
 import json
+import time
+import uuid
 
 import pytest
+import sqlalchemy
+from sqlmodel import select
+
+from ncviewjs_backend.access_tracking import get_access_tracker
+from ncviewjs_backend.metadata_cache import CachedMetadata, get_metadata_cache
+from ncviewjs_backend.models.dataset import Dataset, RechunkRun, Status
 
 urls = [
     # "s3://carbonplan-data-viewer/demo/gpcp_100MB.zarr",
@@ -82,3 +92,403 @@ def test_patch_dataset(test_app_with_db):
     data = response.json()
     assert data["rechunking"] == [{"path": url, "use_case": "test"}]
     assert data["cf_axes"] == {"lat": {"Y": "lat"}}
+
+
+def test_patch_dataset_rechunked_time_range(test_app_with_db):
+    url = urls[0]
+    dataset = test_app_with_db.post('/datasets/', content=json.dumps({"url": url})).json()
+    record = {
+        "path": url,
+        "use_case": "ncview",
+        "time_dim": "time",
+        "time_steps": 365,
+        "last_time": 364.0,
+    }
+    response = test_app_with_db.patch(
+        f"/datasets/{dataset['id']}", content=json.dumps({"rechunking": [record]})
+    )
+    assert response.status_code == 200
+    assert response.json()["rechunking"] == [record]
+
+
+def test_patch_dataset_invalidates_metadata_cache(test_app_with_db):
+    response = test_app_with_db.post('/datasets/', content=json.dumps({"url": urls[0]}))
+    data = response.json()
+    cache = get_metadata_cache()
+    entry = CachedMetadata(url=data['url'], consolidated_metadata={}, fetched_at=time.time())
+    cache._put(data['md5_id'], entry)
+
+    response = test_app_with_db.patch(
+        f"/datasets/{data['id']}", content=json.dumps({"invalidate_metadata_cache": True})
+    )
+    assert response.status_code == 200
+    assert data['md5_id'] not in cache._entries
+
+
+def test_invalidation_reaches_worker_cache(
+    test_app_with_db, session, validate_dataset, zarr_store, monkeypatch
+):
+    from ncviewjs_backend import metadata_cache
+    from ncviewjs_backend.dataset_processing import validate_and_rechunk
+
+    # the worker validating datasets and the web app each have their own cache
+    worker, web = metadata_cache.MetadataCache(ttl=600), metadata_cache.MetadataCache(ttl=600)
+    monkeypatch.setattr(metadata_cache, '_cache', worker)
+    dataset = validate_dataset(zarr_store)
+    assert worker.stats()['misses'] == 1
+
+    monkeypatch.setattr(metadata_cache, '_cache', web)
+    response = test_app_with_db.patch(
+        f"/datasets/{dataset.id}", content=json.dumps({"invalidate_metadata_cache": True})
+    )
+    assert response.status_code == 200
+    # the stale metadata is still served until the dataset is validated again
+    assert test_app_with_db.get(f"/datasets/{dataset.id}/zmetadata").status_code == 200
+    run = session.exec(
+        select(RechunkRun).where(
+            RechunkRun.dataset_id == dataset.id, RechunkRun.status == Status.queued
+        )
+    ).one()
+
+    monkeypatch.setattr(metadata_cache, '_cache', worker)
+    validate_and_rechunk(dataset=dataset, session=session, rechunk_run=run)
+    assert worker.stats()['hits'] == 0
+    assert worker.stats()['misses'] == 2
+    session.expire_all()
+    assert not session.get(metadata_cache.StoreMetadata, dataset.md5_id).stale
+    assert test_app_with_db.get(f"/datasets/{dataset.id}/zmetadata").status_code == 200
+
+
+@pytest.fixture
+def bucket_datasets(test_app_with_db):
+    bucket = f'pagination-{uuid.uuid4().hex}'
+    ids = []
+    for index in range(5):
+        response = test_app_with_db.post(
+            "/datasets/", content=json.dumps({"url": f"s3://{bucket}/store-{index}.zarr"})
+        )
+        ids.append(response.json()['id'])
+    return bucket, ids
+
+
+@pytest.mark.parametrize('order_by', ['id', 'created'])
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_list_datasets_pagination(test_app_with_db, bucket_datasets, order_by, order):
+    bucket, ids = bucket_datasets
+    seen = []
+    params = {'bucket': bucket, 'limit': 2, 'order_by': order_by, 'order': order}
+    for _ in range(5):
+        response = test_app_with_db.get("/datasets/", params=params)
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        seen.extend(dataset['id'] for dataset in response.json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+        assert 'rel="next"' in response.headers['Link']
+        params['cursor'] = cursor
+
+    assert seen == (ids if order == 'asc' else ids[::-1])
+
+
+def test_datasets_always_have_a_created_time(session):
+    # rows without a created time would be skipped by the (created, id) pagination
+    md5_id = uuid.uuid4().hex
+    session.exec(
+        sqlalchemy.text(
+            "INSERT INTO dataset (url, md5_id, protocol, key, bucket) "
+            "VALUES ('s3://created/store.zarr', :md5_id, 's3', 'store.zarr', 'created')"
+        ).bindparams(md5_id=md5_id)
+    )
+    session.commit()
+    dataset = session.exec(select(Dataset).where(Dataset.md5_id == md5_id)).one()
+    assert dataset.created is not None
+
+    dataset.created = None
+    session.add(dataset)
+    with pytest.raises(sqlalchemy.exc.IntegrityError):
+        session.commit()
+    session.rollback()
+
+
+def test_list_datasets_filters(test_app_with_db, bucket_datasets):
+    bucket, ids = bucket_datasets
+    response = test_app_with_db.get(
+        "/datasets/",
+        params={'bucket': bucket, 'protocol': 's3', 'created_before': '2000-01-01T00:00:00Z'},
+    )
+    assert response.json() == []
+
+    response = test_app_with_db.get(
+        "/datasets/", params={'bucket': bucket, 'created_after': '2000-01-01T00:00:00Z'}
+    )
+    assert [dataset['id'] for dataset in response.json()] == ids
+
+
+def test_list_datasets_projection(test_app_with_db, bucket_datasets):
+    bucket, ids = bucket_datasets
+    response = test_app_with_db.get("/datasets/", params={'bucket': bucket, 'fields': 'url,size'})
+    assert response.status_code == 200
+    data = response.json()
+    assert [dataset['id'] for dataset in data] == ids
+    assert all(set(dataset) == {'id', 'url', 'size'} for dataset in data)
+
+    response = test_app_with_db.get("/datasets/", params={'fields': 'url,secret'})
+    assert response.status_code == 400
+    assert 'secret' in response.json()['detail']
+
+
+def test_list_datasets_invalid_cursor(test_app_with_db):
+    response = test_app_with_db.get("/datasets/", params={'cursor': 'not-a-cursor'})
+    assert response.status_code == 400
+
+
+def complete_runs(session, dataset_id: int) -> None:
+    # a forced registration only queues a run once the queued one was picked up
+    session.exec(
+        sqlalchemy.update(RechunkRun)
+        .where(RechunkRun.dataset_id == dataset_id)
+        .values(status=Status.completed)
+    )
+    session.commit()
+
+
+@pytest.mark.parametrize("latest", [True, False])
+def test_get_dataset_rechunk_runs(test_app_with_db, session, count_queries, latest):
+    url = f"s3://query-count-{uuid.uuid4().hex}/store.zarr"
+    dataset = test_app_with_db.post("/datasets/", content=json.dumps({"url": url})).json()
+    for _ in range(3):
+        complete_runs(session, dataset['id'])
+        test_app_with_db.post("/datasets/", content=json.dumps({"url": url, "force": True}))
+
+    with count_queries() as statements:
+        response = test_app_with_db.get(f"/datasets/{dataset['id']}", params={'latest': latest})
+    assert response.status_code == 200
+    # a select of the dataset and a single select of its runs
+    assert len(statements) == 2
+
+    run_ids = [run['id'] for run in response.json()['rechunk_runs']]
+    if latest:
+        assert len(run_ids) == 1
+    else:
+        assert len(run_ids) == 4
+        assert run_ids == sorted(run_ids)
+        assert run_ids[-1] == max(run_ids)
+
+
+def test_list_datasets_query_count(test_app_with_db, bucket_datasets, count_queries):
+    bucket, _ = bucket_datasets
+    with count_queries() as statements:
+        response = test_app_with_db.get("/datasets/", params={'bucket': bucket})
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+
+def test_register_datasets_batch(test_app_with_db, count_queries):
+    bucket = f'batch-{uuid.uuid4().hex}'
+    existing = test_app_with_db.post(
+        "/datasets/", content=json.dumps({"url": f"s3://{bucket}/existing.zarr"})
+    ).json()
+    payloads = [
+        {"url": f"s3://{bucket}/a.zarr"},
+        {"url": f"s3://{bucket}/b.zarr"},
+        {"url": f"s3://{bucket}/a.zarr/"},
+        {"url": f"s3://{bucket}/existing.zarr"},
+        {"url": f"s3://{bucket}/existing.zarr", "force": True},
+        {"url": "ftp://example.com"},
+    ]
+
+    with count_queries() as statements:
+        response = test_app_with_db.post("/datasets/batch", content=json.dumps(payloads))
+    assert response.status_code == 200
+    # the lookup of existing datasets, the insert of datasets, the lookup of the queued runs
+    # of the datasets registered with force and the insert of runs
+    assert len(statements) == 4
+
+    data = response.json()
+    assert [item['status'] for item in data] == [
+        'created',
+        'created',
+        'created',
+        'requeued',
+        'requeued',
+        'invalid',
+    ]
+    assert data[0]['dataset']['id'] == data[2]['dataset']['id']
+    assert data[3]['dataset']['id'] == existing['id']
+    assert data[5]['dataset'] is None
+
+    # the forced registration joined the run queued by the first registration
+    response = test_app_with_db.get("/runs/", params={'dataset_id': existing['id']})
+    assert len(response.json()) == 1
+    response = test_app_with_db.get("/runs/", params={'dataset_id': data[0]['dataset']['id']})
+    assert len(response.json()) == 1
+
+    response = test_app_with_db.post("/datasets/batch", content=json.dumps(payloads[:2]))
+    assert [item['status'] for item in response.json()] == ['exists', 'exists']
+
+
+def test_register_unsupported_url(test_app_with_db):
+    response = test_app_with_db.post(
+        "/datasets/", content=json.dumps({"url": "ftp://example.com/a"})
+    )
+    assert response.status_code == 422
+    assert 'Unsupported store URL' in response.json()['detail']
+
+
+def test_register_dataset_concurrently(test_app_with_db):
+    url = f"s3://concurrent-{uuid.uuid4().hex}/store.zarr"
+
+    def register(force):
+        return test_app_with_db.post("/datasets/", content=json.dumps({"url": url, "force": force}))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(register, [False, True] * 8))
+    assert {response.status_code for response in responses} == {201}
+    assert len({response.json()['id'] for response in responses}) == 1
+
+    # all the registrations share the queued run
+    dataset_id = responses[0].json()['id']
+    response = test_app_with_db.get("/runs/", params={'dataset_id': dataset_id})
+    assert len(response.json()) == 1
+
+
+def test_force_requeues_once_the_run_started(test_app_with_db, session):
+    url = f"s3://force-{uuid.uuid4().hex}/store.zarr"
+    dataset = test_app_with_db.post("/datasets/", content=json.dumps({"url": url})).json()
+    run = session.exec(select(RechunkRun).where(RechunkRun.dataset_id == dataset['id'])).one()
+    run.status = Status.in_progress
+    session.add(run)
+    session.commit()
+
+    for _ in range(2):
+        test_app_with_db.post("/datasets/", content=json.dumps({"url": url, "force": True}))
+    response = test_app_with_db.get("/runs/", params={'dataset_id': dataset['id']})
+    assert [run['status'] for run in response.json()] == ['in_progress', 'queued']
+
+
+def test_md5_id_is_unique(session):
+    md5_id = uuid.uuid4().hex
+    for _ in range(2):
+        session.add(Dataset(url='s3://a/b', md5_id=md5_id, protocol='s3', key='b', bucket='a'))
+    with pytest.raises(sqlalchemy.exc.IntegrityError):
+        session.commit()
+    session.rollback()
+
+
+def test_register_datasets_batch_too_large(test_app_with_db):
+    payloads = [{"url": f"s3://bucket/{index}.zarr"} for index in range(1001)]
+    response = test_app_with_db.post("/datasets/batch", content=json.dumps(payloads))
+    assert response.status_code == 422
+
+
+def test_get_dataset_does_not_write(test_app_with_db, count_queries):
+    bucket = f'access-{uuid.uuid4().hex}'
+    dataset = test_app_with_db.post(
+        "/datasets/", content=json.dumps({"url": f"s3://{bucket}/store.zarr"})
+    ).json()
+
+    with count_queries() as statements:
+        response = test_app_with_db.get(f"/datasets/{dataset['id']}")
+    assert all(statement.lstrip().upper().startswith('SELECT') for statement in statements)
+    assert response.json()['last_accessed'] == dataset['last_accessed']
+
+    get_access_tracker().flush()
+    response = test_app_with_db.get("/datasets/", params={'bucket': bucket})
+    assert response.json()[0]['last_accessed'] > dataset['last_accessed']
+
+
+def test_get_dataset_records_access_off_the_event_loop(test_app_with_db, monkeypatch):
+    calls = []
+
+    def record(dataset_id, accessed=None):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            calls.append(dataset_id)
+        else:
+            calls.append('event loop')
+
+    # with a flush interval of 0 recording writes to the database
+    monkeypatch.setattr(get_access_tracker(), 'record', record)
+    dataset = test_app_with_db.post("/datasets/", content=json.dumps({"url": urls[1]})).json()
+    response = test_app_with_db.get(f"/datasets/{dataset['id']}")
+    response = test_app_with_db.get(
+        f"/datasets/{dataset['id']}", headers={'If-None-Match': response.headers['ETag']}
+    )
+    assert response.status_code == 304
+    assert calls == [dataset['id'], dataset['id']]
+
+
+def test_get_dataset_conditional(test_app_with_db, session, count_queries):
+    url = f"s3://etag-{uuid.uuid4().hex}/store.zarr"
+    dataset = test_app_with_db.post("/datasets/", content=json.dumps({"url": url})).json()
+
+    response = test_app_with_db.get(f"/datasets/{dataset['id']}")
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    etag = response.headers['ETag']
+
+    with count_queries() as statements:
+        response = test_app_with_db.get(
+            f"/datasets/{dataset['id']}", headers={'If-None-Match': etag}
+        )
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert not response.content
+    assert len(statements) == 1
+
+    # the representation without the latest=true filter has its own ETag
+    response = test_app_with_db.get(
+        f"/datasets/{dataset['id']}", params={'latest': False}, headers={'If-None-Match': etag}
+    )
+    assert response.status_code == 200
+
+    # a new run changes the representation
+    complete_runs(session, dataset['id'])
+    test_app_with_db.post("/datasets/", content=json.dumps({"url": url, "force": True}))
+    response = test_app_with_db.get(f"/datasets/{dataset['id']}", headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+@pytest.fixture
+def validated_dataset(validate_dataset, zarr_store):
+    return validate_dataset(zarr_store)
+
+
+@pytest.mark.parametrize('accept_encoding', ['br', 'gzip, deflate', 'identity'])
+def test_get_dataset_zmetadata(test_app_with_db, validated_dataset, zarr_store, accept_encoding):
+    with open(f'{zarr_store}/.zmetadata') as f:
+        expected = json.load(f)
+
+    url = f"/datasets/{validated_dataset.id}/zmetadata"
+    response = test_app_with_db.get(url, headers={'Accept-Encoding': accept_encoding})
+    assert response.status_code == 200
+    assert response.json() == expected
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.headers['Cache-Control'].startswith('public')
+    encoding = accept_encoding.split(',')[0]
+    if encoding == 'identity':
+        assert 'Content-Encoding' not in response.headers
+    else:
+        assert response.headers['Content-Encoding'] == encoding
+
+    etag = response.headers['ETag']
+    response = test_app_with_db.get(
+        url, headers={'Accept-Encoding': accept_encoding, 'If-None-Match': etag}
+    )
+    assert response.status_code == 304
+
+    # another coding is another representation
+    other = 'identity' if encoding != 'identity' else 'gzip'
+    response = test_app_with_db.get(url, headers={'Accept-Encoding': other, 'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_get_dataset_zmetadata_not_validated(test_app_with_db):
+    url = f"s3://zmetadata-{uuid.uuid4().hex}/store.zarr"
+    dataset = test_app_with_db.post("/datasets/", content=json.dumps({"url": url})).json()
+    response = test_app_with_db.get(f"/datasets/{dataset['id']}/zmetadata")
+    assert response.status_code == 404
+    assert 'metadata' in response.json()['detail']
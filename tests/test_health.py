@@ -6,3 +6,32 @@ def test_ping(test_app):
         "environment": "dev",
         "testing": True,
     }
+
+
+def test_status_reports_pool_stats(test_app_with_db):
+    # make sure at least one connection has been checked out of the pool
+    test_app_with_db.get('/datasets/')
+    response = test_app_with_db.get("/health/")
+    assert response.status_code == 200
+    data = response.json()
+    assert data['status'] == 'ok'
+    key = (
+        'async_database_pool'
+        if test_app_with_db.app.state.settings.async_database
+        else 'database_pool'
+    )
+    assert {'size', 'checked_out', 'overflow', 'wait_time_total'}.issubset(data[key].keys())
+    assert data[key]['checkouts'] >= 1
+
+
+def test_status_does_not_query_the_database(test_app_with_db, count_queries):
+    with count_queries() as queries:
+        response = test_app_with_db.get("/health/")
+    assert response.status_code == 200
+    assert queries == []
+
+
+def test_validation_queue(test_app_with_db):
+    response = test_app_with_db.get("/health/queue")
+    assert response.status_code == 200
+    assert {'queued', 'in_progress', 'duration_p50_seconds'}.issubset(response.json())
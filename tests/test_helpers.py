@@ -1,4 +1,6 @@
+import hypothesis
 import pytest
+from hypothesis import strategies as st
 
 from ncviewjs_backend.helpers import sanitize_url
 
@@ -33,3 +35,103 @@ def test_sanitize_url(url, expected_bucket, expected_key):
     sanitized_url = sanitize_url(url)
     assert sanitized_url.bucket == expected_bucket
     assert sanitized_url.key == expected_key
+
+
+def legacy_sanitize_url(url: str) -> tuple[str, str, str, str]:
+    """The UPath and regex based implementation the dispatch table replaced"""
+    import re
+
+    import upath
+
+    from ncviewjs_backend.helpers import gs_to_https, s3_to_https
+
+    url = url.rstrip("/")
+    parsed_url = upath.UPath(url)._url
+    bucket = key = None
+    if parsed_url.scheme in {'http', 'https'}:
+        if 'amazonaws.com' in parsed_url.netloc:
+            for pattern, groups in [
+                ('^https?://([^.]+).s3.([^.]+).amazonaws.com(.*?)$', (1, 3)),
+                ('^https?://([^.]+)-([^.]+).s3-accesspoint.([^.]+).amazonaws.com(.*?)$', (1, 4)),
+                ('^https?://([^.]+).s3.amazonaws.com(.*?)$', (1, 2)),
+            ]:
+                if match := re.search(pattern, url):
+                    bucket, key = match[groups[0]], match[groups[1]]
+        elif 'googleapis.com' in parsed_url.netloc:
+            bucket, key = url.split('storage.googleapis.com/')[1].split('/', 1)
+        elif 'blob.core.windows.net' in parsed_url.netloc:
+            if match := re.search('^https?://([^.]+).blob.core.windows.net(.*?)$', url):
+                bucket, key = match[1], match[2]
+        else:
+            bucket, key = parsed_url.netloc, parsed_url.path
+    elif parsed_url.scheme in {'s3', 'gs', 'az', 'abfs'}:
+        bucket, key = parsed_url.netloc, parsed_url.path
+    if parsed_url.scheme == 'gs':
+        url = gs_to_https(gs_url=url)
+    elif parsed_url.scheme == 's3':
+        url = s3_to_https(s3_url=url)
+    return url.strip('/'), parsed_url.scheme, bucket.strip('/'), key.strip('/')
+
+
+names = st.from_regex(r'[a-z0-9][a-z0-9-]{1,20}[a-z0-9]', fullmatch=True)
+regions = st.sampled_from(['us-west-2', 'eu-central-1', 'ap-southeast-2'])
+keys = st.lists(st.from_regex(r'[A-Za-z0-9_.-]*[A-Za-z0-9_-]', fullmatch=True), max_size=4).map(
+    '/'.join
+)
+
+
+@st.composite
+def store_urls(draw) -> str:
+    bucket, key, region = draw(names), draw(keys), draw(regions)
+    host = draw(st.sampled_from(['localhost:8000', 'example.com', 'data.example.org']))
+    form = draw(
+        st.sampled_from(
+            [
+                f's3://{bucket}/{key}',
+                f'gs://{bucket}/{key}',
+                f'az://{bucket}/{key}',
+                f'abfs://{bucket}@account.dfs.core.windows.net/{key}',
+                f'https://{bucket}.s3.amazonaws.com/{key}',
+                f'https://{bucket}.s3.{region}.amazonaws.com/{key}',
+                f'https://{bucket}.s3-{region}.amazonaws.com/{key}',
+                f'https://{bucket}-123456789012.s3-accesspoint.{region}.amazonaws.com/{key}',
+                f'https://storage.googleapis.com/{bucket}/{key}',
+                f'https://{bucket}.blob.core.windows.net/{key}',
+                f'{draw(st.sampled_from(["http", "https"]))}://{host}/{key}',
+            ]
+        )
+    )
+    return form + draw(st.sampled_from(['', '/', '?version=1']))
+
+
+@hypothesis.settings(max_examples=500, deadline=None)
+@hypothesis.given(store_urls())
+def test_sanitize_url_matches_legacy_implementation(url):
+    try:
+        expected = legacy_sanitize_url(url)
+    except Exception:
+        # the URLs the legacy implementation rejected are out of scope
+        hypothesis.reject()
+    sanitized = sanitize_url(url)
+    assert (sanitized.url, sanitized.protocol, sanitized.bucket, sanitized.key) == expected
+
+
+@pytest.mark.parametrize(
+    'url, expected_bucket, expected_key',
+    [
+        ('https://s3.amazonaws.com/bucket/a/key.zarr', 'bucket', 'a/key.zarr'),
+        ('https://s3.us-west-2.amazonaws.com/bucket/key', 'bucket', 'key'),
+        ('https://my.bucket.s3.dualstack.us-east-1.amazonaws.com/key', 'my.bucket', 'key'),
+        ('https://my-ap-123456789012.s3-accesspoint.us-west-2.amazonaws.com/k', 'my-ap', 'k'),
+        ('S3://bucket/key', 'bucket', 'key'),
+    ],
+)
+def test_sanitize_url_new_forms(url, expected_bucket, expected_key):
+    sanitized_url = sanitize_url(url)
+    assert (sanitized_url.bucket, sanitized_url.key) == (expected_bucket, expected_key)
+
+
+@pytest.mark.parametrize('url', ['ftp://example.com/a', '/tmp/store.zarr', 's3://', 'not a url'])
+def test_sanitize_url_unsupported(url):
+    with pytest.raises(ValueError, match='Unsupported store URL'):
+        sanitize_url(url)
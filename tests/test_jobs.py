@@ -0,0 +1,264 @@
+import datetime
+import threading
+import time
+import uuid
+
+import pytest
+from sqlalchemy import literal, update
+from sqlmodel import Session, select
+
+from ncviewjs_backend import dataset_processing
+from ncviewjs_backend.jobs import (
+    HostLimiter,
+    claim_next_run,
+    execute_run,
+    origin_host,
+    origin_host_expression,
+    queue_stats,
+    requeue_stale_runs,
+    retry_delay,
+)
+from ncviewjs_backend.models.dataset import Dataset, RechunkRun, Status
+from ncviewjs_backend.worker import Worker
+
+from .conftest import make_settings
+
+
+@pytest.fixture
+def empty_queue(session):
+    """Cancel runs left over by other tests so that only the runs of a test are claimable"""
+    session.exec(
+        update(RechunkRun)
+        .where(RechunkRun.status.in_([Status.queued, Status.in_progress]))
+        .values(status=Status.completed, outcome='cancelled')
+    )
+    session.commit()
+
+
+@pytest.fixture
+def queued_run(session, empty_queue, zarr_store):
+    dataset = Dataset(
+        url=zarr_store, md5_id=uuid.uuid4().hex, protocol='file', key='air.zarr', bucket='tmp'
+    )
+    session.add(dataset)
+    session.commit()
+    run = RechunkRun(dataset_id=dataset.id, status='queued')
+    session.add(run)
+    session.commit()
+    session.refresh(run)
+    return run
+
+
+def test_claim_next_run(session, queued_run):
+    run = claim_next_run(session, worker_id='worker-a', lease_seconds=60)
+    assert run.id == queued_run.id
+    assert run.status == Status.in_progress
+    assert run.attempts == 1
+    assert run.worker_id == 'worker-a'
+    assert run.lease_expires_at > datetime.datetime.utcnow()
+
+    # a leased run is not handed out twice
+    assert claim_next_run(session, worker_id='worker-b', lease_seconds=60) is None
+
+
+def test_claim_skips_locked_runs(session, queued_run):
+    with Session(session.get_bind()) as other_session:
+        locked = claim_next_run(other_session, worker_id='worker-a', lease_seconds=60)
+        assert locked.id == queued_run.id
+
+        # lock the row the way a claiming transaction does and make sure it is skipped
+        other_session.exec(
+            RechunkRun.__table__.select().where(RechunkRun.id == locked.id).with_for_update()
+        )
+        assert claim_next_run(session, worker_id='worker-b', lease_seconds=60) is None
+        other_session.rollback()
+
+
+def test_expired_lease_is_reclaimed(session, queued_run):
+    run = claim_next_run(session, worker_id='worker-a', lease_seconds=-1)
+    assert run.status == Status.in_progress
+
+    reclaimed = claim_next_run(session, worker_id='worker-b', lease_seconds=60)
+    assert reclaimed.id == queued_run.id
+    assert reclaimed.worker_id == 'worker-b'
+    assert reclaimed.attempts == 2
+
+
+def test_requeue_stale_runs(session, queued_run):
+    # runs started without a lease, by the Prefect flow, are not requeued
+    queued_run.status = Status.in_progress
+    session.add(queued_run)
+    session.commit()
+    assert requeue_stale_runs(session) == 0
+
+    queued_run.status = Status.queued
+    session.add(queued_run)
+    session.commit()
+    claim_next_run(session, worker_id='worker-a', lease_seconds=-1)
+    assert requeue_stale_runs(session) == 1
+    session.refresh(queued_run)
+    assert queued_run.status == Status.queued
+    assert queued_run.worker_id is None
+
+
+def test_execute_run_keeps_the_lease_of_a_new_owner(session, queued_run):
+    run = claim_next_run(session, worker_id='worker-a', lease_seconds=-1)
+    with Session(session.get_bind()) as other_session:
+        reclaimed = claim_next_run(other_session, worker_id='worker-b', lease_seconds=60)
+        assert reclaimed.id == run.id
+
+    execute_run(session, run=run, settings=make_settings())
+    session.refresh(run)
+    assert run.worker_id == 'worker-b'
+    assert run.lease_expires_at is not None
+
+
+def test_execute_run_success(session, queued_run):
+    settings = make_settings()
+    run = claim_next_run(session, worker_id='worker-a', lease_seconds=60)
+    execute_run(session, run=run, settings=settings)
+
+    session.refresh(run)
+    assert run.status == Status.completed
+    assert run.outcome == 'success'
+    assert run.lease_expires_at is None
+    assert set(run.timings) == {'open', 'cf_axes', 'size', 'db_write', 'metadata_write'}
+    dataset = session.get(Dataset, run.dataset_id)
+    assert dataset.cf_axes['air'] == {'T': 'time', 'X': 'lon', 'Y': 'lat'}
+
+
+def test_execute_run_retries_with_backoff(session, queued_run, monkeypatch):
+    def fail(**kwargs):
+        raise dataset_processing.UnableToOpenDatasetError('boom')
+
+    monkeypatch.setattr(dataset_processing, 'validate_and_rechunk', fail)
+    settings = make_settings(job_max_attempts=2, job_retry_backoff=60)
+
+    run = claim_next_run(session, worker_id='worker-a', lease_seconds=60)
+    execute_run(session, run=run, settings=settings)
+    session.refresh(run)
+    assert run.status == Status.queued
+    assert run.next_attempt_at > datetime.datetime.utcnow()
+    assert 'boom' in run.error_message
+
+    # the backoff delay has not passed yet
+    assert claim_next_run(session, worker_id='worker-a', lease_seconds=60) is None
+
+    run.next_attempt_at = None
+    session.add(run)
+    session.commit()
+    run = claim_next_run(session, worker_id='worker-a', lease_seconds=60)
+    execute_run(session, run=run, settings=settings)
+    session.refresh(run)
+    assert run.status == Status.completed
+    assert run.outcome == 'failure'
+
+
+def test_retry_delay():
+    settings = make_settings(job_max_attempts=4, job_retry_backoff=10, job_retry_backoff_max=25)
+    assert retry_delay(attempts=1, settings=settings) == 10
+    assert retry_delay(attempts=2, settings=settings) == 20
+    assert retry_delay(attempts=3, settings=settings) == 25
+    assert retry_delay(attempts=4, settings=settings) is None
+
+
+def test_worker_run_once(session, queued_run):
+    worker = Worker(settings=make_settings(), concurrency=1)
+    assert worker.run_once()
+    assert not worker.run_once()
+    session.refresh(queued_run)
+    assert queued_run.status == Status.completed
+
+
+@pytest.mark.parametrize(
+    'url,host',
+    [
+        ('s3://bucket/store.zarr', 'bucket'),
+        ('gs://other-bucket/a/b.zarr', 'other-bucket'),
+        ('https://storage.googleapis.com/bucket/store.zarr', 'storage.googleapis.com'),
+        ('http://localhost:8000/store.zarr?x=1', 'localhost:8000'),
+        ('/tmp/store.zarr', 'local'),
+        ('file:///tmp/store.zarr', 'local'),
+    ],
+)
+def test_origin_host(session, url, host):
+    assert origin_host(url) == host
+    # the claim query computes the same host in SQL
+    assert session.exec(select(origin_host_expression(literal(url)))).one() == host
+
+
+def test_claim_skips_saturated_hosts(session, queued_run):
+    assert claim_next_run(session, worker_id='a', lease_seconds=60, exclude_hosts={'local'}) is None
+    run = claim_next_run(session, worker_id='a', lease_seconds=60, exclude_hosts={'bucket'})
+    assert run.id == queued_run.id
+
+
+def test_host_limiter():
+    hosts = HostLimiter(2)
+    hosts.acquire('a')
+    hosts.acquire('b')
+    assert hosts.saturated() == set()
+    hosts.acquire('a')
+    assert hosts.saturated() == {'a'}
+    hosts.release('a')
+    assert hosts.saturated() == set()
+    assert hosts.stats() == {'a': 1, 'b': 1}
+
+
+def test_execute_run_times_out(session, queued_run, monkeypatch):
+    def slow(*args, **kwargs):
+        time.sleep(2)
+
+    monkeypatch.setattr(dataset_processing, 'load_zarr_store_info', slow)
+    # timed out runs are not retried
+    settings = make_settings(job_timeout=0.1, job_max_attempts=3)
+    run = claim_next_run(session, worker_id='worker-a', lease_seconds=60)
+    start = time.perf_counter()
+    execute_run(session, run=run, settings=settings)
+    assert time.perf_counter() - start < 1
+
+    session.refresh(run)
+    assert run.status == Status.completed
+    assert run.outcome == 'timed_out'
+    assert 'Timed out' in run.error_message
+
+
+def test_abandoned_reads_hold_their_host(session, queued_run, monkeypatch):
+    done = threading.Event()
+
+    def hanging(*args, **kwargs):
+        done.wait(5)
+
+    monkeypatch.setattr(dataset_processing, 'load_zarr_store_info', hanging)
+    worker = Worker(settings=make_settings(job_timeout=0.1, worker_host_concurrency=1))
+    assert worker.run_once()
+    # the read still running keeps the slot of its host after the run timed out
+    assert worker.hosts.stats() == {'local': 1}
+    assert worker.hosts.saturated() == {'local'}
+    retry = RechunkRun(dataset_id=queued_run.dataset_id, status='queued')
+    session.add(retry)
+    session.commit()
+    assert not worker.run_once()
+
+    done.set()
+    deadline = time.monotonic() + 5
+    while worker.hosts.saturated() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert worker.hosts.stats() == {}
+    assert worker.run_once()
+
+
+def test_queue_stats(session, queued_run):
+    stats = queue_stats(session)
+    assert stats['queued'] == 1
+    assert stats['in_progress'] == 0
+    assert stats['oldest_queued_seconds'] >= 0
+
+    worker = Worker(settings=make_settings(), concurrency=1)
+    assert worker.run_once()
+    stats = worker.stats()
+    assert stats['processed'] == 1
+    assert stats['in_progress_by_host'] == {}
+    assert stats['queue']['queued'] == 0
+    assert stats['queue']['completed'] >= 1
+    assert stats['queue']['duration_p95_seconds'] >= stats['queue']['duration_p50_seconds'] >= 0
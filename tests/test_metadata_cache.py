@@ -0,0 +1,124 @@
+import os
+import pathlib
+import threading
+import time
+import uuid
+
+import pytest
+
+from ncviewjs_backend.metadata_cache import MetadataCache, MetadataUnavailableError
+from ncviewjs_backend.models.dataset import StoreMetadata
+
+
+def test_cache_hit_and_revalidation(zarr_http_store):
+    url, requests = zarr_http_store
+    cache = MetadataCache(ttl=60)
+
+    metadata = cache.get(key='abc', url=url)
+    assert 'air/.zarray' in metadata['metadata']
+    assert cache.stats()['misses'] == 1
+    assert len(requests) == 1
+
+    # a fresh entry is served from memory
+    assert cache.get(key='abc', url=url) == metadata
+    assert cache.stats()['hits'] == 1
+    assert len(requests) == 1
+
+    # a stale entry of an unchanged store is revalidated with a single 304 round-trip
+    cache.ttl = 0
+    assert cache.get(key='abc', url=url) == metadata
+    assert cache.stats()['revalidations'] == 1
+    assert len(requests) == 2
+    assert requests[-1][1] is not None
+
+
+def test_cache_refreshes_modified_store(zarr_http_store, zarr_store):
+    url, requests = zarr_http_store
+    cache = MetadataCache(ttl=0)
+    cache.get(key='abc', url=url)
+
+    zmetadata = pathlib.Path(zarr_store) / '.zmetadata'
+    future = time.time() + 3600
+    os.utime(zmetadata, (future, future))
+
+    cache.get(key='abc', url=url)
+    assert cache.stats()['refreshes'] == 1
+
+
+def test_cache_invalidate(zarr_store):
+    cache = MetadataCache(ttl=60)
+    cache.get(key='abc', url=zarr_store)
+    cache.invalidate('abc')
+    assert len(cache) == 0
+    cache.get(key='abc', url=zarr_store)
+    assert cache.stats()['misses'] == 2
+
+
+def test_cache_is_bounded(zarr_store):
+    cache = MetadataCache(max_entries=2, ttl=60)
+    for key in ('a', 'b', 'c'):
+        cache.get(key=key, url=zarr_store)
+    assert len(cache) == 2
+    cache.get(key='a', url=zarr_store)
+    assert cache.stats()['misses'] == 4
+
+
+def test_cache_shared_through_database(session, zarr_store):
+    first = MetadataCache(ttl=60, shared=True)
+    second = MetadataCache(ttl=60, shared=True)
+    key = uuid.uuid4().hex
+
+    metadata = first.get(key=key, url=zarr_store)
+    # only validated metadata is shared
+    assert session.get(StoreMetadata, key) is None
+    assert second.get(key=key, url=zarr_store) == metadata
+    assert second.stats()['shared_hits'] == 0
+    assert first.persist(key)
+    third = MetadataCache(ttl=60, shared=True)
+    assert third.get(key=key, url=zarr_store) == metadata
+    assert third.stats()['shared_hits'] == 1
+
+    first.invalidate(key)
+    fourth = MetadataCache(ttl=60, shared=True)
+    fourth.get(key=key, url=zarr_store)
+    assert fourth.stats()['misses'] == 1
+
+
+def test_missing_metadata(zarr_http_store, zarr_store):
+    url, _ = zarr_http_store
+    (pathlib.Path(zarr_store) / '.zmetadata').unlink()
+    with pytest.raises(MetadataUnavailableError):
+        MetadataCache().get(key='abc', url=url)
+
+
+def test_concurrent_misses_share_one_fetch(zarr_store):
+    cache = MetadataCache(ttl=60)
+    fetch = cache._fetch
+    started = threading.Event()
+    release = threading.Event()
+    fetches = []
+
+    def slow_fetch(url, entry):
+        fetches.append(url)
+        started.set()
+        release.wait(5)
+        return fetch(url, entry)
+
+    cache._fetch = slow_fetch
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get(key='abc', url=zarr_store)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    while cache.stats()['coalesced'] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(fetches) == 1
+    assert len(results) == 4 and all(result == results[0] for result in results)
+    assert cache.stats()['misses'] == 1
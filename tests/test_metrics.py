@@ -0,0 +1,134 @@
+import os
+import subprocess
+import sys
+import uuid
+
+import pytest
+import sqlalchemy
+from prometheus_client import REGISTRY
+
+from ncviewjs_backend.dataset_processing import process_dataset
+from ncviewjs_backend.metrics import _operation, instrument_database
+from ncviewjs_backend.models.dataset import Dataset, RechunkRun
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_metrics_endpoint(test_app_with_db):
+    before = sample(
+        'ncviewjs_http_request_duration_seconds_count',
+        method='GET',
+        route='/datasets/',
+        status='200',
+    )
+    queries = sample('ncviewjs_db_queries_total', operation='SELECT')
+    assert test_app_with_db.get('/datasets/').status_code == 200
+
+    response = test_app_with_db.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    # requests are labelled by route template, not by the path
+    assert (
+        sample(
+            'ncviewjs_http_request_duration_seconds_count',
+            method='GET',
+            route='/datasets/',
+            status='200',
+        )
+        == before + 1
+    )
+    assert sample('ncviewjs_db_queries_total', operation='SELECT') > queries
+    pool = 'async' if test_app_with_db.app.state.settings.async_database else 'sync'
+    assert f'ncviewjs_db_pool_connections{{pool="{pool}",state="size"}}' in response.text
+    assert 'ncviewjs_validation_queue_runs{state="queued"}' in response.text
+
+
+def test_unmatched_paths_share_a_label(test_app_with_db):
+    before = sample(
+        'ncviewjs_http_request_duration_seconds_count',
+        method='GET',
+        route='unmatched',
+        status='404',
+    )
+    test_app_with_db.get(f'/{uuid.uuid4().hex}')
+    assert (
+        sample(
+            'ncviewjs_http_request_duration_seconds_count',
+            method='GET',
+            route='unmatched',
+            status='404',
+        )
+        == before + 1
+    )
+
+
+def test_validation_phases_are_observed(session, zarr_store):
+    instrument_database()
+    labels = {'protocol': 'file', 'outcome': 'success'}
+    before = {
+        phase: sample('ncviewjs_validation_phase_duration_seconds_count', phase=phase, **labels)
+        for phase in ('open', 'cf_axes', 'size', 'db_write')
+    }
+    dataset = Dataset(
+        url=zarr_store, md5_id=uuid.uuid4().hex, protocol='file', key='air.zarr', bucket='tmp'
+    )
+    session.add(dataset)
+    session.commit()
+    run = RechunkRun(dataset_id=dataset.id)
+    session.add(run)
+    session.commit()
+
+    process_dataset(dataset=dataset, rechunk_run=run, session=session)
+
+    for phase, count in before.items():
+        assert (
+            sample('ncviewjs_validation_phase_duration_seconds_count', phase=phase, **labels)
+            == count + 1
+        )
+
+
+def test_metrics_of_worker_processes_are_summed(tmp_path):
+    env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': str(tmp_path)}
+
+    def run(code: str) -> str:
+        return subprocess.run(
+            [sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True
+        ).stdout
+
+    for count in (2, 3):
+        run(
+            'from ncviewjs_backend.metrics import DB_QUERIES\n'
+            f"DB_QUERIES.labels('SELECT').inc({count})"
+        )
+    value = run(
+        'from ncviewjs_backend.metrics import metrics_registry\n'
+        "print(metrics_registry().get_sample_value('ncviewjs_db_queries_total', "
+        "{'operation': 'SELECT'}))"
+    )
+    assert float(value) == 5
+
+
+@pytest.mark.parametrize(
+    'statement, operation',
+    [
+        ('SELECT 1', 'SELECT'),
+        ('  with ids AS (SELECT 1) SELECT * FROM ids', 'WITH'),
+        ('WITH\nids AS (SELECT 1) SELECT * FROM ids', 'WITH'),
+        ('INSERT INTO dataset VALUES (1)', 'INSERT'),
+        ('SELECTED', 'OTHER'),
+        ('', 'OTHER'),
+    ],
+)
+def test_operation(statement, operation):
+    assert _operation(statement) == operation
+
+
+def test_failed_statements_are_not_timed(session):
+    instrument_database()
+    connection = session.connection()
+    with pytest.raises(sqlalchemy.exc.ProgrammingError):
+        connection.execute(sqlalchemy.text('SELECT * FROM missing_table'))
+    assert not connection.info.get('query_start_time')
+    session.rollback()
@@ -0,0 +1,101 @@
+import json
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import select
+
+from ncviewjs_backend import profiling
+from ncviewjs_backend.config import get_settings
+from ncviewjs_backend.jobs import execute_run
+from ncviewjs_backend.main import create_application
+from ncviewjs_backend.models.dataset import Dataset, RechunkRun
+from ncviewjs_backend.profiling import Profiler
+
+from .conftest import get_settings_override, make_settings
+
+
+def busy(n: int = 200_000) -> list[str]:
+    return [str(i) for i in range(n)]
+
+
+@pytest.fixture(scope="module")
+def profiling_app():
+    app = create_application(make_settings(profiling_enabled=True))
+    app.dependency_overrides[get_settings] = get_settings_override
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def test_profiler_summary():
+    profiler = Profiler(interval=0.001)
+    with profiler:
+        for _ in range(3):
+            kept = busy(50_000)
+
+    summary = profiler.summary
+    assert summary['samples'] > 0
+    assert any(__file__ in frame['frame'] for frame in summary['top_frames'])
+    assert summary['peak_memory_bytes'] >= len(kept) * 40
+    assert summary['allocations'][0]['size_bytes'] > 0
+    assert not any(profiling.__file__ in site['site'] for site in summary['allocations'])
+
+
+def test_one_profile_at_a_time():
+    with Profiler() as outer:
+        with Profiler() as inner:
+            busy(1000)
+        assert not inner.active
+    assert inner.summary is None
+    assert outer.summary is not None
+
+
+def test_request_profiling(profiling_app):
+    response = profiling_app.get('/health/ping')
+    assert 'X-Profile-Id' not in response.headers
+
+    response = profiling_app.get('/health/ping', headers={'X-Profile': '1'})
+    profile = profiling_app.get(f"/health/profiles/{response.headers['X-Profile-Id']}")
+    assert profile.status_code == 200
+    assert {'top_frames', 'peak_memory_bytes', 'allocations'}.issubset(profile.json())
+    assert profiling_app.get('/health/profiles/unknown').status_code == 404
+
+
+def test_request_profiling_is_opt_in(test_app_with_db):
+    response = test_app_with_db.get('/health/ping', headers={'X-Profile': '1'})
+    assert 'X-Profile-Id' not in response.headers
+
+    url = f's3://carbonplan-scratch/{uuid.uuid4().hex}.zarr'
+    response = test_app_with_db.post(
+        '/datasets/', content=json.dumps({'url': url, 'profile': True})
+    )
+    assert response.status_code == 403
+
+
+def test_registration_flags_the_run(profiling_app, session):
+    url = f's3://carbonplan-scratch/{uuid.uuid4().hex}.zarr'
+    response = profiling_app.post('/datasets/', content=json.dumps({'url': url, 'profile': True}))
+    assert response.status_code == 201
+    run = session.exec(
+        select(RechunkRun).where(RechunkRun.dataset_id == response.json()['id'])
+    ).one()
+    assert run.profiling
+
+
+def test_profiled_run(profiling_app, session, zarr_store):
+    dataset = Dataset(
+        url=zarr_store, md5_id=uuid.uuid4().hex, protocol='file', key='air.zarr', bucket='tmp'
+    )
+    session.add(dataset)
+    session.commit()
+    run = RechunkRun(dataset_id=dataset.id, status='in_progress', profiling=True)
+    session.add(run)
+    session.commit()
+    assert profiling_app.get(f'/runs/{run.id}/profile').status_code == 404
+
+    execute_run(session, run=run, settings=make_settings())
+
+    response = profiling_app.get(f'/runs/{run.id}/profile')
+    assert response.status_code == 200
+    assert response.json()['samples'] >= 0
+    assert response.json()['peak_memory_bytes'] > 0
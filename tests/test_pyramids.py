@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+import zarr
+
+from ncviewjs_backend.models.dataset import RechunkingRecord
+from ncviewjs_backend.pyramids import build_pyramid, coarsen, coarsened_dims
+from ncviewjs_backend.rechunking import StreamingRechunker
+
+CF_AXES = {'air': {'X': 'lon', 'Y': 'lat', 'T': 'time'}}
+
+
+@pytest.fixture
+def source(tmp_path):
+    group = zarr.open_group(str(tmp_path / 'source.zarr'), mode='w')
+    group.attrs['title'] = 'test'
+    data = np.arange(4 * 6 * 5, dtype='f4').reshape(4, 6, 5)
+    air = group.create_dataset('air', data=data, chunks=(2, 4, 4), fill_value=-9999.0)
+    air.attrs['_ARRAY_DIMENSIONS'] = ['time', 'lat', 'lon']
+    lat = group.create_dataset('lat', data=np.arange(6, dtype='f8'), chunks=(6,), fill_value=np.nan)
+    lat.attrs['_ARRAY_DIMENSIONS'] = ['lat']
+    time = group.create_dataset('time', data=np.arange(4, dtype='i8'), chunks=(2,))
+    time.attrs['_ARRAY_DIMENSIONS'] = ['time']
+    return group
+
+
+def test_coarsened_dims():
+    assert coarsened_dims({**CF_AXES, 'sst': {'X': 'x', 'T': 'time'}}) == {'lon', 'lat', 'x'}
+
+
+def test_coarsen_mean():
+    data = np.array([[1, 3, 5], [5, 7, 9]], dtype='f4')
+    np.testing.assert_array_equal(
+        coarsen(data, axes=(0, 1), method='mean'), np.array([[4, 7]], dtype='f4')
+    )
+    # missing values are left out of the mean, and missing when all four cells are
+    data = np.array([[1, -1, -1, -1], [3, -1, -1, -1]], dtype='f4')
+    result = coarsen(data, axes=(0, 1), method='mean', fill_value=-1)
+    np.testing.assert_array_equal(result, np.array([[2, -1]], dtype='f4'))
+    assert result.dtype == np.float32
+
+
+def test_coarsen_nearest():
+    data = np.arange(15).reshape(3, 5)
+    np.testing.assert_array_equal(coarsen(data, axes=(1,), method='nearest'), data[:, ::2])
+    # integers are never averaged
+    np.testing.assert_array_equal(coarsen(data, axes=(0, 1), method='mean'), data[::2, ::2])
+
+
+@pytest.mark.parametrize('executor', ['threads', 'processes'])
+def test_build_pyramid(source, executor):
+    rechunker = StreamingRechunker(executor=executor, workers=2, max_mem='1MB')
+    levels = build_pyramid(source, cf_axes=CF_AXES, levels=2, rechunker=rechunker)
+
+    assert [(level.level, level.path, level.factor) for level in levels] == [
+        (1, 'pyramid/1', 2),
+        (2, 'pyramid/2', 4),
+    ]
+    first, second = source['pyramid/1'], source['pyramid/2']
+    assert first.attrs['title'] == 'test'
+    assert first['air'].shape == (4, 3, 3)
+    assert second['air'].shape == (4, 2, 2)
+    assert second['air'].chunks == (2, 2, 2)
+    assert first['air'].attrs['_ARRAY_DIMENSIONS'] == ['time', 'lat', 'lon']
+    np.testing.assert_array_equal(first['time'][:], source['time'][:])
+    np.testing.assert_array_equal(first['lat'][:], [0.5, 2.5, 4.5])
+    expected = coarsen(source['air'][:], axes=(1, 2), method='mean')
+    np.testing.assert_array_equal(first['air'][:], expected)
+    np.testing.assert_array_equal(second['air'][:], coarsen(expected, axes=(1, 2), method='mean'))
+
+    multiscales = source['pyramid'].attrs['multiscales']
+    assert multiscales[0]['datasets'] == [
+        {'path': '1', 'level': 1, 'factor': 2},
+        {'path': '2', 'level': 2, 'factor': 4},
+    ]
+    assert multiscales[0]['metadata'] == {'method': 'mean', 'dims': ['lat', 'lon']}
+
+
+def test_build_pyramid_rejects_large_chunks(source):
+    with pytest.raises(ValueError, match='does not fit'):
+        build_pyramid(
+            source,
+            cf_axes=CF_AXES,
+            levels=1,
+            rechunker=StreamingRechunker(workers=1, max_mem=100),
+        )
+
+
+def test_append_to_pyramid(source):
+    rechunker = StreamingRechunker(workers=2, max_mem='1MB')
+    build_pyramid(source, cf_axes=CF_AXES, levels=2, method='nearest', rechunker=rechunker)
+    source['time'].append(np.arange(4, 7, dtype='i8'))
+    source['air'].append(np.full((3, 6, 5), 1, dtype='f4'))
+
+    build_pyramid(
+        source,
+        cf_axes=CF_AXES,
+        levels=2,
+        method='nearest',
+        rechunker=rechunker,
+        time_dim='time',
+        start=4,
+    )
+
+    second = source['pyramid/2']
+    assert second['air'].shape == (7, 2, 2)
+    np.testing.assert_array_equal(second['air'][:], source['air'][:, ::4, ::4])
+    np.testing.assert_array_equal(second['time'][:], np.arange(7))
+
+
+def test_level_records():
+    record = RechunkingRecord(
+        path='s3://bucket/store/pyramid/1', use_case='ncview-pyramid', level=1
+    )
+    assert record.model_dump() == {
+        'path': 's3://bucket/store/pyramid/1',
+        'use_case': 'ncview-pyramid',
+        'level': 1,
+    }
@@ -0,0 +1,188 @@
+import numpy as np
+import pytest
+import zarr
+
+from ncviewjs_backend.rechunking import StreamingRechunker, blocks, plan_variable, time_range
+
+
+@pytest.fixture
+def source(tmp_path):
+    group = zarr.open_group(str(tmp_path / 'source.zarr'), mode='w')
+    group.attrs['title'] = 'test'
+    data = np.arange(10 * 30 * 40, dtype='f4').reshape(10, 30, 40)
+    air = group.create_dataset('air', data=data, chunks=(3, 30, 40))
+    air.attrs['_ARRAY_DIMENSIONS'] = ['time', 'lat', 'lon']
+    lat = group.create_dataset('lat', data=np.arange(30, dtype='f8'), chunks=(30,))
+    lat.attrs['_ARRAY_DIMENSIONS'] = ['lat']
+    time = group.create_dataset('time', data=np.arange(10, dtype='i8'), chunks=(3,))
+    time.attrs['_ARRAY_DIMENSIONS'] = ['time']
+    return group
+
+
+def append_time_steps(group: zarr.Group, count: int) -> None:
+    steps = group['time'].shape[0]
+    group['time'].append(np.arange(steps, steps + count, dtype='i8'))
+    group['air'].append(np.full((count, 30, 40), -1, dtype='f4'))
+
+
+class CountingStore(dict):
+    """In-memory store recording the keys written"""
+
+    def __init__(self):
+        super().__init__()
+        self.written = []
+
+    def __setitem__(self, key, value):
+        self.written.append(key)
+        super().__setitem__(key, value)
+
+
+def test_blocks_cover_the_array():
+    regions = list(blocks((5, 4), (2, 4)))
+    assert regions == [
+        (slice(0, 2), slice(0, 4)),
+        (slice(2, 4), slice(0, 4)),
+        (slice(4, 5), slice(0, 4)),
+    ]
+    assert list(blocks((), ())) == [()]
+
+
+def test_plan_direct_when_chunks_align():
+    plan = plan_variable(
+        name='air',
+        shape=(100, 180, 360),
+        itemsize=4,
+        source_chunks=(10, 180, 360),
+        target_chunks=(5, 64, 64),
+        max_mem=10 * 180 * 360 * 4,
+    )
+    assert plan.direct
+    # a single source chunk along time, whole target tiles along lat and lon
+    assert plan.block == (10, 180, 360)
+
+
+def test_plan_through_temp_store_when_chunks_do_not_align():
+    plan = plan_variable(
+        name='air',
+        shape=(100, 180, 360),
+        itemsize=4,
+        source_chunks=(3, 180, 360),
+        target_chunks=(4, 64, 64),
+        max_mem=3 * 180 * 360 * 4,
+    )
+    assert not plan.direct
+    assert plan.intermediate_chunks == (1, 4, 8)
+
+    with pytest.raises(ValueError, match='does not fit'):
+        plan_variable(
+            name='air',
+            shape=(100, 180, 360),
+            itemsize=4,
+            source_chunks=(3, 180, 360),
+            target_chunks=(4, 64, 64),
+            max_mem=1000,
+        )
+
+
+@pytest.mark.parametrize(
+    'max_mem, direct', [(10 * 30 * 40 * 4, True), (3 * 30 * 40 * 4, False)], ids=['direct', 'temp']
+)
+@pytest.mark.parametrize('executor', ['threads', 'processes'])
+def test_rechunk(source, tmp_path, max_mem, direct, executor):
+    reported = []
+    rechunker = StreamingRechunker(
+        executor=executor, workers=2, max_mem=max_mem, progress=reported.append
+    )
+    target_store = str(tmp_path / 'target.zarr')
+    temp_store = zarr.DirectoryStore(str(tmp_path / 'temp.zarr'))
+    plans = rechunker.rechunk(
+        source,
+        {'air': {'time': 2, 'lat': 16, 'lon': 16}},
+        target_store,
+        temp_store=temp_store,
+    )
+
+    assert {plan.name: plan.direct for plan in plans} == {'air': direct, 'lat': True, 'time': True}
+    target = zarr.open_group(target_store, mode='r')
+    assert target.attrs['title'] == 'test'
+    assert target['air'].chunks == (2, 16, 16)
+    assert target['air'].attrs['_ARRAY_DIMENSIONS'] == ['time', 'lat', 'lon']
+    np.testing.assert_array_equal(target['air'][:], source['air'][:])
+    np.testing.assert_array_equal(target['lat'][:], source['lat'][:])
+    # the intermediate arrays are removed once copied
+    assert not list(zarr.open_group(temp_store).arrays())
+
+    assert reported == sorted(reported)
+    assert reported[-1] == 1.0
+
+
+def test_blocks_from_origin():
+    # the block holding the origin is copied whole
+    assert list(blocks((10, 4), (4, 4), origin=(5, 0))) == [
+        (slice(4, 8), slice(0, 4)),
+        (slice(8, 10), slice(0, 4)),
+    ]
+
+
+@pytest.mark.parametrize('max_mem', [10 * 30 * 40 * 4, 3 * 30 * 40 * 4], ids=['direct', 'temp'])
+def test_append_new_time_steps(source, max_mem):
+    rechunker = StreamingRechunker(workers=2, max_mem=max_mem)
+    target_store = CountingStore()
+    chunks = {'air': {'time': 2, 'lat': 16, 'lon': 16}, 'time': (2,)}
+    rechunker.rechunk(source, chunks, target_store)
+    assert time_range(zarr.open_group(target_store), 'time') == (10, 9)
+
+    append_time_steps(source, 5)
+    target_store.written.clear()
+    plans = rechunker.append(source, target_store, time_dim='time', start=10)
+
+    assert {plan.name for plan in plans} == {'air', 'time'}
+    target = zarr.open_group(target_store, mode='r')
+    assert target['air'].chunks == (2, 16, 16)
+    np.testing.assert_array_equal(target['air'][:], source['air'][:])
+    np.testing.assert_array_equal(target['time'][:], source['time'][:])
+    assert time_range(target, 'time') == (15, 14)
+    # only the chunks of the block holding time step 10 and of the new time steps are written
+    written = {
+        key.split('/')[1].split('.')[0]
+        for key in target_store.written
+        if key.startswith('air/') and not key.endswith(('.zarray', '.zattrs'))
+    }
+    assert min(map(int, written)) >= 3
+    assert 'lat/0' not in target_store.written
+
+
+def test_append_through_temp_store():
+    # the target time chunks are larger than the source ones and do not fit in max_mem
+    source = zarr.group()
+    time = source.create_dataset('time', data=np.arange(1, 6, dtype='f8'), chunks=(1,))
+    time.attrs['_ARRAY_DIMENSIONS'] = ['time']
+    air = source.create_dataset('air', data=np.ones((5, 8, 8), dtype='f4'), chunks=(1, 8, 8))
+    air.attrs['_ARRAY_DIMENSIONS'] = ['time', 'lat', 'lon']
+    rechunker = StreamingRechunker(workers=2, max_mem=300)
+    target_store = {}
+    plans = rechunker.rechunk(source, {'air': (2, 4, 4), 'time': (2,)}, target_store)
+    assert not {plan.name: plan.direct for plan in plans}['air']
+
+    time.append(np.arange(6, 9, dtype='f8'))
+    air.append(np.full((3, 8, 8), 2, dtype='f4'))
+    plans = rechunker.append(source, target_store, time_dim='time', start=5)
+
+    assert not {plan.name: plan.direct for plan in plans}['air']
+    target = zarr.open_group(target_store, mode='r')
+    np.testing.assert_array_equal(target['time'][:], np.arange(1, 9))
+    np.testing.assert_array_equal(target['air'][:], source['air'][:])
+
+
+def test_append_rejects_other_changes(source):
+    rechunker = StreamingRechunker(workers=1, max_mem='10MB')
+    target_store = {}
+    rechunker.rechunk(source, {'air': {'time': 2}}, target_store)
+
+    # the rechunked store holds 10 time steps, not 8
+    with pytest.raises(ValueError, match='air changed'):
+        rechunker.append(source, target_store, time_dim='time', start=8)
+
+    source['lat'].append(np.arange(1, dtype='f8'))
+    with pytest.raises(ValueError, match='lat changed'):
+        rechunker.append(source, target_store, time_dim='time', start=10)
@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+import uuid
+
+import pytest
+from sqlalchemy import text
+from sqlmodel import Session
+
+from ncviewjs_backend.database import get_engine
+from ncviewjs_backend.models.dataset import Outcome, RechunkRun, Status
+
+
+@pytest.fixture
+def run_id(test_app_with_db):
+    url = f"s3://events-{uuid.uuid4().hex}/store.zarr"
+    dataset = test_app_with_db.post('/datasets/', content=json.dumps({"url": url})).json()
+    response = test_app_with_db.get('/runs/', params={'dataset_id': dataset['id']})
+    return response.json()[0]['id']
+
+
+def update_run_later(run_id: int, *statuses: Status, delay: float = 0.5) -> threading.Thread:
+    """Move the run through the statuses from another connection, like the worker does"""
+
+    def update():
+        for status in statuses:
+            time.sleep(delay)
+            with Session(get_engine()) as session:
+                run = session.get(RechunkRun, run_id)
+                run.status = status
+                if status == Status.completed:
+                    run.outcome = Outcome.success
+                session.add(run)
+                session.commit()
+
+    thread = threading.Thread(target=update)
+    thread.start()
+    return thread
+
+
+def test_events_stream(test_app_with_db, run_id):
+    thread = update_run_later(run_id, Status.in_progress, Status.completed)
+    events = []
+    with test_app_with_db.stream('GET', f'/runs/{run_id}/events') as response:
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/event-stream')
+        for line in response.iter_lines():
+            if line.startswith('data: '):
+                events.append(json.loads(line.removeprefix('data: ')))
+    thread.join()
+
+    assert [event['status'] for event in events] == ['queued', 'in_progress', 'completed']
+    assert events[-1]['outcome'] == 'success'
+    assert all(event['id'] == run_id for event in events)
+
+
+def test_events_not_found(test_app_with_db):
+    response = test_app_with_db.get('/runs/3894994/events')
+    assert response.status_code == 404
+
+
+def test_long_poll(test_app_with_db, run_id):
+    # the client does not know the status yet
+    response = test_app_with_db.get(f'/runs/{run_id}/wait')
+    assert response.json()['status'] == 'queued'
+
+    start = time.perf_counter()
+    response = test_app_with_db.get(
+        f'/runs/{run_id}/wait', params={'status': 'queued', 'timeout': 0.5}
+    )
+    assert response.json()['status'] == 'queued'
+    assert time.perf_counter() - start >= 0.5
+
+    thread = update_run_later(run_id, Status.in_progress)
+    start = time.perf_counter()
+    response = test_app_with_db.get(
+        f'/runs/{run_id}/wait', params={'status': 'queued', 'timeout': 30}
+    )
+    thread.join()
+    assert response.json()['status'] == 'in_progress'
+    assert time.perf_counter() - start < 10
+
+    stats = test_app_with_db.get('/health/').json()['run_events']
+    assert stats['listening']
+    assert stats['subscribers'] == 0
+
+
+def test_listener_reconnects(test_app_with_db, run_id):
+    from ncviewjs_backend.run_events import get_run_event_broadcaster
+
+    def wait_for_subscriber():
+        deadline = time.monotonic() + 10
+        while test_app_with_db.get('/health/').json()['run_events']['subscribers'] == 0:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+    responses = []
+    poll = threading.Thread(
+        target=lambda: responses.append(
+            test_app_with_db.get(f'/runs/{run_id}/wait', params={'status': 'queued', 'timeout': 30})
+        )
+    )
+    poll.start()
+    wait_for_subscriber()
+    broadcaster = get_run_event_broadcaster()
+    reconnections = broadcaster.reconnections
+    pid = broadcaster._connection.get_server_pid()
+    with Session(get_engine()) as session:
+        session.exec(text('SELECT pg_terminate_backend(:pid)').bindparams(pid=pid))
+
+    deadline = time.monotonic() + 10
+    while broadcaster.reconnections == reconnections or not broadcaster._connection:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    stats = test_app_with_db.get('/health/').json()['run_events']
+    assert stats['listening']
+
+    # the waiting client is not woken up by the unchanged status once the connection is back
+    poll.join(timeout=1)
+    assert poll.is_alive()
+
+    # and the changes are notified again
+    update_run_later(run_id, Status.in_progress).join()
+    poll.join(timeout=10)
+    assert not poll.is_alive()
+    assert responses[0].json()['status'] == 'in_progress'
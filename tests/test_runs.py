@@ -0,0 +1,147 @@
+import json
+
+from sqlmodel import select
+
+from ncviewjs_backend.models.dataset import RechunkRun
+
+url = "gs://carbonplan-maps/ncview/demo/single_timestep/air_temperature.zarr"
+
+
+def test_get_run_not_found(test_app_with_db):
+    response = test_app_with_db.get('/runs/3894994')
+    assert response.status_code == 404
+    assert "not found" in response.json()["detail"]
+
+
+def test_update_rechunk_run(test_app_with_db):
+    response = test_app_with_db.post('/datasets/', content=json.dumps({"url": url, "force": True}))
+    dataset = response.json()
+
+    response = test_app_with_db.get(
+        '/runs/', params={'dataset_id': dataset['id'], 'order': 'desc', 'limit': 1}
+    )
+    assert response.status_code == 200
+    run = response.json()[0]
+    assert run['dataset']['id'] == dataset['id']
+
+    payload = {
+        'start_time': '2023-01-01T00:00:00',
+        'end_time': '2023-01-01T01:00:00',
+        'rechunked_dataset': 's3://carbonplan-scratch/production/foo.zarr',
+        'error_message': None,
+        'error_message_traceback': None,
+        'status': 'completed',
+        'outcome': 'success',
+    }
+    response = test_app_with_db.patch(f"/runs/{run['id']}", content=json.dumps(payload))
+    assert response.status_code == 200
+    data = response.json()
+    assert data['status'] == 'completed'
+    assert data['outcome'] == 'success'
+    assert data['rechunked_dataset'].startswith('https://')
+    assert data['dataset']['id'] == dataset['id']
+
+    response = test_app_with_db.get(f"/runs/{run['id']}")
+    assert response.status_code == 200
+    assert response.json()['outcome'] == 'success'
+
+
+def test_list_rechunk_runs_filters_and_projection(test_app_with_db):
+    response = test_app_with_db.post('/datasets/', content=json.dumps({"url": url, "force": True}))
+    dataset = response.json()
+
+    response = test_app_with_db.get(
+        '/runs/',
+        params={'dataset_id': dataset['id'], 'status': 'queued', 'fields': 'status,dataset_id'},
+    )
+    assert response.status_code == 200
+    runs = response.json()
+    assert runs
+    assert all(set(run) == {'id', 'status', 'dataset_id'} for run in runs)
+    assert all(run['dataset_id'] == dataset['id'] for run in runs)
+
+    response = test_app_with_db.get('/runs/', params={'fields': 'dataset'})
+    assert response.status_code == 400
+
+
+def test_list_rechunk_runs_query_count(test_app_with_db, count_queries):
+    for _ in range(3):
+        test_app_with_db.post('/datasets/', content=json.dumps({"url": url, "force": True}))
+
+    with count_queries() as statements:
+        response = test_app_with_db.get('/runs/', params={'limit': 3, 'order': 'desc'})
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+    # the page of runs and their datasets, regardless of the page size
+    assert len(statements) == 2
+
+    with count_queries() as statements:
+        response = test_app_with_db.get(f"/runs/{response.json()[0]['id']}")
+    assert response.status_code == 200
+    # the run and its dataset are loaded with a join
+    assert len(statements) == 1
+
+
+def test_get_rechunk_run_conditional(test_app_with_db):
+    response = test_app_with_db.post('/datasets/', content=json.dumps({"url": url, "force": True}))
+    response = test_app_with_db.get(
+        '/runs/', params={'dataset_id': response.json()['id'], 'order': 'desc', 'limit': 1}
+    )
+    run = response.json()[0]
+
+    response = test_app_with_db.get(f"/runs/{run['id']}")
+    assert response.headers['Cache-Control'] == 'no-cache'
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+
+    response = test_app_with_db.get(f"/runs/{run['id']}", headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    response = test_app_with_db.get(
+        f"/runs/{run['id']}", headers={'If-Modified-Since': last_modified}
+    )
+    assert response.status_code == 304
+
+    payload = {
+        'start_time': None,
+        'end_time': None,
+        'rechunked_dataset': None,
+        'error_message': None,
+        'error_message_traceback': None,
+        'status': 'completed',
+        'outcome': 'success',
+    }
+    test_app_with_db.patch(f"/runs/{run['id']}", content=json.dumps(payload))
+    response = test_app_with_db.get(f"/runs/{run['id']}", headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.headers['Cache-Control'].startswith('public, max-age=')
+
+
+def test_update_rechunk_run_progress(test_app_with_db, validate_dataset, zarr_store, session):
+    dataset = validate_dataset(zarr_store)
+    run = session.exec(select(RechunkRun).where(RechunkRun.dataset_id == dataset.id)).one()
+
+    response = test_app_with_db.patch(f'/runs/{run.id}', content=json.dumps({'progress': 42.5}))
+    assert response.status_code == 200
+    data = response.json()
+    assert data['progress'] == 42.5
+    # the fields left out of the payload are unchanged
+    assert data['status'] == 'completed'
+    assert data['outcome'] == 'success'
+
+    response = test_app_with_db.patch(f'/runs/{run.id}', content=json.dumps({'progress': 101}))
+    assert response.status_code == 422
+
+
+def test_update_rechunk_run_codec_benchmark(
+    test_app_with_db, validate_dataset, zarr_store, session
+):
+    dataset = validate_dataset(zarr_store)
+    run = session.exec(select(RechunkRun).where(RechunkRun.dataset_id == dataset.id)).one()
+    benchmark = {'air': {'selected': 'zlib', 'results': [{'codec': 'zlib', 'ratio': 2.5}]}}
+
+    response = test_app_with_db.patch(
+        f'/runs/{run.id}', content=json.dumps({'codec_benchmark': benchmark})
+    )
+    assert response.status_code == 200
+    assert test_app_with_db.get(f'/runs/{run.id}').json()['codec_benchmark'] == benchmark
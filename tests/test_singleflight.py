@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from ncviewjs_backend.singleflight import SingleFlight
+
+
+def run_concurrently(flights: SingleFlight, key, func, *, callers: int) -> list:
+    results = [None] * callers
+
+    def call(index):
+        try:
+            results[index] = flights.do(key, func)
+        except Exception as exc:
+            results[index] = exc
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def func():
+        calls.append(1)
+        release.wait(5)
+        return object()
+
+    threads, results = run_concurrently(flights, 'key', func, callers=8)
+    while flights.stats()['coalesced'] < 7:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flights.stats() == {'in_flight': 0, 'executions': 1, 'coalesced': 7}
+
+    # the next call runs again
+    assert flights.do('key', lambda: 'again') == 'again'
+
+
+def test_errors_are_shared():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def func():
+        release.wait(5)
+        raise ValueError('boom')
+
+    threads, results = run_concurrently(flights, 'key', func, callers=4)
+    while flights.stats()['coalesced'] < 3:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights.stats()['in_flight'] == 0
+    with pytest.raises(KeyError):
+        flights.do('key', lambda: {}['missing'])